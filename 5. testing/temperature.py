@@ -1,9 +1,10 @@
 # temperature testing - 19th May, 2025
 
+import os
 import serial
 import time
 
-ESP32_PORT = "/dev/ttyS0"  
+ESP32_PORT = os.environ.get("ESP32_PORT", "/dev/ttyS0")  # esp32_emulator pty for testing
 BAUD_RATE = 9600
 
 
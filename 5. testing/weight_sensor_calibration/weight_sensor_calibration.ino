@@ -4,6 +4,8 @@ calibration factor calc:
 1. place a known weight, eg: 1kg
 2. calibration_factor = raw_reading / known_weight
 3. test and adjust
+4. store it on the booth: send "cal <factor>" over the Pi link (answers
+   "CAL:<offset>,<factor>"), then "tare" with the chamber empty
 
 */ 
 
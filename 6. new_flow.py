@@ -1,15 +1,33 @@
+import functools
 import time
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime
 from PIL import Image, ImageTk
-import threading
-import serial
+
+from booth_engine import BoothEngine, TkBridge
+from booth_hal import HalIO, PigpioBooth, SimulatedBooth
+from esp32_link import SerialBus
+from scale_calibration import ScaleCalibration, ZeroTracker
+from sensor_service import SensorService
+from session_profiles import SessionRunner, build_session, session_params
+from temp_controller import CONTROL_PERIOD
+from temperature_sources import SerialTemperature, SpiTemperature, TemperatureSource
+from weight_pipeline import WeightPipeline
 
 ENABLE_HARDWARE = True  # Set to True when running on Raspberry Pi with full setup
+# SPI channel (CE0 = 0) of a MAX6675 wired straight to the Pi, or None if the
+# thermocouple is only on the ESP32. With it set, the Pi reads SPI and falls
+# back to the ESP32's reading whenever SPI is unhealthy.
+TEMP_SPI_CHANNEL = None
+# (DOUT, PD_SCK) GPIOs of an HX711 wired straight to the Pi, or None to use
+# the ESP32's load cell. The Pi driver clocks it from pigpio callbacks and
+# publishes every conversion, without the serial hop.
+WEIGHT_HX711_PINS = None
 
 if ENABLE_HARDWARE:
     import pigpio
+    from hx711_pigpio import SCALE_RATIO as HX711_SCALE_RATIO, PigpioHX711
     import RPi.GPIO as GPIO
     import atexit
     from adafruit_servokit import ServoKit
@@ -36,7 +54,45 @@ class ThariBakhoorApp(tk.Tk):
             GPIO.setup(self.fan_gpio_pin, GPIO.OUT)
             self.pi.set_mode(self.fan_gpio_pin, pigpio.OUTPUT)
             self.pi.write(self.fan_gpio_pin, 0)
-            self.serial = serial.Serial("/dev/ttyS0", 9600, timeout=2)
+            # All ESP32 traffic goes through one SerialBus that owns the serial port
+            # (found by probing, then negotiated up to 921600 baud) and
+            # matches replies to requests. Weight and temperature are pushed by the
+            # ESP32 every 200 ms and cached by the sensor service. Binary CRC-checked
+            # frames are used when the firmware supports them (falls back to text,
+            # then to polling, on old firmware)
+            self.esp32_bus = SerialBus()
+            self.sensors = SensorService(self.esp32_bus, sample_hz=2.0, stream_ms=200, binary=True)
+            self.sensors.start()
+            temp_sources = [SerialTemperature(self.sensors)]
+            self.temp_spi = None
+            if TEMP_SPI_CHANNEL is not None:
+                self.temp_spi = SpiTemperature(self.pi, TEMP_SPI_CHANNEL)
+                self.temp_spi.start()
+                temp_sources.insert(0, self.temp_spi)
+            self.temperature_source = TemperatureSource(temp_sources)
+            # This booth's stored load cell calibration (learned zero drift,
+            # Pi HX711 zero and factor)
+            self.scale_calibration = ScaleCalibration()
+            self.load_cell = None
+            if WEIGHT_HX711_PINS is not None:
+                self.load_cell = PigpioHX711(
+                    self.pi, *WEIGHT_HX711_PINS,
+                    offset=self.scale_calibration.hx711_offset,
+                    scale_ratio=self.scale_calibration.hx711_scale_ratio or HX711_SCALE_RATIO,
+                    on_zero=self._store_hx711_zero)
+                self.load_cell.start()
+            raw_weight = self.load_cell.weight if self.load_cell else self.sensors.weight
+            # Every weight sample goes through the filter/occupancy pipeline as
+            # it arrives; the session gates react to its events. Zero drift is
+            # learned while the chamber is empty and locked and taken off every
+            # reading before the pipeline sees it
+            self.occupancy = WeightPipeline()
+            self.zero_tracker = ZeroTracker(raw_weight, self.scale_calibration, self._zero_tracking_allowed)
+            weight_source = self.zero_tracker.weight
+            self.occupancy.attach(weight_source)
+            self.hal = PigpioBooth(self.pi, self.sensors, self.heater_ssr_pin, self.door_ssr_pin,
+                                   self.fan_gpio_pin, temperature_source=self.temperature_source,
+                                   weight_source=weight_source)
             atexit.register(self.cleanup_gpio)
             # Lock the door by default for safety at startup
             self.pi.write(self.door_ssr_pin, 1)
@@ -44,6 +100,11 @@ class ThariBakhoorApp(tk.Tk):
             self.pi = None
             self.kit = None
             self.hx = None
+            self.sensors = None
+            # The session runner filters the simulated weight itself
+            self.occupancy = None
+            # GUI-only runs get a simulated chamber in real time
+            self.hal = SimulatedBooth(verbose=True)
             self.heater_ssr_pin = None
             self.door_ssr_pin = None
             self.fan_channels = []
@@ -67,6 +128,12 @@ class ThariBakhoorApp(tk.Tk):
         self.running = True
         self.person_running = False
         self.targettemp = [40, 120]
+        # Sessions run as cancellable asyncio tasks on the engine thread; anything
+        # they need done on the GUI is handed back through the Tk bridge
+        self.ui_bridge = TkBridge(self)
+        self.ui_bridge.start()
+        self.engine = BoothEngine(ui_post=self.ui_bridge.post)
+        self.engine.start()
         # Splash screen
         self.splash_screen()
 
@@ -363,22 +430,10 @@ class ThariBakhoorApp(tk.Tk):
 
     def set_heat_params_from_level(self, level):
         # Map heat level to x_seconds, y_seconds, heat_duration (person mode)
-        if level == "Low":
-            self.x_seconds = 105
-            self.y_seconds = 10
-            self.heat_duration = 120
-        elif level == "Medium":
-            self.x_seconds = 110
-            self.y_seconds = 15
-            self.heat_duration = 130
-        elif level == "High":
-            self.x_seconds = 115
-            self.y_seconds = 20
-            self.heat_duration = 140
-        else:
-            self.x_seconds = 110
-            self.y_seconds = 15
-            self.heat_duration = 130
+        params = session_params("person", level, getattr(self, "selected_speed_value", 2))
+        self.x_seconds = params["x"]
+        self.y_seconds = params["y"]
+        self.heat_duration = params["heat_duration"]
 
     def select_speed_level(self, idx):
         self.selected_speed_value = idx + 1
@@ -396,20 +451,10 @@ class ThariBakhoorApp(tk.Tk):
             btn.event_generate('<Leave>')
 
     def set_speed_param_from_value(self, value):
-        # value: 1, 2, 3
-        # Map to 3, 4, 5 minutes for person mode, and set w accordingly
-        if value == 1:
-            self.person_speed_duration = 180
-            self.w = 25
-        elif value == 2:
-            self.person_speed_duration = 240
-            self.w = 33
-        elif value == 3:
-            self.person_speed_duration = 300
-            self.w = 41
-        else:
-            self.person_speed_duration = 180
-            self.w = 25
+        # value: 1, 2, 3 -> 3, 4, 5 minutes, with the matching heater OFF time w
+        params = session_params("person", getattr(self, "selected_heat_level", "Medium"), value)
+        self.person_speed_duration = params["z"]
+        self.w = params["w"]
         # For backward compatibility, also set speed_duration
         self.speed_duration = self.person_speed_duration
 
@@ -592,22 +637,10 @@ class ThariBakhoorApp(tk.Tk):
 
     def set_clothes_heat_params_from_level(self, level):
         # Map heat level to x_seconds, y_seconds, heat_duration
-        if level == "Low":
-            self.clothes_x_seconds = 110
-            self.clothes_y_seconds = 25
-            self.clothes_heat_duration = 120
-        elif level == "Medium":
-            self.clothes_x_seconds = 120
-            self.clothes_y_seconds = 30
-            self.clothes_heat_duration = 130
-        elif level == "High":
-            self.clothes_x_seconds = 130
-            self.clothes_y_seconds = 35
-            self.clothes_heat_duration = 140
-        else:
-            self.clothes_x_seconds = 120
-            self.clothes_y_seconds = 30
-            self.clothes_heat_duration = 130
+        params = session_params("clothes", level, getattr(self, "selected_clothes_speed_value", 2))
+        self.clothes_x_seconds = params["x"]
+        self.clothes_y_seconds = params["y"]
+        self.clothes_heat_duration = params["heat_duration"]
 
     def select_clothes_speed_level(self, idx):
         self.selected_clothes_speed_value = idx + 1
@@ -636,15 +669,9 @@ class ThariBakhoorApp(tk.Tk):
             btn.event_generate('<ButtonRelease-1>')
 
     def set_clothes_speed_param_from_value(self, value):
-        # value: 1, 2, 3
-        if value == 1:
-            self.clothes_speed_duration = 150
-        elif value == 2:
-            self.clothes_speed_duration = 300
-        elif value == 3:
-            self.clothes_speed_duration = 480
-        else:
-            self.clothes_speed_duration = 300
+        # value: 1, 2, 3 -> 3, 4, 5 minutes
+        params = session_params("clothes", getattr(self, "selected_clothes_heat_level", "Medium"), value)
+        self.clothes_speed_duration = params["z"]
 
     def update_clothes_time_record_label(self):
         total_seconds = getattr(self, "clothes_heat_duration", 130) + getattr(self, "clothes_speed_duration", 300)
@@ -662,47 +689,11 @@ class ThariBakhoorApp(tk.Tk):
         self.speed_frame.destroy()
         self.button_panel_frame.destroy()
 
-        # Unlock the door at the start of the sequence so user can place clothes inside
-        if ENABLE_HARDWARE:
-            self.pi.write(self.door_ssr_pin, 0)
-
-        # Assign heat and speed from current selections if available, else defaults
+        # Assign heat and speed from current selections if available, else defaults.
+        # The door, heater and fan are driven by the "clothes" session profile.
         self.clothes_heat_level = getattr(self, "selected_clothes_heat_level", "Medium")
         self.clothes_speed_value = getattr(self, "selected_clothes_speed_value", 2)
 
-        # Set x_seconds and y_seconds based on clothes heat level
-        if self.clothes_heat_level == "Low":
-            self.clothes_x_seconds = 110
-            self.clothes_y_seconds = 25
-        elif self.clothes_heat_level == "Medium":
-            self.clothes_x_seconds = 120
-            self.clothes_y_seconds = 30
-        elif self.clothes_heat_level == "High":
-            self.clothes_x_seconds = 130
-            self.clothes_y_seconds = 35
-        else:
-            self.clothes_x_seconds = 120
-            self.clothes_y_seconds = 30
-
-        # Set speed_duration and off_cycle based on selection (new mapping)
-        speed_choice = self.clothes_speed_levels[self.clothes_speed_value - 1][0]
-        if speed_choice == "3 minutes":
-            self.clothes_speed_duration = 180
-            w = 25
-        elif speed_choice == "4 minutes":
-            self.clothes_speed_duration = 240
-            w = 33
-        elif speed_choice == "5 minutes":
-            self.clothes_speed_duration = 300
-            w = 41
-        else:
-            self.clothes_speed_duration = 180
-            w = 25
-
-        # Also update speed_end_time to match selected speed_duration
-        self.clothes_speed_start_time = None  # will be set after weight=0
-        self.clothes_speed_end_time = None
-
         # Show a new frame for the sequence
         self.clothes_mode_frame = tk.Frame(self, bg="#f4e9e1")
         self.clothes_mode_frame.pack(fill="both", expand=True)
@@ -739,161 +730,10 @@ class ThariBakhoorApp(tk.Tk):
         # Center Safe Mode button in row 2
         safe_button.grid(row=2, column=0, pady=(5, 0))
 
-        # Start the controlled flow in a thread to avoid blocking the GUI
-        threading.Thread(target=self._clothes_mode_flow, daemon=True).start()
-
-    def _clothes_mode_flow(self):
-        # Start fan at 10% PWM when clothes mode begins
-        if ENABLE_HARDWARE:
-            self._set_fan_pwm(10)
-        fan_pwm_25_set = False
-        # Implements the new clothes mode logic with weight check and prompts.
-        x = getattr(self, "clothes_x_seconds", 120)
-        y = getattr(self, "clothes_y_seconds", 30)
-        z = getattr(self, "clothes_speed_duration", 300)
-        # Use the mapping as set in start_clothes_mode_sequence for w
-        speed_choice = self.clothes_speed_levels[getattr(self, "selected_clothes_speed_value", 2) - 1][0]
-        if speed_choice == "3 minutes":
-            w = 25
-        elif speed_choice == "4 minutes":
-            w = 33
-        elif speed_choice == "5 minutes":
-            w = 41
-        else:
-            w = 25
-
-        # 1. After clicking Start, check current weight
-        weight = self._get_weight_value() if ENABLE_HARDWARE else 0
-        if weight < 10:
-            # Chamber is empty, lock the door and start heating cycle
-            self._update_clothes_mode_label("Chamber empty. Locking door and starting cycle.")
-            if ENABLE_HARDWARE:
-                self.pi.write(self.door_ssr_pin, 1)
-            time.sleep(2)
-            # Proceed to heating cycle
-        else:
-            # Chamber not empty, unlock and prompt until weight is 0
-            self._update_clothes_mode_label("Weight detected. Please remove any objects and close the door.")
-            if ENABLE_HARDWARE:
-                self.pi.write(self.door_ssr_pin, 0)
-            time.sleep(2)
-            # Wait for chamber to be empty
-            self._update_clothes_mode_label("Waiting for chamber to be empty...")
-            while True:
-                weight = self._get_weight_value() if ENABLE_HARDWARE else 0
-                if weight < 10:
-                    break
-                self._update_clothes_mode_label("Weight detected. Please remove any objects and close the door.")
-                time.sleep(2)
-            self._update_clothes_mode_label("Chamber empty. Locking door and starting cycle.")
-            if ENABLE_HARDWARE:
-                self.pi.write(self.door_ssr_pin, 1)
-            time.sleep(2)
-
-        # 2. Start Speed timer and begin heat cycle
-        self.clothes_speed_start_time = time.time()
-        self.clothes_speed_end_time = self.clothes_speed_start_time + z
-
-        # Heater ON for X seconds (preheat)
-        self._update_clothes_mode_label(f"Heater ON for {x}s")
-        if ENABLE_HARDWARE:
-            self.heater_on(self.pi, self.heater_ssr_pin)
-        preheat_start = time.time()
-        while True:
-            elapsed = int(time.time() - preheat_start)
-            if elapsed >= x:
-                break
-            seconds_left = max(0, x - elapsed)
-            # After 30s, bump fan PWM to 25%
-            if ENABLE_HARDWARE and not fan_pwm_25_set and elapsed >= 30:
-                self._set_fan_pwm(25)
-                fan_pwm_25_set = True
-            self._update_clothes_mode_label(f"Heater ON. {seconds_left}s left")
-            time.sleep(1)
-        if ENABLE_HARDWARE:
-            self.heater_off(self.pi, self.heater_ssr_pin)
-        self._update_clothes_mode_label("Preheat done. Starting main heat cycle.")
-        time.sleep(1)
-
-        # After X seconds, turn on fan at 25% PWM (redundant if already set above, but preserve logic)
-        if ENABLE_HARDWARE:
-            self._set_fan_pwm(25)
-
-        # 3. New ON/OFF heater cycle for clothes mode (Y ON, W OFF, temp check every 5s)
-        last_temp_check = 0
-        speed_end_time = self.clothes_speed_end_time
-        while time.time() < speed_end_time:
-            # HEATER ON phase for Y seconds
-            if ENABLE_HARDWARE:
-                self.heater_on(self.pi, self.heater_ssr_pin)
-            for i in range(y):
-                if time.time() >= speed_end_time:
-                    break
-                z_remaining = max(0, int(speed_end_time - time.time()))
-                y_remaining = max(0, y - i)
-                self._update_clothes_mode_label(f"Time left: {z_remaining}s")
-                # Check temp every 5s
-                if (time.time() - last_temp_check) >= 5:
-                    temp = self._get_temp_value()
-                    last_temp_check = time.time()
-                    if temp >= 150:
-                        self._update_clothes_mode_label(f"Temperature >150°C ({temp}°C). Heater OFF for {w}s.")
-                        if ENABLE_HARDWARE:
-                            self.heater_off(self.pi, self.heater_ssr_pin)
-                        break
-                time.sleep(1)
-
-            if time.time() >= speed_end_time:
-                break
-
-            # HEATER OFF phase for W seconds
-            if ENABLE_HARDWARE:
-                self.heater_off(self.pi, self.heater_ssr_pin)
-            for i in range(w):
-                if time.time() >= speed_end_time:
-                    break
-                z_remaining = max(0, int(speed_end_time - time.time()))
-                w_remaining = max(0, w - i)
-                self._update_clothes_mode_label(f"Time left: {z_remaining}s")
-                if (time.time() - last_temp_check) >= 5:
-                    temp = self._get_temp_value()
-                    last_temp_check = time.time()
-                time.sleep(1)
-        # Ensure heater is OFF at the end
-        if ENABLE_HARDWARE:
-            self.heater_off(self.pi, self.heater_ssr_pin)
-        self._update_clothes_mode_label("Heating cycle complete. Heater OFF.")
-        time.sleep(1)
-
-        # 4. At end of Speed timer, run fan at 100% for 3 min, then show 5-min cooldown
-        self._update_clothes_mode_label("Fan at 100% for 3 min.")
-        if ENABLE_HARDWARE:
-            self._set_fan_pwm(100)
-        for i in range(180):
-            self._update_clothes_mode_label(f"Fan 100%: {180-i}s left")
-            time.sleep(1)
-        if ENABLE_HARDWARE:
-            self._set_fan_pwm(0)
-        self._update_clothes_mode_label("Cooldown: 5 min safety timer.")
-        # 5. Show 5-minute cooldown screen
-        for i in range(5*60):
-            mins = (5*60 - i) // 60
-            secs = (5*60 - i) % 60
-            self._update_clothes_mode_label(f"Please wait: {mins:02d}:{secs:02d} remaining (Cooldown)")
-            # Also check temp every 5s, turn off heater if >150C
-            if i % 5 == 0:
-                temp = self._get_temp_value()
-                if temp >= 150 and ENABLE_HARDWARE:
-                    self.heater_off(self.pi, self.heater_ssr_pin)
-            time.sleep(1)
-        self._update_clothes_mode_label("Session complete. Unlocking door.")
-        # Unlock door
-        if ENABLE_HARDWARE:
-            self.pi.write(self.door_ssr_pin, 0)
-        time.sleep(2)
-        self._update_clothes_mode_label("Done. Door unlocked.")
-        time.sleep(3)
-        self.clothes_mode_frame.after(0, self.show_main_screen_buttons)
+        # Run the controlled flow as a cancellable session on the engine loop
+        flow = self._run_session_profile("clothes", self.clothes_heat_level, self.clothes_speed_value,
+                                         self._session_io(self.clothes_mode_label, self._update_clothes_mode_label))
+        self.engine.start_session("clothes", flow, on_done=self._session_finished)
 
     def _update_clothes_mode_label(self, message):
         if hasattr(self, "clothes_mode_label"):
@@ -1046,22 +886,10 @@ class ThariBakhoorApp(tk.Tk):
             btn.event_generate('<Leave>')
 
     def set_surrounding_heat_params_from_level(self, level):
-        if level == "Low":
-            self.surrounding_x_seconds = 105
-            self.surrounding_y_seconds = 10
-            self.surrounding_heat_duration = 120
-        elif level == "Medium":
-            self.surrounding_x_seconds = 110
-            self.surrounding_y_seconds = 15
-            self.surrounding_heat_duration = 130
-        elif level == "High":
-            self.surrounding_x_seconds = 115
-            self.surrounding_y_seconds = 20
-            self.surrounding_heat_duration = 140
-        else:
-            self.surrounding_x_seconds = 110
-            self.surrounding_y_seconds = 15
-            self.surrounding_heat_duration = 130
+        params = session_params("surrounding", level, getattr(self, "selected_surrounding_speed_value", 2))
+        self.surrounding_x_seconds = params["x"]
+        self.surrounding_y_seconds = params["y"]
+        self.surrounding_heat_duration = params["heat_duration"]
 
     def select_surrounding_speed_level(self, idx):
         self.selected_surrounding_speed_value = idx + 1
@@ -1079,20 +907,10 @@ class ThariBakhoorApp(tk.Tk):
             btn.event_generate('<Leave>')
 
     def set_surrounding_speed_param_from_value(self, value):
-        # value: 1, 2, 3 (index+1)
-        # Map to 3, 4, 5 minutes
-        if value == 1:
-            self.surrounding_speed_duration = 180
-            self.surrounding_off_cycle = 25
-        elif value == 2:
-            self.surrounding_speed_duration = 240
-            self.surrounding_off_cycle = 33
-        elif value == 3:
-            self.surrounding_speed_duration = 300
-            self.surrounding_off_cycle = 41
-        else:
-            self.surrounding_speed_duration = 180
-            self.surrounding_off_cycle = 25
+        # value: 1, 2, 3 (index+1) -> 3, 4, 5 minutes
+        params = session_params("surrounding", getattr(self, "selected_surrounding_heat_level", "Medium"), value)
+        self.surrounding_speed_duration = params["z"]
+        self.surrounding_off_cycle = params["w"]
 
     def update_surrounding_time_record_label(self):
         total_seconds = getattr(self, "surrounding_heat_duration", 130) + getattr(self, "surrounding_speed_duration", 300)
@@ -1108,51 +926,11 @@ class ThariBakhoorApp(tk.Tk):
         self.heat_frame.destroy()
         self.speed_frame.destroy()
         self.button_panel_frame.destroy()
-        # Lock the door
-        if ENABLE_HARDWARE:
-            self.pi.write(self.door_ssr_pin, 1)
-
-        # Start speed timer immediately after door locks (before preheat X starts)
-        self.surrounding_speed_start_time = time.time()
-        self.surrounding_speed_end_time = self.surrounding_speed_start_time + getattr(self, "surrounding_speed_duration", 300)
-
-        # Assign heat and speed from current selections
+        # Assign heat and speed from current selections; the "surrounding"
+        # session profile locks the door and starts the speed timer
         self.surrounding_heat_level = getattr(self, "selected_surrounding_heat_level", "Medium")
         self.surrounding_speed_value = getattr(self, "selected_surrounding_speed_value", 2)
 
-        # Set x_seconds and y_seconds based on surrounding heat level
-        if self.surrounding_heat_level == "Low":
-            self.surrounding_x_seconds = 105
-            self.surrounding_y_seconds = 10
-        elif self.surrounding_heat_level == "Medium":
-            self.surrounding_x_seconds = 110
-            self.surrounding_y_seconds = 15
-        elif self.surrounding_heat_level == "High":
-            self.surrounding_x_seconds = 115
-            self.surrounding_y_seconds = 20
-        else:
-            self.surrounding_x_seconds = 110
-            self.surrounding_y_seconds = 15
-
-        # Set speed_duration and off_cycle based on selection (new mapping)
-        speed_choice = self.surrounding_speed_levels[self.surrounding_speed_value - 1][0]
-        if speed_choice == "3 minutes":
-            self.surrounding_speed_duration = 180
-            w = 25
-        elif speed_choice == "4 minutes":
-            self.surrounding_speed_duration = 240
-            w = 33
-        elif speed_choice == "5 minutes":
-            self.surrounding_speed_duration = 300
-            w = 41
-        else:
-            self.surrounding_speed_duration = 180
-            w = 25
-        self.surrounding_off_cycle = w
-        # Also update speed_end_time to match selected speed_duration
-        self.surrounding_speed_start_time = time.time()
-        self.surrounding_speed_end_time = self.surrounding_speed_start_time + self.surrounding_speed_duration
-
         # Show a new frame for the sequence
         self.surrounding_mode_frame = tk.Frame(self, bg="#f4e9e1")
         self.surrounding_mode_frame.pack(fill="both", expand=True)
@@ -1188,128 +966,10 @@ class ThariBakhoorApp(tk.Tk):
         # Center Safe Mode button in row 2
         safe_button.grid(row=2, column=0, pady=(5, 0))
 
-        # Start the controlled flow in a thread to avoid blocking the GUI
-        threading.Thread(target=self._surrounding_mode_flow, daemon=True).start()
-
-    def _surrounding_mode_flow(self):
-        # Implements the surrounding mode heater cycle logic with ON/OFF, temperature check, and UI updates.
-        x = getattr(self, "surrounding_x_seconds", 120)
-        y = getattr(self, "surrounding_y_seconds", 30)
-        z = getattr(self, "surrounding_speed_duration", 180)
-        w = getattr(self, "surrounding_off_cycle", 25)
-
-        # Start Speed timer and begin heat cycle
-        speed_start_time = time.time()
-        speed_end_time = speed_start_time + z
-
-        # Heater ON for X seconds (preheat)
-        self._update_surrounding_mode_label(f"Heater ON for {x}s")
-        if ENABLE_HARDWARE:
-            self._set_fan_pwm(10)
-            self.heater_on(self.pi, self.heater_ssr_pin)
-        preheat_start = time.time()
-        while True:
-            elapsed = int(time.time() - preheat_start)
-            if elapsed >= x:
-                break
-            seconds_left = max(0, x - elapsed)
-            # After 60 seconds, set fan PWM to 25%
-            if ENABLE_HARDWARE:
-                if time.time() - preheat_start > 60:
-                    self._set_fan_pwm(25)
-            self._update_surrounding_mode_label(f"Heater ON. {seconds_left}s left")
-            time.sleep(1)
-        if ENABLE_HARDWARE:
-            self.heater_off(self.pi, self.heater_ssr_pin)
-        self._update_surrounding_mode_label("Preheat done. Starting main heat cycle.")
-        time.sleep(1)
-
-        # After X seconds, turn on fan at 25% PWM
-        if ENABLE_HARDWARE:
-            self._set_fan_pwm(25)
-
-        # Main ON/OFF heater cycle for surrounding mode
-        last_temp_check = 0
-        while time.time() < speed_end_time:
-            # HEATER ON PHASE (Y seconds)
-            on_start = time.time()
-            heater_should_continue = True
-            if ENABLE_HARDWARE:
-                self.heater_on(self.pi, self.heater_ssr_pin)
-            for i in range(y):
-                if time.time() >= speed_end_time:
-                    break
-                z_remaining = max(0, int(speed_end_time - time.time()))
-                y_remaining = max(0, y - i)
-                # Update UI with ON phase
-                self._update_surrounding_mode_label(f"Time left: {z_remaining}s")
-                # Check temp every 5s
-                if (time.time() - last_temp_check) >= 5:
-                    temp = self._get_temp_value()
-                    last_temp_check = time.time()
-                    if temp >= 150:
-                        # Temp too high, turn off heater, update UI, skip rest of ON time
-                        if ENABLE_HARDWARE:
-                            self.heater_off(self.pi, self.heater_ssr_pin)
-                        self._update_surrounding_mode_label(f"Temperature >150°C ({temp}°C). Heater OFF. Skipping ON cycle.")
-                        heater_should_continue = False
-                        break
-                time.sleep(1)
-            # Ensure heater is off after ON phase or if skipped
-            if ENABLE_HARDWARE:
-                self.heater_off(self.pi, self.heater_ssr_pin)
-            if time.time() >= speed_end_time:
-                break
-            # HEATER OFF PHASE (w seconds)
-            for i in range(w):
-                if time.time() >= speed_end_time:
-                    break
-                z_remaining = max(0, int(speed_end_time - time.time()))
-                w_remaining = max(0, w - i)
-                self._update_surrounding_mode_label(f"Time left: {z_remaining}s")
-                # Check temp every 5s during OFF as well
-                if (time.time() - last_temp_check) >= 5:
-                    temp = self._get_temp_value()
-                    last_temp_check = time.time()
-                    if temp >= 150:
-                        # Already off, just update UI
-                        self._update_surrounding_mode_label(f"Temperature >150°C ({temp}°C). Heater remains OFF.")
-                time.sleep(1)
-        # Ensure heater is OFF at the end
-        if ENABLE_HARDWARE:
-            self.heater_off(self.pi, self.heater_ssr_pin)
-        self._update_surrounding_mode_label("Heating cycle complete. Heater OFF.")
-        time.sleep(1)
-
-        # 4. At end of Speed timer, run fan at 100% for 3 min, then show 5-min cooldown
-        self._update_surrounding_mode_label("Fan at 100% for 3 min.")
-        if ENABLE_HARDWARE:
-            self._set_fan_pwm(100)
-        for i in range(180):
-            self._update_surrounding_mode_label(f"Fan 100%: {180-i}s left")
-            time.sleep(1)
-        if ENABLE_HARDWARE:
-            self._set_fan_pwm(0)
-        self._update_surrounding_mode_label("Cooldown: 5 min safety timer.")
-        # 5. Show 5-minute cooldown screen
-        for i in range(5*60):
-            mins = (5*60 - i) // 60
-            secs = (5*60 - i) % 60
-            self._update_surrounding_mode_label(f"Please wait: {mins:02d}:{secs:02d} remaining (Cooldown)")
-            # Also check temp every 5s, turn off heater if >150C
-            if i % 5 == 0:
-                temp = self._get_temp_value()
-                if temp >= 150 and ENABLE_HARDWARE:
-                    self.heater_off(self.pi, self.heater_ssr_pin)
-            time.sleep(1)
-        self._update_surrounding_mode_label("Session complete. Unlocking door.")
-        # Unlock door
-        if ENABLE_HARDWARE:
-            self.pi.write(self.door_ssr_pin, 0)
-        time.sleep(2)
-        self._update_surrounding_mode_label("Done. Door unlocked.")
-        time.sleep(3)
-        self.surrounding_mode_frame.after(0, self.show_main_screen_buttons)
+        # Run the controlled flow as a cancellable session on the engine loop
+        flow = self._run_session_profile("surrounding", self.surrounding_heat_level, self.surrounding_speed_value,
+                                         self._session_io(self.surrounding_mode_label, self._update_surrounding_mode_label))
+        self.engine.start_session("surrounding", flow, on_done=self._session_finished)
 
     def _update_surrounding_mode_label(self, message):
         if hasattr(self, "surrounding_mode_label"):
@@ -1348,43 +1008,12 @@ class ThariBakhoorApp(tk.Tk):
         self.running = False
         self.person_running = False 
 
-        # Lock the door
-        if ENABLE_HARDWARE:
-            self.pi.write(self.door_ssr_pin, 1)
-
-        # Before starting the mode flow, process heat level and speed to set x_seconds, y_seconds, speed_duration, w
+        # Assign heat and speed from current selections; the "person" session
+        # profile locks the door and runs the preheat/entry/cycle phases
         self.heat_level = getattr(self, "selected_heat_level", "Medium")
         self.speed_value = getattr(self, "selected_speed_value", 2)
-        # Set x_seconds and y_seconds based on self.heat_level (use new mapping)
-        if self.heat_level == "Low":
-            self.x_seconds = 105
-            self.y_seconds = 10
-        elif self.heat_level == "Medium":
-            self.x_seconds = 110
-            self.y_seconds = 15
-        elif self.heat_level == "High":
-            self.x_seconds = 115
-            self.y_seconds = 20
-        else:
-            self.x_seconds = 110
-            self.y_seconds = 15  # Default
-        # Set speed_duration and w based on self.speed_value (using mapping as in clothes/surrounding)
-        if self.speed_value == 1:
-            self.person_speed_duration = 180
-            self.w = 25
-        elif self.speed_value == 2:
-            self.person_speed_duration = 240
-            self.w = 33
-        elif self.speed_value == 3:
-            self.person_speed_duration = 300
-            self.w = 41
-        else:
-            self.person_speed_duration = 180
-            self.w = 25
-        self.speed_duration = self.person_speed_duration
-        # Also update speed_end_time to match selected speed_duration
-        self.speed_start_time = time.time()
-        self.speed_end_time = self.speed_start_time + self.speed_duration
+        self.set_heat_params_from_level(self.heat_level)
+        self.set_speed_param_from_value(self.speed_value)
         # Show a new frame for the sequence
         self.person_mode_frame = tk.Frame(self, bg="#f4e9e1")
         self.person_mode_frame.pack(fill="both", expand=True)
@@ -1421,204 +1050,35 @@ class ThariBakhoorApp(tk.Tk):
         # Center Safe Mode button in row 2
         safe_button.grid(row=2, column=0, pady=(5, 0)) # 5, 0
 
-        # Start the controlled flow in a thread to avoid blocking the GUI
-        threading.Thread(target=self._person_mode_flow, daemon=True).start()
+        # Run the controlled flow as a cancellable session on the engine loop
+        flow = self._run_session_profile("person", self.heat_level, self.speed_value,
+                                         self._session_io(self.person_mode_label, self._update_person_mode_label))
+        self.engine.start_session("person", flow, on_done=self._session_finished)
 
-    def _person_mode_flow(self):
-        # Implements the full person mode flow, using self.speed_start_time and self.speed_end_time for ON/OFF cycles.
-        x = self.x_seconds
-        y = self.y_seconds
-        w = self.w
-        z = self.person_speed_duration
-        # 1. Lock the door immediately
-        if ENABLE_HARDWARE:
-            self.pi.write(self.door_ssr_pin, 1)
-        self._update_person_mode_label("Door locked.")
+    def _session_io(self, label, show_status):
+        # Outputs go through the actuator worker; status text is coalesced per
+        # label (keyed by widget path, unique per session screen) on the Tk bridge
+        status = functools.partial(self.ui_bridge.update, str(label), show_status)
+        return HalIO(self.hal, actuate=self.engine.actuate, status=status, occupancy=self.occupancy)
 
-        # 2. Turn on heater and start X timer (preheat)
-        if ENABLE_HARDWARE:
-            self.heater_on(self.pi, self.heater_ssr_pin)
-            # Fan control: Start fan at 10% PWM immediately
-            self.set_fan_pwm(self.pi, self.fan_gpio_pin, 10)
-        preheat_start = time.time()
-        fan_pwm_25_set = False
-        preheat_elapsed = 0
-        entry_detected = False
-        paused = False
-        pause_start = None
-        waited_while_zero = 0
-        # 3. After 30s, unlock door for entry, but continue X timer (pause/resume if no entry)
-        while preheat_elapsed < x:
-            now = time.time()
-            preheat_elapsed = int(now - preheat_start)
-            seconds_left = max(0, x - preheat_elapsed)
-            # Fan logic: after 60s, increase to 25%
-            if ENABLE_HARDWARE and not fan_pwm_25_set and (now - preheat_start) >= 60:
-                self.set_fan_pwm(self.pi, self.fan_gpio_pin, 25)
-                fan_pwm_25_set = True
-            if preheat_elapsed < 30:
-                self._update_person_mode_label(f"Door unlocks in {30-preheat_elapsed}s")
-                time.sleep(1)
-                continue
-            # Unlock the door at 30s if not already unlocked
-            if preheat_elapsed == 30:
-                self._update_person_mode_label("Unlocking door. Please enter chamber.")
-                if ENABLE_HARDWARE:
-                    self.pi.write(self.door_ssr_pin, 0)
-                time.sleep(2)
-            # After 30s: check for entry
-            weight = self._get_weight_value()
-            # If no entry (weight == 0), pause X timer after 15s
-            if not entry_detected:
-                if weight < 10:
-                    self._update_person_mode_label("Waiting for entry. Please enter the chamber.")
-                    waited_while_zero += 1
-                    if waited_while_zero >= 15:
-                        # Pause X timer, turn off heater, display message, wait for entry
-                        paused = True
-                        pause_start = time.time()
-                        if ENABLE_HARDWARE:
-                            self.heater_off(self.pi, self.heater_ssr_pin)
-                        self._update_person_mode_label("Heater paused. Please enter chamber.")
-                        while True:
-                            weight = self._get_weight_value()
-                            if weight > 50:
-                                entry_detected = True
-                                paused = False
-                                if ENABLE_HARDWARE:
-                                    self.heater_on(self.pi, self.heater_ssr_pin)
-                                # Resume X timer from where left
-                                pause_duration = int(time.time() - pause_start)
-                                preheat_start += pause_duration
-                                break
-                            time.sleep(1)
-                        continue
-                    time.sleep(1)
-                    continue
-                elif 0 < weight <= 50:
-                    # Not an adult
-                    if ENABLE_HARDWARE:
-                        self.heater_off(self.pi, self.heater_ssr_pin)
-                    self._update_person_mode_label("Warning: not an adult. Heater OFF.")
-                    time.sleep(5)
-                    return
-                elif weight > 50:
-                    entry_detected = True
-                    # Continue X timer, heater stays ON
-                    self._update_person_mode_label(f"Entry detected. Continuing preheat: {seconds_left}s left.")
-                    time.sleep(1)
-                    continue
-            # If already detected, just continue X timer
-            self._update_person_mode_label(f"Preheating: ({seconds_left}s left)")
-            time.sleep(1)
-        # End of X timer: heater OFF
-        if ENABLE_HARDWARE:
-            self.heater_off(self.pi, self.heater_ssr_pin)
-        self._update_person_mode_label("Preheat complete. Heater OFF.")
-        time.sleep(1)
-
-        # 4. Cyclic ON/OFF heater cycle: ON for y seconds (check temp every 5s), OFF for w seconds, repeat until speed timer ends
-        last_temp_check = 0
-        speed_start_time = time.time()
-        speed_end_time = speed_start_time + z
-        while time.time() < speed_end_time:
-            # HEATER ON PHASE (Y seconds), check temp every 5s
-            heater_on_flag = True
-            if ENABLE_HARDWARE:
-                self.heater_on(self.pi, self.heater_ssr_pin)
-            for i in range(y):
-                if time.time() >= speed_end_time:
-                    break
-                z_remaining = max(0, int(speed_end_time - time.time()))
-                y_remaining = max(0, y - i)
-                # Fan logic: after 60s since speed_start_time, ensure 25%
-                if ENABLE_HARDWARE and (time.time() - speed_start_time) >= 60:
-                    self.set_fan_pwm(self.pi, self.fan_gpio_pin, 25)
-                self._update_person_mode_label(f"Time left: {z_remaining}s")
-                if (time.time() - last_temp_check) >= 5:
-                    temp = self._get_temp_value()
-                    last_temp_check = time.time()
-                    if temp >= 150:
-                        self._update_person_mode_label(f"Temperature >150°C ({temp}°C). Heater OFF for {w}s.")
-                        if ENABLE_HARDWARE:
-                            self.heater_off(self.pi, self.heater_ssr_pin)
-                        heater_on_flag = False
-                        break
-                time.sleep(1)
-            if time.time() >= speed_end_time:
-                break
-            # HEATER OFF PHASE (W seconds)
-            if ENABLE_HARDWARE:
-                self.heater_off(self.pi, self.heater_ssr_pin)
-            for i in range(w):
-                if time.time() >= speed_end_time:
-                    break
-                z_remaining = max(0, int(speed_end_time - time.time()))
-                w_remaining = max(0, w - i)
-                self._update_person_mode_label(f"Time left: {z_remaining}s")
-                if (time.time() - last_temp_check) >= 5:
-                    temp = self._get_temp_value()
-                    last_temp_check = time.time()
-                    if temp >= 150:
-                        self._update_person_mode_label(f"Temperature >150°C ({temp}°C). Heater remains OFF.")
-                time.sleep(1)
-        # Ensure heater is OFF at the end
-        if ENABLE_HARDWARE:
-            self.heater_off(self.pi, self.heater_ssr_pin)
-        self._update_person_mode_label("Heating cycle complete. Heater OFF.")
-        time.sleep(1)
-
-        # 5. FAN CONTROL: After speed timer ends, run fan at 100% PWM for 3 min, then 5-min cooldown
-        self._update_person_mode_label("Fan at 100% for 3 min.")
-        if ENABLE_HARDWARE:
-            self.set_fan_pwm(self.pi, self.fan_gpio_pin, 100)
-        for i in range(180):
-            self._update_person_mode_label(f"Fan 100%: {180-i}s left")
-            time.sleep(1)
-        if ENABLE_HARDWARE:
-            self.set_fan_pwm(self.pi, self.fan_gpio_pin, 0)
-        self._update_person_mode_label("Cooldown: 5 min safety timer.")
-        # 6. Show 5-minute timer display (user can see countdown)
-        for i in range(5*60):
-            mins = (5*60 - i) // 60
-            secs = (5*60 - i) % 60
-            self._update_person_mode_label(f"Please wait: {mins:02d}:{secs:02d} remaining (Cooldown)")
-            # Also check temp every 5s, turn off heater if >150C
-            if i % 5 == 0:
-                temp = self._get_temp_value()
-                if temp >= 150 and ENABLE_HARDWARE:
-                    self.heater_off(self.pi, self.heater_ssr_pin)
-            time.sleep(1)
-        self._update_person_mode_label("Session complete. Unlocking door.")
-        # 7. Unlock door
-        if ENABLE_HARDWARE:
-            self.pi.write(self.door_ssr_pin, 0)
-        time.sleep(2)
-        self._update_person_mode_label("Done. Door unlocked.")
-        time.sleep(3)
-        self.person_mode_frame.after(0, self.show_main_screen_buttons)
+    async def _run_session_profile(self, mode, heat_level, speed_value, io):
+        # Shared coroutine for all three modes: the phases come from session_profiles
+        phases = build_session(mode, heat_level, speed_value)
+        runner = SessionRunner(phases, io)
+        if await runner.run():
+            self.engine.call_ui(self.show_main_screen_buttons)
 
     def set_fan_pwm(self, pi, fan_pin, percent):
         """Set the fan PWM to a given percent (0-100)."""
-        if not ENABLE_HARDWARE:
-            print(f"[SIMULATED] Fan set to {percent}% PWM")
-            return
         try:
-            duty = int(percent * 255 / 100)
-            pi.set_PWM_dutycycle(fan_pin, duty)
+            self.hal.set_fan(percent)
         except Exception as e:
             print(f"Error setting fan PWM: {e}")
 
     def _set_fan_pwm(self, percent):
-        # Helper to set fan GPIO PWM (software fallback if no hardware PWM)
-        if not ENABLE_HARDWARE:
-            print(f"[SIMULATED] Fan set to {percent}% PWM")
-            return
-        # Use pigpio hardware PWM if available
+        # Helper to set the fan PWM through the HAL (pigpio, or the simulated booth)
         try:
-            # pigpio.set_PWM_dutycycle(gpio, dutycycle) where dutycycle is 0-255
-            duty = int(percent * 255 / 100)
-            self.pi.set_PWM_dutycycle(self.fan_gpio_pin, duty)
+            self.hal.set_fan(percent)
         except Exception as e:
             print(f"Error setting fan PWM: {e}")
     
@@ -1647,7 +1107,11 @@ class ThariBakhoorApp(tk.Tk):
             print(actual_heat_value)
 
             while True:
-                temperature = self.read_temperature(self.pi, target_temp)
+                temperature = self.read_temperature(self.pi, self.temperature_source, target_temp)
+                if temperature is None:
+                    # No fresh reading: it has not been seen above target yet
+                    time.sleep(1)
+                    continue
                 if temperature >= 450:
                     print(" EMERGENCY: Heater turned OFF due to temperature > 450°C during preheat")
                     self.heater_off(self.pi, self.heater_ssr_pin)
@@ -1678,16 +1142,58 @@ class ThariBakhoorApp(tk.Tk):
             # self.control_fans(self.kit, self.fan_channels, channel_duty_cycle)
             GPIO.output(self.fan_gpio_pin, GPIO.HIGH)
 
-        # Calculate min and max heat values
+        # Same switching points as before: heater ON below assigned_heat - 20,
+        # OFF again once the temperature is back at or above it
         min_heat = self.assigned_heat - 20
-        max_heat = self.assigned_heat + 5
         heater_on = False
+        finished = False
+        control_job = None
+
+        def stop_control():
+            nonlocal finished, control_job
+            finished = True
+            if control_job is not None:
+                self.after_cancel(control_job)
+                control_job = None
+
+        def finish():
+            stop_control()
+            self.cooling_down_screen()
+
+        # Samples the thermocouple every CONTROL_PERIOD, not once a second
+        def control_heater():
+            nonlocal heater_on, control_job
+            control_job = None
+            if finished:
+                return
+            try:
+                temperature = self.hal.temperature()
+                if temperature is not None and temperature >= 450:
+                    print(" EMERGENCY: Temperature exceeded 450°C. Shutting down heater.")
+                    self.heater_off(self.pi, self.heater_ssr_pin)
+                    messagebox.showerror("Overheat Alert", "Temperature exceeded 450°C! Heater has been shut down.")
+                    finish()
+                    return
+                # No fresh reading: never heat blind
+                on = temperature is not None and temperature < min_heat
+                if on != heater_on:
+                    if on:
+                        self.heater_on(self.pi, self.heater_ssr_pin)
+                    else:
+                        self.heater_off(self.pi, self.heater_ssr_pin)
+                    heater_on = on
+            except Exception as e:
+                print(f"Heater control error, heater OFF: {e}")
+                stop_control()
+                self.heater_off(self.pi, self.heater_ssr_pin)
+                return
+            control_job = self.after(int(CONTROL_PERIOD * 1000), control_heater)
 
         # Updates the time_remaining for the session.
         def update_remaining_time(time_remaining_label):
+            if finished:
+                return
 
-            nonlocal heater_on 
-            
             def format_time(minutes, seconds):
                 return "{} minutes {} seconds".format(int(minutes), int(seconds))
 
@@ -1705,29 +1211,8 @@ class ThariBakhoorApp(tk.Tk):
             time_remaining_label.config(text="Time Remaining:\n {}".format(formatted_time))
             
             if remaining_time == 0:
-                self.cooling_down_screen()
+                finish()
             else:
-                # Check temperature only if time remaining is not 0
-                if ENABLE_HARDWARE:
-                    temperature = self.read_temperature(self.pi, self.targettemp[1])
-                    if temperature is not None:
-                        if temperature >= 450:
-                            print(" EMERGENCY: Temperature exceeded 450°C. Shutting down heater.")
-                            self.heater_off(self.pi, self.heater_ssr_pin)
-                            messagebox.showerror("Overheat Alert", "Temperature exceeded 450°C! Heater has been shut down.")
-                            self.cooling_down_screen()
-                            return  # Immediately exit to prevent further execution
-                        
-                        if min_heat <= temperature <= max_heat and heater_on:
-                            self.heater_off(self.pi, self.heater_ssr_pin)
-                            heater_on = False
-                        elif temperature > max_heat and heater_on:
-                            self.heater_off(self.pi, self.heater_ssr_pin)
-                            heater_on = False
-                        elif temperature < min_heat and not heater_on:
-                            self.heater_on(self.pi, self.heater_ssr_pin)
-                            heater_on = True
-
                 time_remaining_label.after(1000, update_remaining_time, time_remaining_label)
 
         self.wait_frame.destroy()
@@ -1735,8 +1220,12 @@ class ThariBakhoorApp(tk.Tk):
         self.working_frame.pack(pady=0)
         self.time_remaining_label = tk.Label(self.working_frame, text="", bg="#f4e9e1", font=("DM Sans", 20, "bold"))
         self.time_remaining_label.grid(row=1, columnspan=5, pady=(0, 10))
+        # Leaving the screen any way (cooldown, back, teardown) stops the loop
+        self.working_frame.bind("<Destroy>", lambda event: stop_control() if event.widget is self.working_frame else None)
 
-        update_remaining_time(self.time_remaining_label)    
+        update_remaining_time(self.time_remaining_label)
+        if ENABLE_HARDWARE:
+            control_heater()
 
     # The cooling down screen is used stop the fans, heaters and stop the user to use the system again before cooling down
     # targettemp[0] is used for the cooling down temp limit 
@@ -1758,7 +1247,7 @@ class ThariBakhoorApp(tk.Tk):
     # Define a function to continuously check temperature
         def check_temperature():
             if ENABLE_HARDWARE:
-                temperature = self.read_temperature(self.pi, self.targettemp[0])
+                temperature = self.read_temperature(self.pi, self.temperature_source, self.targettemp[0])
                 if temperature is not None and temperature < self.targettemp[0]:
                     for widget in self.winfo_children():
                         widget.destroy()
@@ -1988,11 +1477,23 @@ class ThariBakhoorApp(tk.Tk):
             GPIO.output(self.fan_gpio_pin, GPIO.LOW)
             # Close GPIO pins
             GPIO.cleanup()
+            # Stop the sensor acquisition threads and release the serial port and SPI
+            self.sensors.stop()
+            if self.temp_spi is not None:
+                self.temp_spi.stop()
+            if self.load_cell is not None:
+                self.load_cell.stop()
+            # Keep what the zero tracker learned this run
+            self.zero_tracker.save()
             # Disconnect from pigpio
             self.pi.stop()
 
     # Override the default destroy method of your Tkinter application
     def destroy(self):
+        # Cancel any running session so nothing touches the hardware after cleanup
+        if hasattr(self, "engine"):
+            self.engine.stop()
+            self.ui_bridge.stop()
         # Call the cleanup method before destroying the application
         self.cleanup_gpio()
         # Call the destroy method of the super class
@@ -2068,95 +1569,98 @@ class ThariBakhoorApp(tk.Tk):
         else:
             print("[GUI-only] Skipping weight check.")
 
+    def _zero_tracking_allowed(self):
+        # Sensor thread: only learn drift from a settled, empty, locked chamber
+        # The door pin is read back, so every way of locking it counts
+        occupancy = self.occupancy
+        return occupancy.occupied is False and occupancy.settled and self.pi.read(self.door_ssr_pin) == 1
+
+    def _store_hx711_zero(self, offset):
+        self.scale_calibration.hx711_offset = offset
+        self.scale_calibration.save()
+
+    def tare_scale(self):
+        """Re-zero the load cell now. The chamber must be empty."""
+        if not ENABLE_HARDWARE:
+            print("[GUI-only] Skipping tare.")
+            return False
+        if self.load_cell is not None:
+            tared = self.load_cell.zero(self.load_cell.window * 4)
+        else:
+            tared = self.sensors.tare() is not None
+        if tared:
+            self.zero_tracker.reset()
+        else:
+            print("Tare failed, keeping the previous zero")
+        return tared
+
     def initialize_weight(self):
-        print("Weight initialization handled by ESP32 via serial.")
+        if ENABLE_HARDWARE and self.load_cell is not None:
+            print("Weight initialization handled by the Pi HX711 driver (zeroes at startup).")
+        else:
+            print("Weight initialization handled by ESP32 via serial.")
 
     def checking_weight(self):
         if not ENABLE_HARDWARE:
             print("[GUI-only] Skipping weight check. Returning False.")
             return False
 
-        try:
-            self.serial.write(b'get_weight\n')
-            response = self.serial.readline().decode().strip()
-
-            if response.startswith("KG:"):
-                weight_kg = float(response.split(":")[1])
-                print(f"Weight: {weight_kg:.2f} kg")
-                return weight_kg > 4.00
-
-            else:
-                print(f"Unexpected weight response: {response}")
-                return False
-
-        except Exception as e:
-            print(f"Serial error while reading weight: {e}")
+        weight_kg = self.hal.weight()
+        if weight_kg is None:
+            print(f"No fresh weight reading (link {self.sensors.state})")
             return False
+        print(f"Weight: {weight_kg:.2f} kg")
+        return weight_kg > 4.00
 
     def _get_weight_value(self):
-        try:
-            self.serial.write(b'get_weight')
-            response = self.serial.readline().decode().strip()
-
-            if response.startswith("KG:"):
-                weight_kg = float(response.split(":")[1])
-                print(f"[Weight Check] Current weight: {weight_kg:.2f} kg")
-                return weight_kg
-
-            else:
-                print(f"[Weight Check] Unexpected response: {response}")
-                return 0.0
-
-        except Exception as e:
-            print(f"[Weight Check] Serial error: {e}")
-            return 0.0
+        # Latest weight from the HAL (sensor service cache); never blocks on serial I/O.
+        # None means no fresh reading: callers must not mistake it for an empty chamber
+        weight_kg = self.hal.weight()
+        if weight_kg is None:
+            print("[Weight Check] No fresh reading")
+            return None
+        print(f"[Weight Check] Current weight: {weight_kg:.2f} kg")
+        return weight_kg
 
 
     def _get_temp_value(self):
-
-        try:
-            self.serial.write(b'get_temp')
-            response = self.serial.readline().decode().strip()
-
-            if response.startswith("TEMP:"):
-                temp_c = float(response.split(":")[1])
-                print(f"[Temp Check] Current temperature: {temp_c:.2f} °C")
-                return temp_c
-            else:
-                print(f"[Temp Check] Unexpected response: {response}")
-                return 0.0
-
-        except Exception as e:
-            print(f"[Temp Check] Serial error: {e}")
-            return 0.0
+        # Latest temperature from the HAL (sensor service cache); never blocks on serial I/O.
+        # None means no fresh reading, never 0.0, so a dead link cannot pass the overheat check
+        temp_c = self.hal.temperature()
+        if temp_c is None:
+            print("[Temp Check] No fresh reading")
+            return None
+        print(f"[Temp Check] Current temperature: {temp_c:.2f} °C")
+        return temp_c
 
     def read_temperature(self, pi, sensor, target_temp):
         if not ENABLE_HARDWARE:
             print(f"[SIMULATED] Returning fixed GUI-mode temperature: {target_temp + 5}")
             return target_temp + 5  # Simulated temperature for GUI-only testing
 
-        try:
-            self.serial.write(b'get_temp\n')
-            response = self.serial.readline().decode().strip()
-            if response.startswith("TEMP:"):
-                float_temp = float(response.split(":")[1])
-                print(f"Received temperature: {float_temp:.2f} °C")
+        float_temp = self.hal.temperature()
+        if float_temp is None:
+            # Stale or missing: report it rather than a 0.0 that looks safe
+            print(f"No fresh temperature reading (link {self.sensors.state})")
+            return None
+        print(f"Received temperature: {float_temp:.2f} °C")
 
-                if float_temp >= 450:
-                    self.heater_off(self.pi, self.heater_ssr_pin)
-                    print(" EMERGENCY: Heater turned OFF due to temperature > 450°C")
-                    messagebox.showerror("Overheat Alert", "Temperature exceeded 450°C! Heater has been shut down.")
-                return float_temp
-            else:
-                # print(f"SPI read error. Bytes received: {c}")
-            # time.sleep(1)
-                print(f"Unexpected temperature response: {response}")
-                return 0.0
-        except Exception as e:
-            print(f"Serial error while reading temperature: {e}")
-            return 0.0
-        # print("Temperature read timeout. Returning fallback value 0.0")
-        # return 0.0
+        if float_temp >= 450:
+            self.heater_off(self.pi, self.heater_ssr_pin)
+            print(" EMERGENCY: Heater turned OFF due to temperature > 450°C")
+            # May run off the Tk thread; the alert is shown by the Tk loop
+            self.ui_bridge.post(self._show_overheat_alert)
+        return float_temp
+
+    def _show_overheat_alert(self):
+        # Tk thread only. One dialog at a time even if the alarm repeats every sample
+        if getattr(self, "overheat_alert_open", False):
+            return
+        self.overheat_alert_open = True
+        try:
+            messagebox.showerror("Overheat Alert", "Temperature exceeded 450°C! Heater has been shut down.")
+        finally:
+            self.overheat_alert_open = False
 
     def read_temperature_average(self, pi, sensor, duration):
         if not ENABLE_HARDWARE:
@@ -2164,55 +1668,34 @@ class ThariBakhoorApp(tk.Tk):
             return 35.0  # Simulated average for GUI-only mode
 
         start_time = time.time()
-        # stop_time = start_time + duration
         temp_readings = []
-
+        last_timestamp = None
 
         while time.time() - start_time < duration:
-            try:
-                self.serial.write(b'get_temp\n')
-                response = self.serial.readline().decode().strip()
-
-                if response.startswith("TEMP:"):
-                    temp = float(response.split(":")[1])
-                    temp_readings.append(temp)
-                    print(f"Temperature: {temp:.2f}°C")
-
-                else:
-                    print(f"Unexpected response: {response}")
-
-            except Exception as e:
-                print(f"Serial error while reading temperature: {e}")
-                    # print("Bad reading: {:016b}".format(word))
-            # else:
-                # print("SPI read error. Bytes received:", c)
+            reading = self.temperature_source.get()
+            # Only count fresh samples, not the same cached value twice
+            if reading is not None and reading.timestamp != last_timestamp:
+                last_timestamp = reading.timestamp
+                temp_readings.append(reading.value)
+                print(f"Temperature: {reading.value:.2f}°C")
             time.sleep(0.5)
 
         if temp_readings:
             avg_temp = sum(temp_readings) / len(temp_readings)
-            # print("Average Temperature:", "{:.2f}".format(avg_temp))
-
             print(f"Average Temperature: {avg_temp:.2f}°C")
             return avg_temp
         
         else:
-            print("No temperature readings recorded. Returning fallback 0.0")
-            return 0.0
+            print(f"No temperature readings recorded (link {self.sensors.state})")
+            return None
 
     def heater_on(self, pi, heater_ssr_pin):
-        if ENABLE_HARDWARE:
-            pi.write(heater_ssr_pin, 1)
-            print("Heater turned on")
-        else:
-            print("[SIMULATED] Heater ON")
+        self.hal.set_heater(True)
+        print("Heater turned on")
 
     def heater_off(self, pi, heater_ssr_pin):
-        if ENABLE_HARDWARE:
-            pi.write(heater_ssr_pin, 0)
-            print("Heater turned off")
-
-        else:
-            print("[SIMULATED] Heater OFF")
+        self.hal.set_heater(False)
+        print("Heater turned off")
 
 
     def initialize_fans_0(self, kit, fan_channels):
@@ -2255,11 +1738,10 @@ class ThariBakhoorApp(tk.Tk):
         
     def activate_safe_mode(self):
         # Disable heater
-        if ENABLE_HARDWARE:
-            self.heater_off(self.pi, self.heater_ssr_pin)
-            self.pi.write(self.door_ssr_pin, 0)  # Unlock the door
-            # self.initialize_fans_0(self.kit, self.fan_channels)  # Turn off fans
-            self._set_fan_pwm(0)
+        self._force_safe_outputs()
+        # Stop the running session at its next await, then repeat the safe outputs on the
+        # actuator worker so a heater command already in flight cannot turn it back on
+        self.engine.cancel_session(then=self._force_safe_outputs)
 
         for widget in self.winfo_children():
             if isinstance(widget, tk.Label) and widget in [self.logo_label, self.time_label]:
@@ -2293,6 +1775,25 @@ class ThariBakhoorApp(tk.Tk):
         exit_btn.pack(pady=20)
 
 
+    def _force_safe_outputs(self):
+        self.heater_off(self.pi, self.heater_ssr_pin)
+        self.hal.set_door(False)  # Unlock the door
+        # self.initialize_fans_0(self.kit, self.fan_channels)  # Turn off fans
+        self._set_fan_pwm(0)
+
+    def _session_finished(self, name, cancelled, error):
+        # Runs on the Tk thread when a mode session ends for any reason
+        if ENABLE_HARDWARE:
+            # Where the link's time went during this session
+            print(self.esp32_bus.stats.report())
+            print(f"[Clock] {self.sensors.clock.summary()}")
+        if cancelled:
+            print(f"Session {name} cancelled.")
+        elif error is not None:
+            print(f"Session {name} stopped on error: {error}. Heater OFF.")
+            self.heater_off(self.pi, self.heater_ssr_pin)
+            self._set_fan_pwm(0)
+
     def exit_safe_mode(self):
         # Clear everything on screen
         for widget in self.winfo_children():
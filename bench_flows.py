@@ -0,0 +1,120 @@
+# Virtual-time benchmark for the person, clothes and surrounding sessions.
+#
+# Every scenario replays a full session against SimulatedBooth on a virtual
+# clock, so a 13-minute session takes milliseconds. Run it after touching
+# session_profiles, tick_scheduler or booth_hal:
+#
+#   python bench_flows.py                 # table of all scenarios
+#   python bench_flows.py --repeat 20     # steadier wall-time numbers
+#   python bench_flows.py --json out.json --fail-on-miss
+#
+# read_latency scenarios charge each sensor read virtual time, like the old
+# blocking serial round trips, to show how the scheduler absorbs it (and
+# what it skips once a tick's work outgrows the period). "control" picks the
+# heat cycle's heater control ("cycle", "pid", "hysteresis") instead of the
+# mode's default; the closed-loop controllers read the thermocouple 4x a
+# second, so their scenarios show many more reads and heater toggles.
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+
+from booth_hal import simulate_session
+
+ADULT = [(35, 75.0)]
+CHILD = [(40, 30.0)]
+# One foot on the seat first: passes through the child band on the way in
+STEPPING_IN = [(35, 25.0), (36, 60.0), (37, 76.0)]
+LATE_ENTRY = [(120, 80.0)]
+CLOTHES_LEFT_IN = [(0, 12.0), (9, 0.0)]
+OVERHEAT = [(150, 180.0), (200, 120.0)]
+
+# name, mode, heat level, speed value, simulate_session options
+SCENARIOS = [
+    ("person-low-3min", "person", "Low", 1, {"weight_script": ADULT}),
+    ("person-high-5min", "person", "High", 3, {"weight_script": ADULT}),
+    ("person-high-pid", "person", "High", 3, {"weight_script": ADULT, "control": "pid"}),
+    ("person-late-entry", "person", "Medium", 2, {"weight_script": LATE_ENTRY}),
+    ("person-child-abort", "person", "Medium", 2, {"weight_script": CHILD}),
+    ("person-stepping-in", "person", "Medium", 2, {"weight_script": STEPPING_IN}),
+    ("person-serial-50ms", "person", "Medium", 2, {"weight_script": ADULT, "read_latency": 0.05}),
+    ("person-serial-1200ms", "person", "Medium", 2, {"weight_script": ADULT, "read_latency": 1.2}),
+    ("clothes-medium", "clothes", "Medium", 2, {}),
+    ("clothes-medium-pid", "clothes", "Medium", 2, {"control": "pid"}),
+    ("clothes-left-in", "clothes", "High", 3, {"weight_script": CLOTHES_LEFT_IN}),
+    ("surrounding-medium", "surrounding", "Medium", 2, {}),
+    ("surrounding-hysteresis", "surrounding", "Medium", 2, {"control": "hysteresis"}),
+    ("surrounding-overheat", "surrounding", "High", 3, {"temperature_script": OVERHEAT}),
+]
+
+
+def run_scenario(name, mode, heat_level, speed_value, model, repeat=1):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        # The runner prints a timing line per session; keep the table clean
+        with contextlib.redirect_stdout(io.StringIO()):
+            completed, booth, runner = simulate_session(mode, heat_level, speed_value, **model)
+        wall = time.perf_counter() - started
+        best = wall if best is None else min(best, wall)
+
+    clock = runner.clock
+    return {
+        "name": name,
+        "completed": completed,
+        "wall_ms": round(best * 1000, 2),
+        "session_s": round(booth.elapsed(), 1),
+        "iterations": clock.jitter.count,
+        "sensor_reads": booth.reads,
+        "heater_toggles": sum(1 for _, output, _ in booth.events if output == "heater_on"),
+        "heater_on_s": round(booth.heater_seconds, 1),
+        "max_temp": round(booth.max_temp, 1),
+        "deadline_misses": clock.misses,
+        "max_late_ms": round(clock.jitter.max * 1000, 1),
+        "skipped_ticks": clock.skipped,
+    }
+
+
+def print_table(results):
+    columns = [
+        ("name", "scenario", 22), ("completed", "done", 5), ("wall_ms", "wall ms", 8),
+        ("session_s", "session s", 9), ("iterations", "iters", 6), ("sensor_reads", "reads", 6),
+        ("heater_toggles", "toggles", 7), ("heater_on_s", "heat s", 7), ("max_temp", "max C", 6),
+        ("deadline_misses", "misses", 6), ("max_late_ms", "late ms", 8),
+    ]
+    print("  ".join(f"{title:>{width}}" for _, title, width in columns))
+    for result in results:
+        print("  ".join(f"{str(result[key]):>{width}}" for key, _, width in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay booth sessions in virtual time")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per scenario; the fastest is reported")
+    parser.add_argument("--only", help="run scenarios whose name contains this text")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--fail-on-miss", action="store_true",
+                        help="exit 1 if a scenario without read latency misses a deadline")
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.only or args.only in s[0]]
+    results = [run_scenario(*scenario, repeat=args.repeat) for scenario in scenarios]
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.fail_on_miss:
+        failed = [r["name"] for r, s in zip(results, scenarios)
+                  if r["deadline_misses"] and not s[4].get("read_latency")]
+        if failed:
+            print(f"Deadline misses in: {', '.join(failed)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# asyncio control engine for booth sessions.
+#
+# Each session (person, clothes, surrounding) is a coroutine running as a
+# task on one event loop in a background thread. Timers are plain awaits,
+# so any number of them can be pending without an OS thread each, and a
+# session can be cancelled at any await point (Safe Mode).
+
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TkBridge:
+    """Runs callables posted from other threads on the Tk main loop.
+
+    Tk widgets must only be touched from the thread running mainloop(), so
+    workers hand work over and Tk drains it on a timer at display rate.
+
+    post() queues a one-off call (bounded; overflow is dropped and counted).
+    update(key, ...) is for state such as a status label: only the newest
+    update per key is kept until the next drain, and it is skipped if it
+    matches what that key last displayed. Neither call ever blocks.
+    """
+
+    def __init__(self, root, interval_ms=20, maxsize=256):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.dropped = 0
+        self.coalesced = 0
+        self._queue = queue.Queue(maxsize)
+        self._latest = {}
+        self._applied = {}
+        self._lock = threading.Lock()
+        self._after_id = None
+
+    def start(self):
+        self._after_id = self.root.after(self.interval_ms, self._drain)
+
+    def post(self, fn, *args):
+        # Safe to call from any thread
+        try:
+            self._queue.put_nowait((fn, args))
+        except queue.Full:
+            self.dropped += 1
+            print(f"[UI] Update queue full, dropped {fn}")
+
+    def update(self, key, fn, *args):
+        # Safe to call from any thread; replaces any pending update for key
+        with self._lock:
+            if key in self._latest:
+                self.coalesced += 1
+            self._latest[key] = (fn, args)
+
+    def _drain(self):
+        with self._lock:
+            latest, self._latest = self._latest, {}
+        for key, (fn, args) in latest.items():
+            if self._applied.get(key) == (fn, args):
+                continue
+            self._applied[key] = (fn, args)
+            self._call(fn, args)
+        while True:
+            try:
+                fn, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._call(fn, args)
+        self._after_id = self.root.after(self.interval_ms, self._drain)
+
+    def _call(self, fn, args):
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"[UI] Error in posted callback {fn}: {e}")
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+
+class BoothEngine:
+    """Event loop thread that owns the running session.
+
+    Only one session runs at a time. Everything public here is safe to call
+    from the Tk thread; the coroutine helpers (sleep, wait_for, actuate) are
+    for use inside sessions.
+    """
+
+    def __init__(self, ui_post=None):
+        self.loop = asyncio.new_event_loop()
+        self.ui_post = ui_post
+        self.session_name = None
+        self._session = None
+        self._thread = None
+        # Hardware writes run on one worker so they stay in order and a
+        # slow pigpio call never stalls the loop
+        self._actuator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="actuator")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run_loop, name="booth-engine", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def stop(self, timeout=2.0):
+        """Cancel the session, wait up to timeout s for its cleanup (heater
+        off, fans restored) to finish, then stop the loop. Not from the loop."""
+        if self._thread is None:
+            return
+
+        async def cancel_and_wait():
+            session = self._session
+            if session is not None and not session.done():
+                print(f"[Engine] Cancelling session {self.session_name}")
+                session.cancel()
+                await asyncio.wait([session], timeout=timeout)
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_and_wait(), self.loop).result(timeout + 1)
+        except Exception as e:
+            print(f"[Engine] Session cleanup did not finish: {e!r}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(2)
+        self._thread = None
+        self._actuator.shutdown(wait=False)
+
+    @property
+    def running(self):
+        return self._session is not None and not self._session.done()
+
+    def start_session(self, name, coro, on_done=None):
+        """Run coro as the current session, cancelling any previous one.
+
+        on_done(name, cancelled, error) is called on the Tk thread (via
+        ui_post) when the session ends for any reason.
+        """
+        def launch():
+            if self._session is not None and not self._session.done():
+                self._session.cancel()
+            self.session_name = name
+            self._session = self.loop.create_task(coro, name=name)
+            self._session.add_done_callback(lambda task: self._finished(name, task, on_done))
+
+        self.loop.call_soon_threadsafe(launch)
+
+    def cancel_session(self, then=None):
+        """Cancel the running session; it sees CancelledError at its next await.
+
+        then() is queued on the actuator worker right after the cancel, so it
+        runs after any hardware command the session already had in flight.
+        """
+        def cancel():
+            if self._session is not None and not self._session.done():
+                print(f"[Engine] Cancelling session {self.session_name}")
+                self._session.cancel()
+            if then is not None:
+                self._actuator.submit(then)
+
+        self.loop.call_soon_threadsafe(cancel)
+
+    def _finished(self, name, task, on_done):
+        cancelled = task.cancelled()
+        error = None if cancelled else task.exception()
+        if error is not None:
+            print(f"[Engine] Session {name} failed: {error!r}")
+        if on_done is not None:
+            self.call_ui(on_done, name, cancelled, error)
+
+    def call_ui(self, fn, *args):
+        # Hand fn over to the Tk thread; called directly without a bridge
+        if self.ui_post is not None:
+            self.ui_post(fn, *args)
+        else:
+            fn(*args)
+
+    # ----- Awaitables for use inside sessions -----
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    async def wait_for(self, predicate, timeout=None, poll=1.0):
+        """Wait until predicate() is true. Returns False on timeout."""
+        deadline = None if timeout is None else self.loop.time() + timeout
+        while not predicate():
+            if deadline is not None and self.loop.time() >= deadline:
+                return False
+            await asyncio.sleep(poll)
+        return True
+
+    async def actuate(self, fn, *args):
+        # Run a hardware command on the actuator worker and wait for it
+        return await self.loop.run_in_executor(self._actuator, fn, *args)
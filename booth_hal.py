@@ -0,0 +1,269 @@
+# Hardware abstraction for the booth: heater SSR, door SSR, fan PWM, weight
+# and temperature.
+#
+# PigpioBooth drives the real Pi outputs and reads the ESP32 sensors.
+# SimulatedBooth replaces all of it with a thermal model of the chamber that
+# runs on any clock; with a VirtualClock and VirtualTimeLoop a full session
+# replays in milliseconds (see simulate_session()).
+
+import asyncio
+import selectors
+import threading
+import time
+
+from session_profiles import SessionRunner, build_session
+
+
+class PigpioBooth:
+    """The real booth: SSRs and fan on pigpio, sensors from the SensorService.
+
+    weight() and temperature() return None when there is no reading younger
+    than the service's stale_after (link lost, or not started yet).
+    temperature_source (a temperature_sources.TemperatureSource) replaces
+    the ESP32 thermocouple reading, e.g. to prefer direct SPI, and
+    weight_source (e.g. hx711_pigpio.PigpioHX711.weight) the ESP32 load cell.
+    """
+
+    def __init__(self, pi, sensors, heater_pin=4, door_pin=17, fan_pin=18, temperature_source=None,
+                 weight_source=None):
+        self.pi = pi
+        self.sensors = sensors
+        self.weight_source = weight_source if weight_source is not None else sensors.weight
+        self.temperature_source = temperature_source if temperature_source is not None else sensors.temperature
+        self.heater_pin = heater_pin
+        self.door_pin = door_pin
+        self.fan_pin = fan_pin
+
+    def set_heater(self, on):
+        self.pi.write(self.heater_pin, 1 if on else 0)
+
+    def set_door(self, locked):
+        self.pi.write(self.door_pin, 1 if locked else 0)
+
+    def set_fan(self, percent):
+        # pigpio duty cycle is 0-255
+        self.pi.set_PWM_dutycycle(self.fan_pin, int(percent * 255 / 100))
+
+    def weight(self):
+        return self.weight_source.fresh(self.sensors.stale_after)
+
+    def temperature(self):
+        return self.temperature_source.fresh(self.sensors.stale_after)
+
+
+class SimulatedBooth:
+    """Two-node thermal model of the chamber, integrated lazily on any clock.
+
+    The heating element (which the thermocouple sits next to) gets heater
+    power and passes heat to the chamber air; the chamber loses heat to the
+    room, faster with the fan running:
+
+        Ce * dTe/dt = P * heater - Gec * (Te - Tc)
+        Cc * dTc/dt = Gec * (Te - Tc) - (G0 + Gf * fan) * (Tc - Ta)
+
+    Occupancy comes from weight_script, a list of (seconds, kg) steps
+    relative to construction time; temperature_script (seconds, degC) steps
+    override the model's reading the same way. read_latency makes every
+    sensor read cost that much clock time, like a blocking serial round
+    trip (only with a clock that has advance(), i.e. VirtualClock). Every
+    output change is kept in `events`.
+    """
+
+    def __init__(self, clock=time.monotonic, ambient=25.0, heater_watts=1500.0,
+                 element_capacity=800.0, chamber_capacity=20000.0, coupling=8.0,
+                 loss=10.0, fan_loss=20.0, weight_script=None, temperature_script=None,
+                 read_latency=0.0, verbose=False):
+        self.clock = clock
+        self.ambient = ambient
+        self.heater_watts = heater_watts
+        self.element_capacity = element_capacity
+        self.chamber_capacity = chamber_capacity
+        self.coupling = coupling
+        self.loss = loss
+        self.fan_loss = fan_loss
+        self.weight_script = sorted(weight_script or [])
+        self.temperature_script = sorted(temperature_script or [])
+        self.read_latency = read_latency
+        self.verbose = verbose
+        self.heater_on = False
+        self.door_locked = True
+        self.fan_percent = 0
+        self.element_temp = ambient
+        self.chamber_temp = ambient
+        self.max_temp = ambient
+        self.heater_seconds = 0.0
+        self.reads = 0
+        self.events = []
+        self._start = clock()
+        self._last = self._start
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return self.clock() - self._start
+
+    def _advance(self):
+        now = self.clock()
+        dt = now - self._last
+        self._last = now
+        # Element time constant is ~100 s, so 0.5 s Euler steps are plenty
+        while dt > 0:
+            step = min(dt, 0.5)
+            dt -= step
+            power = self.heater_watts if self.heater_on else 0.0
+            to_chamber = self.coupling * (self.element_temp - self.chamber_temp)
+            to_room = (self.loss + self.fan_loss * self.fan_percent / 100.0) * (self.chamber_temp - self.ambient)
+            self.element_temp += step * (power - to_chamber) / self.element_capacity
+            self.chamber_temp += step * (to_chamber - to_room) / self.chamber_capacity
+            if self.heater_on:
+                self.heater_seconds += step
+        if self.element_temp > self.max_temp:
+            self.max_temp = self.element_temp
+
+    def _set(self, name, value):
+        with self._lock:
+            self._advance()
+            if getattr(self, name) == value:
+                return
+            setattr(self, name, value)
+            self.events.append((self.elapsed(), name, value))
+        if self.verbose:
+            print(f"[SIMULATED] {name} -> {value}")
+
+    def set_heater(self, on):
+        self._set("heater_on", bool(on))
+
+    def set_door(self, locked):
+        self._set("door_locked", bool(locked))
+
+    def set_fan(self, percent):
+        self._set("fan_percent", percent)
+
+    def _read(self):
+        self.reads += 1
+        if self.read_latency:
+            self.clock.advance(self.read_latency)
+
+    def _scripted(self, script, default):
+        value = default
+        elapsed = self.elapsed()
+        for at, step in script:
+            if at > elapsed:
+                break
+            value = step
+        return value
+
+    def weight(self):
+        self._read()
+        return self._scripted(self.weight_script, 0.0)
+
+    def temperature(self):
+        self._read()
+        with self._lock:
+            self._advance()
+            model = round(self.element_temp, 2)
+        return self._scripted(self.temperature_script, model)
+
+
+class HalIO:
+    """Adapts a booth HAL to the io interface SessionRunner expects.
+
+    With actuate (BoothEngine.actuate) the output commands run on the
+    engine's actuator worker; without it they are called inline, which is
+    what simulated runs want. weight() and temperature() pass None through
+    for a missing or stale reading; the runner treats that as unsafe.
+    occupancy is a weight_pipeline.WeightPipeline fed by the weight sensor
+    at its own rate; without one the runner filters its weight() reads.
+    """
+
+    def __init__(self, hal, actuate=None, status=None, occupancy=None):
+        self.hal = hal
+        self.actuate = actuate
+        self.on_status = status
+        self.occupancy = occupancy
+
+    async def _do(self, fn, *args):
+        if self.actuate is None:
+            fn(*args)
+        else:
+            await self.actuate(fn, *args)
+
+    async def heater(self, on):
+        await self._do(self.hal.set_heater, on)
+
+    async def fan(self, percent):
+        await self._do(self.hal.set_fan, percent)
+
+    async def door(self, locked):
+        await self._do(self.hal.set_door, locked)
+
+    def weight(self):
+        return self.hal.weight()
+
+    def temperature(self):
+        return self.hal.temperature()
+
+    def status(self, message):
+        if self.on_status is not None:
+            self.on_status(message)
+
+
+# ----- Virtual time -----
+
+class VirtualClock:
+    """Manually advanced clock; call it like time.monotonic()."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    # Instead of blocking until the next timer, jump the clock to it
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        if timeout is not None and timeout > 0:
+            self.clock.advance(timeout)
+            timeout = 0
+        return super().select(timeout)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop whose time() is a VirtualClock.
+
+    Whenever every task is waiting on a timer the loop advances the clock
+    straight to the earliest one, so sleeps cost no wall time. Only use it
+    for code whose waits are all asyncio timers (no executor threads).
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock if clock is not None else VirtualClock()
+        super().__init__(_VirtualSelector(self.clock))
+
+    def time(self):
+        return self.clock.now
+
+
+def simulate_session(mode, heat_level="Medium", speed_value=1, status=None, control=None, **model):
+    """Run one full session against SimulatedBooth in virtual time.
+
+    control overrides the mode's heater control (see build_session); model
+    is passed to SimulatedBooth (weight_script, read_latency, ...).
+    Returns (completed, booth, runner); booth.events has every output edge.
+    """
+    loop = VirtualTimeLoop()
+    booth = SimulatedBooth(clock=loop.clock, **model)
+    phases = build_session(mode, heat_level, speed_value, control)
+    runner = SessionRunner(phases, HalIO(booth, status=status))
+    try:
+        completed = loop.run_until_complete(runner.run())
+    finally:
+        loop.close()
+    return completed, booth, runner
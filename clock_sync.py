@@ -0,0 +1,122 @@
+# Alignment between the ESP32's millis() clock and time.monotonic() on the Pi.
+#
+# Each "sync" round trip gives one measurement: the ESP32's millis() was
+# read somewhere between our send and receive times, so
+#
+#     esp = offset + (1 + drift) * pi     with  pi ~ (sent + received) / 2
+#
+# and the error is at most half the round trip. ClockSync keeps the recent
+# measurements, fits offset and drift by least squares over the ones with
+# the shortest round trips (the least delayed), and converts firmware
+# capture stamps to Pi monotonic time with to_local().
+
+import threading
+
+MILLIS_WRAP = 1 << 32  # millis() is a uint32
+REBOOT_JUMP_MS = 1000  # A sync reading this far behind the last one is a reboot
+MIN_DRIFT_SPAN = 10.0  # Seconds of sync history needed before estimating drift
+
+
+class ClockSync:
+    """Running offset/drift estimate between the ESP32 and Pi clocks.
+
+    keep is how many measurements are remembered, best how many of the
+    lowest-latency ones the fit uses. A millis() value far below the last
+    one means the ESP32 rebooted; the estimate then starts over.
+    """
+
+    def __init__(self, keep=32, best=8):
+        self.keep = keep
+        self.best = best
+        self.offset = None  # ESP32 seconds minus Pi seconds, at pi_ref
+        self.drift = 0.0    # ESP32 seconds gained per Pi second
+        self.pi_ref = 0.0
+        self.resets = 0
+        self._samples = []  # (pi_mid, esp_seconds, round_trip)
+        self._last_raw = None
+        self._wraps = 0
+        self._lock = threading.Lock()
+
+    def unwrap(self, millis):
+        # 32-bit millis() -> seconds since ESP32 boot, across the 49.7 day
+        # wrap. Only sync readings advance the wrap count; stamps are placed
+        # relative to the last one.
+        with self._lock:
+            return self._unwrap(millis)
+
+    def _unwrap(self, millis):
+        wraps = self._wraps
+        if self._last_raw is not None:
+            if self._last_raw - millis > MILLIS_WRAP // 2:
+                wraps += 1
+            elif millis - self._last_raw > MILLIS_WRAP // 2:
+                wraps -= 1
+        return (millis + wraps * MILLIS_WRAP) / 1000.0
+
+    def add(self, sent, millis, received):
+        """Record one sync round trip (Pi monotonic times, ESP32 millis)."""
+        with self._lock:
+            if self._last_raw is not None and REBOOT_JUMP_MS < self._last_raw - millis < MILLIS_WRAP // 2:
+                self._reset()
+            esp = self._unwrap(millis)
+            if self._last_raw is not None and self._last_raw - millis > MILLIS_WRAP // 2:
+                self._wraps += 1
+            self._last_raw = millis
+            self._samples.append(((sent + received) / 2.0, esp, received - sent))
+            del self._samples[:-self.keep]
+            self._fit()
+
+    def _reset(self):
+        print("[Clock] ESP32 clock went backwards (reboot?), restarting sync")
+        self._samples.clear()
+        self._last_raw = None
+        self._wraps = 0
+        self.offset = None
+        self.drift = 0.0
+        self.resets += 1
+
+    def _fit(self):
+        best = sorted(self._samples, key=lambda sample: sample[2])[:self.best]
+        n = len(best)
+        pi_mean = sum(pi for pi, _, _ in best) / n
+        esp_mean = sum(esp for _, esp, _ in best) / n
+        spread = sum((pi - pi_mean) ** 2 for pi, _, _ in best)
+        # Drift needs the points spread out in time, or millisecond rounding
+        # alone looks like hundreds of ppm
+        span = max(pi for pi, _, _ in best) - min(pi for pi, _, _ in best)
+        if n >= 3 and span >= MIN_DRIFT_SPAN:
+            slope = sum((pi - pi_mean) * (esp - esp_mean) for pi, esp, _ in best) / spread
+            self.drift = slope - 1.0
+        self.pi_ref = pi_mean
+        self.offset = esp_mean - pi_mean
+
+    @property
+    def synced(self):
+        return self.offset is not None
+
+    @property
+    def uncertainty(self):
+        # Half the shortest round trip bounds the offset error
+        with self._lock:
+            if not self._samples:
+                return None
+            return min(rtt for _, _, rtt in self._samples) / 2.0
+
+    def to_local(self, millis):
+        """Pi monotonic time at which the ESP32 clock read millis, or None
+        before the first sync."""
+        with self._lock:
+            if self.offset is None:
+                return None
+            esp = self._unwrap(millis)
+            # esp = pi + offset + drift * (pi - pi_ref), solved for pi
+            return (esp - self.offset + self.drift * self.pi_ref) / (1.0 + self.drift)
+
+    def drift_ppm(self):
+        return self.drift * 1e6
+
+    def summary(self):
+        if self.offset is None:
+            return "not synced"
+        return (f"offset {self.offset:.3f} s, drift {self.drift_ppm():+.1f} ppm, "
+                f"±{self.uncertainty * 1000:.1f} ms")
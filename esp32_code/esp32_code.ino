@@ -1,3 +1,4 @@
+#include <Preferences.h>
 #include "HX711.h"
 #include "max6675.h"
 
@@ -13,19 +14,98 @@
 HX711 scale;
 MAX6675 thermocouple(MAX6675_CLK, MAX6675_CS, MAX6675_DO);
 
+// Load cell calibration, kept in NVS (namespace "scale") so every booth
+// boots with its own zero and factor instead of re-taring with whatever is
+// in the chamber. Only the very first boot tares. "tare" re-zeroes now and
+// answers "TARE:<kg removed>"; "cal" answers "CAL:<offset>,<factor>" and
+// "cal <factor>" stores a new factor (see weight_sensor_calibration.ino).
+#define DEFAULT_SCALE_FACTOR 21.813
+#define TARE_SAMPLES 10
+Preferences prefs;
+float scaleFactor = DEFAULT_SCALE_FACTOR;
+
+// Push mode: when streamIntervalMs > 0 the ESP32 sends KG:/TEMP: frames on
+// its own schedule instead of waiting for get_weight/get_temp requests.
+#define STREAM_MIN_INTERVAL_MS 100
+unsigned long streamIntervalMs = 0;
+unsigned long lastStreamMs = 0;
+
+// Binary mode: after "binary on" sensor values go out as
+//   0xA5 | type | seq | len | int32 value*100 (little-endian) | crc8
+// instead of KG:/TEMP: text lines. Acks and errors stay text.
+#define FRAME_SYNC 0xA5
+#define MSG_WEIGHT 0x01
+#define MSG_TEMP   0x02
+bool binaryMode = false;
+uint8_t frameSeq = 0;
+
+// Timestamps: after "timestamps on" every KG:/TEMP: value carries the
+// millis() at which it was sampled ("KG:12.34@81234"), and binary frames
+// append it as a uint32 after the value (len 8). "sync" answers
+// "SYNC:<millis>" so the Pi can map these stamps onto its own clock.
+bool timestampMode = false;
+
+// Requests may end in "#<id>" (e.g. "get_weight#12"). The id is echoed at
+// the end of the reply line ("KG:3.20#12") so the Pi can pipeline several
+// requests and match each reply to its caller. Pushed frames carry no id.
+String replyTag = "";
+
+// Link speed: "baud <rate>" answers "BAUD:<rate>" at the old rate and then
+// switches Serial2. The Pi confirms with a ping at the new rate; without it
+// the link drops back to the previous rate after BAUD_CONFIRM_MS, so a rate
+// the Pi's UART cannot hold never strands the link.
+#define BOOT_BAUD 9600
+#define BAUD_CONFIRM_MS 1000
+const unsigned long SUPPORTED_BAUDS[] = {9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600};
+unsigned long linkBaud = BOOT_BAUD;
+unsigned long previousBaud = BOOT_BAUD;
+unsigned long baudSwitchMs = 0;
+bool baudPending = false;
+
+// Load cell ring buffer: loop() stores a sample whenever the HX711 has a
+// conversion ready (10 SPS by default), so get_weight answers from memory
+// instead of blocking ~500 ms in get_units(5).
+#define WEIGHT_RING_SIZE 16
+#define WEIGHT_FILTER_SAMPLES 5
+float weightRing[WEIGHT_RING_SIZE];
+uint8_t weightRingHead = 0;
+uint8_t weightRingCount = 0;
+unsigned long lastWeightSampleMs = 0;
+unsigned long weightSampleTotal = 0;
+
+// Thermocouple cache: a MAX6675 conversion takes ~220 ms and reading the
+// chip early aborts it, so loop() reads it once per conversion period and
+// get_temp answers from the filtered cache. On an open thermocouple the
+// last good value is kept and tempFault is set (see temp_stats).
+#define MAX6675_CONVERSION_MS 250
+#define TEMP_FILTER_SAMPLES 4
+float tempRing[TEMP_FILTER_SAMPLES];
+uint8_t tempRingHead = 0;
+uint8_t tempRingCount = 0;
+float cachedTemp = 0;
+bool tempFault = false;
+unsigned long lastTempReadMs = 0;
+unsigned long lastTempSampleMs = 0;
+
 void setup() {
   Serial.begin(115200);      
-  Serial2.begin(9600, SERIAL_8N1, 16, 17);  // Serial2: RX=16, TX=17
+  Serial2.begin(BOOT_BAUD, SERIAL_8N1, 16, 17);  // Serial2: RX=16, TX=17
 
   // Initialize HX711
   scale.begin(HX711_DOUT, HX711_SCK);
   delay(500);
+  prefs.begin("scale", false);
+  scaleFactor = prefs.getFloat("factor", DEFAULT_SCALE_FACTOR);
+  scale.set_scale(scaleFactor);
   if (!scale.is_ready()) {
     Serial.println("HX711 not found.");
+  } else if (prefs.isKey("offset")) {
+    scale.set_offset(prefs.getLong("offset"));
+    Serial.println("HX711 ready, stored calibration loaded.");
   } else {
-    Serial.println("HX711 ready.");
-    scale.set_scale(21.813);  // Replace with actual calibration factor
-    scale.tare();             
+    scale.tare(TARE_SAMPLES);
+    saveCalibration();
+    Serial.println("HX711 ready, first boot tare stored.");
   }
 
   // Initialize MAX6675
@@ -34,38 +114,331 @@ void setup() {
 }
 
 void loop() {
-  if (Serial2.available()) {
+  // Drain every queued command so pipelined requests are all answered now
+  while (Serial2.available()) {
     String command = Serial2.readStringUntil('\n');
     command.trim();
+    handleCommand(command);
+  }
 
-    if (command == "get_weight") {
-      float weight = scale.get_units(5);  // Average of 5 readings
-      if (weight < 0) weight = 0;
-      Serial2.print("KG:");
-      Serial2.println(weight, 2);  
-      Serial.print("KG:");
-      Serial.println(weight, 2);
+  sampleWeight();
+  sampleTemp();
+  checkBaudConfirm();
+
+  if (streamIntervalMs > 0 && millis() - lastStreamMs >= streamIntervalMs) {
+    lastStreamMs = millis();
+    sendWeight(readWeight());
+    sendTemp(readTemp());
+  }
+
+  delay(5);  // Commands and the HX711 are polled every pass
+}
+
+void handleCommand(String command) {
+  if (command.length() == 0) return;  // Stray line ending, nothing to answer
+
+  int tagPos = command.indexOf('#');
+  if (tagPos >= 0) {
+    replyTag = command.substring(tagPos + 1);
+    command = command.substring(0, tagPos);
+    command.trim();
+  }
+
+  if (command == "ping") {
+    baudPending = false;  // Arrived at the new rate, keep it
+    Serial2.print("PONG");
+    endReply();
+  }
+  else if (command == "get_weight") {
+    sendWeight(readWeight());
+  }
+  else if (command == "get_all") {
+    sendAll();
+  }
+  else if (command == "weight_stats") {
+    sendWeightStats(readWeight());
+  }
+  else if (command == "temp_stats") {
+    sendTempStats(readTemp());
+  }
+  else if (command == "get_temp") {
+    sendTemp(readTemp());
+  }
+  else if (command.startsWith("stream")) {
+    // "stream <ms>" starts pushing frames every <ms>, "stream off" stops
+    String arg = command.substring(6);
+    arg.trim();
+    if (arg == "off" || arg == "0") {
+      streamIntervalMs = 0;
+    } else {
+      long interval = arg.toInt();
+      if (interval < STREAM_MIN_INTERVAL_MS) interval = STREAM_MIN_INTERVAL_MS;
+      streamIntervalMs = interval;
+      lastStreamMs = 0;
     }
-    else if (command == "get_temp") {
-      // float tempC = thermocouple.readCelsius();
-      float totalTemp = 0.0;
-      int numReadings = 5;
-      for (int i = 0; i < numReadings; i++) {
-        totalTemp += thermocouple.readCelsius();
-        delay(50);  // Small delay between readings
-      }
-      float avgTemp = totalTemp / numReadings;
-      Serial2.print("TEMP:");
-      // Serial2.println(tempC, 2);          // Send temperature in °C
-      Serial2.println(avgTemp, 2);          // Send average temperature in °C
-      Serial.print("TEMP:");
-      // Serial.println(tempC, 2); 
-      Serial.println(avgTemp, 2); 
+    Serial2.print("STREAM:");
+    Serial2.print(streamIntervalMs);
+    endReply();
+  }
+  else if (command == "sync") {
+    Serial2.print("SYNC:");
+    Serial2.print(millis());
+    endReply();
+  }
+  else if (command == "timestamps on" || command == "timestamps off") {
+    timestampMode = (command == "timestamps on");
+    Serial2.print("TIMESTAMPS:");
+    Serial2.print(timestampMode ? 1 : 0);
+    endReply();
+  }
+  else if (command == "binary on" || command == "binary off") {
+    binaryMode = (command == "binary on");
+    Serial2.print("BINARY:");
+    Serial2.print(binaryMode ? 1 : 0);
+    endReply();
+  }
+  else if (command == "tare") {
+    float removed = tareScale();
+    Serial2.print("TARE:");
+    Serial2.print(removed, 2);
+    endReply();
+  }
+  else if (command.startsWith("cal")) {
+    // "cal" reports, "cal <factor>" stores a new factor first
+    String arg = command.substring(3);
+    arg.trim();
+    float factor = arg.toFloat();
+    if (factor != 0) {
+      scaleFactor = factor;
+      scale.set_scale(scaleFactor);
+      saveCalibration();
     }
-    else {
-      Serial2.println("Invalid command");
+    Serial2.print("CAL:");
+    Serial2.print(scale.get_offset());
+    Serial2.print(',');
+    Serial2.print(scaleFactor, 4);
+    endReply();
+  }
+  else if (command.startsWith("baud")) {
+    // An unsupported rate answers with the rate in use and changes nothing
+    unsigned long rate = command.substring(4).toInt();
+    bool supported = isSupportedBaud(rate);
+    Serial2.print("BAUD:");
+    Serial2.print(supported ? rate : linkBaud);
+    endReply();
+    if (supported && rate != linkBaud) {
+      previousBaud = linkBaud;
+      setLinkBaud(rate);
+      // Going back to the boot rate (the Pi closing the port) needs no ping
+      baudPending = (rate != BOOT_BAUD);
+      baudSwitchMs = millis();
     }
   }
+  else {
+    Serial2.print("Invalid command");
+    endReply();
+  }
 
-  delay(50);  // Prevent flooding
-}
\ No newline at end of file
+  replyTag = "";
+}
+
+void endReply() {
+  if (replyTag.length() > 0) {
+    Serial2.print('#');
+    Serial2.print(replyTag);
+  }
+  Serial2.println();
+}
+
+bool isSupportedBaud(unsigned long rate) {
+  for (size_t i = 0; i < sizeof(SUPPORTED_BAUDS) / sizeof(SUPPORTED_BAUDS[0]); i++) {
+    if (SUPPORTED_BAUDS[i] == rate) return true;
+  }
+  return false;
+}
+
+void setLinkBaud(unsigned long rate) {
+  Serial2.flush();  // Let the reply finish at the old rate
+  Serial2.updateBaudRate(rate);
+  linkBaud = rate;
+  Serial.print("Serial2 baud: ");
+  Serial.println(rate);
+}
+
+void checkBaudConfirm() {
+  if (baudPending && millis() - baudSwitchMs >= BAUD_CONFIRM_MS) {
+    baudPending = false;
+    Serial.println("Baud switch not confirmed, reverting");
+    setLinkBaud(previousBaud);
+  }
+}
+
+float readWeight() {
+  return filteredWeight();  // Already sampled in loop(), never waits on the HX711
+}
+
+float readTemp() {
+  return cachedTemp;  // Averaged over the last conversions in loop()
+}
+
+void sampleWeight() {
+  if (!scale.is_ready()) return;
+  // is_ready() means a conversion is waiting, so this read does not block
+  weightRing[weightRingHead] = scale.get_units(1);
+  weightRingHead = (weightRingHead + 1) % WEIGHT_RING_SIZE;
+  if (weightRingCount < WEIGHT_RING_SIZE) weightRingCount++;
+  lastWeightSampleMs = millis();
+  weightSampleTotal++;
+}
+
+// Re-zeroes the load cell and stores the new offset. Blocks for
+// TARE_SAMPLES conversions (~1 s at 10 SPS). Returns the weight removed.
+float tareScale() {
+  long before = scale.get_offset();
+  scale.tare(TARE_SAMPLES);
+  saveCalibration();
+  weightRingCount = 0;  // Older samples are on the old zero
+  return (scale.get_offset() - before) / scaleFactor;
+}
+
+void saveCalibration() {
+  prefs.putLong("offset", scale.get_offset());
+  prefs.putFloat("factor", scaleFactor);
+}
+
+uint8_t filterSampleCount() {
+  return weightRingCount < WEIGHT_FILTER_SAMPLES ? weightRingCount : WEIGHT_FILTER_SAMPLES;
+}
+
+// Mean of the newest samples, the same average get_units(5) used to take
+float filteredWeight() {
+  uint8_t n = filterSampleCount();
+  if (n == 0) return 0;
+  float sum = 0;
+  for (uint8_t i = 1; i <= n; i++) {
+    sum += weightRing[(weightRingHead + WEIGHT_RING_SIZE - i) % WEIGHT_RING_SIZE];
+  }
+  float weight = sum / n;
+  return (weight < 0) ? 0 : weight;
+}
+
+void sampleTemp() {
+  if (millis() - lastTempReadMs < MAX6675_CONVERSION_MS) return;
+  lastTempReadMs = millis();
+  float tempC = thermocouple.readCelsius();
+  if (isnan(tempC)) {
+    tempFault = true;  // MAX6675 open-circuit bit (D2)
+    return;
+  }
+  tempFault = false;
+  tempRing[tempRingHead] = tempC;
+  tempRingHead = (tempRingHead + 1) % TEMP_FILTER_SAMPLES;
+  if (tempRingCount < TEMP_FILTER_SAMPLES) tempRingCount++;
+  float sum = 0;
+  for (uint8_t i = 0; i < tempRingCount; i++) sum += tempRing[i];
+  cachedTemp = sum / tempRingCount;
+  lastTempSampleMs = millis();
+}
+
+// "ALL:<kg>,<degC>,<weight age ms>,<temp age ms>,<temp fault 0/1>"
+// Both values come from the caches at the same instant, so one round trip
+// replaces get_weight + get_temp without skew between them.
+void sendAll() {
+  unsigned long now = millis();
+  Serial2.print("ALL:");
+  Serial2.print(readWeight(), 2);
+  Serial2.print(',');
+  Serial2.print(readTemp(), 2);
+  Serial2.print(',');
+  Serial2.print(weightSampleTotal > 0 ? now - lastWeightSampleMs : 0);
+  Serial2.print(',');
+  Serial2.print(tempRingCount > 0 ? now - lastTempSampleMs : 0);
+  Serial2.print(',');
+  Serial2.print(tempFault ? 1 : 0);
+  endReply();
+}
+
+// "TSTAT:<degC>,<age ms>,<fault 0/1>"
+void sendTempStats(float tempC) {
+  Serial2.print("TSTAT:");
+  Serial2.print(tempC, 2);
+  Serial2.print(',');
+  Serial2.print(tempRingCount > 0 ? millis() - lastTempSampleMs : 0);
+  Serial2.print(',');
+  Serial2.print(tempFault ? 1 : 0);
+  endReply();
+}
+
+// "WSTAT:<kg>,<age ms>,<samples averaged>,<samples since boot>"
+void sendWeightStats(float weight) {
+  Serial2.print("WSTAT:");
+  Serial2.print(weight, 2);
+  Serial2.print(',');
+  Serial2.print(weightSampleTotal > 0 ? millis() - lastWeightSampleMs : 0);
+  Serial2.print(',');
+  Serial2.print(filterSampleCount());
+  Serial2.print(',');
+  Serial2.print(weightSampleTotal);
+  endReply();
+}
+
+void sendWeight(float weight) {
+  unsigned long stamp = lastWeightSampleMs;
+  if (binaryMode) {
+    sendFrame(MSG_WEIGHT, weight, stamp);
+  } else {
+    Serial2.print("KG:");
+    Serial2.print(weight, 2);
+    printStamp(stamp);
+    endReply();
+  }
+  Serial.print("KG:");
+  Serial.println(weight, 2);
+}
+
+void sendTemp(float tempC) {
+  unsigned long stamp = lastTempSampleMs;
+  if (binaryMode) {
+    sendFrame(MSG_TEMP, tempC, stamp);
+  } else {
+    Serial2.print("TEMP:");
+    Serial2.print(tempC, 2);
+    printStamp(stamp);
+    endReply();
+  }
+  Serial.print("TEMP:");
+  Serial.println(tempC, 2);
+}
+
+// CRC-8/ATM (poly 0x07, init 0x00), same as esp32_protocol.crc8 on the Pi
+uint8_t crc8(const uint8_t *data, size_t len) {
+  uint8_t crc = 0;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+    }
+  }
+  return crc;
+}
+
+void printStamp(unsigned long stamp) {
+  if (!timestampMode) return;
+  Serial2.print('@');
+  Serial2.print(stamp);
+}
+
+void sendFrame(uint8_t msgType, float value, unsigned long stamp) {
+  int32_t fixed = (int32_t)lroundf(value * 100.0f);
+  uint32_t captured = stamp;
+  uint8_t len = timestampMode ? 8 : 4;
+  uint8_t frame[13];
+  frame[0] = FRAME_SYNC;
+  frame[1] = msgType;
+  frame[2] = frameSeq++;
+  frame[3] = len;
+  memcpy(&frame[4], &fixed, 4);  // ESP32 is little-endian
+  if (timestampMode) memcpy(&frame[8], &captured, 4);
+  frame[4 + len] = crc8(&frame[1], 3 + len);
+  Serial2.write(frame, 5 + len);
+}
@@ -0,0 +1,443 @@
+# Software ESP32 sensor board on a pseudo-terminal.
+#
+# Speaks the same serial protocol as esp32_webserver_weight_temp.ino
+# (request tags, get_all, stats, stream and binary modes, baud switching,
+# the forced low/high web modes), so SerialBus, SensorService, the app and
+# the scripts in "5. testing" run unchanged without hardware:
+#
+#   python esp32_emulator.py --weight 72 --temperature 95 --noise 0.2
+#   [Emulator] ESP32 emulator on /dev/pts/5
+#   ESP32_PORT=/dev/pts/5 python "5. testing/weight.py"
+#
+# latency, noise and the fault rates make it usable for load tests:
+# with latency 0 it answers several thousand requests per second.
+
+import argparse
+import heapq
+import os
+import random
+import select
+import termios
+import threading
+import time
+import tty
+
+from esp32_protocol import MSG_TEMP, MSG_WEIGHT, encode_frame
+
+STREAM_MIN_INTERVAL_MS = 100
+SUPPORTED_BAUDS = (9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600)
+BAUD_CONFIRM_S = 1.0
+
+# termios speed constant -> baud, to see the rate the client set on the pty
+_TERMIOS_BAUDS = {getattr(termios, f"B{rate}"): rate for rate in SUPPORTED_BAUDS if hasattr(termios, f"B{rate}")}
+
+# Values the web routes force (/temp/low, /weight/high, ...)
+FORCED_TEMPS = {"low": 25.0, "high": 400.0}
+FORCED_WEIGHTS = {"low": 0.0, "high": 60.0}
+
+# Firmware sampling rates, used for the ages in get_all/weight_stats/temp_stats
+HX711_PERIOD_MS = 100
+MAX6675_PERIOD_MS = 250
+WEIGHT_FILTER_SAMPLES = 5
+TARE_SECONDS = 1.0  # scale.tare(10) at 10 SPS
+DEFAULT_SCALE_FACTOR = 21.813
+
+
+class ESP32Emulator:
+    """Answers ESP32 commands on the master side of a pty.
+
+    weight and temperature are numbers or callables taking the seconds
+    since start(). Fault injection, per request: drop_rate (no reply),
+    reject_rate ("Invalid command"), corrupt_rate (one byte of the reply
+    flipped). temp_fault emulates an open thermocouple: the last value is
+    kept and the fault flag set. legacy=True emulates the original
+    firmware: only get_weight/get_temp, no request tags.
+
+    The client's line rate is read back from the pty; bytes sent at a rate
+    other than the emulated UART's are lost, so "baud" negotiation, its
+    confirm timeout and a reboot back to 9600 behave like the real link.
+    Above max_baud the switch is acked but nothing gets through, like a
+    Pi UART that cannot hold the rate.
+
+    millis() starts at clock_offset_ms and runs clock_drift_ppm fast, to
+    exercise ClockSync; a reboot() restarts it from 0.
+
+    zero_drift_kg_per_h makes the load cell's zero wander like it does
+    over a day of heating; "tare" removes it (and any load) again, and the
+    zero and "cal" factor survive a reboot like the firmware's NVS copy.
+    """
+
+    def __init__(self, weight=0.0, temperature=25.0, latency=0.0, noise=0.0,
+                 drop_rate=0.0, reject_rate=0.0, corrupt_rate=0.0, temp_fault=False,
+                 legacy=False, max_baud=None, clock_offset_ms=0, clock_drift_ppm=0.0,
+                 zero_drift_kg_per_h=0.0, seed=None, verbose=False):
+        self.weight = weight
+        self.temperature = temperature
+        self.latency = latency
+        self.noise = noise
+        self.drop_rate = drop_rate
+        self.reject_rate = reject_rate
+        self.corrupt_rate = corrupt_rate
+        self.temp_fault = temp_fault
+        self.legacy = legacy
+        self.max_baud = max_baud
+        self.clock_offset_ms = clock_offset_ms
+        self.clock_drift_ppm = clock_drift_ppm
+        self.zero_drift_kg_per_h = zero_drift_kg_per_h
+        self.tare_kg = 0.0
+        self.scale_factor = DEFAULT_SCALE_FACTOR
+        self.verbose = verbose
+        self.temp_mode = "realtime"
+        self.weight_mode = "realtime"
+        self.commands = 0
+        self.replies = 0
+        self.dropped = 0
+        self.garbled = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.port = None
+        self._random = random.Random(seed)
+        self._master = None
+        self._slave = None
+        self._outbox = []  # heap of (due, order, bytes)
+        self._order = 0
+        self._buffer = b""
+        self._started = None
+        self._last_temp = None
+        self._thread = None
+        self._reboot_request = None
+        self._stop_event = threading.Event()
+        self._reset_link_state()
+
+    def _reset_link_state(self):
+        # What a reboot clears
+        self.stream_ms = 0
+        self.binary = False
+        self.timestamps = False
+        self.baud = SUPPORTED_BAUDS[0]
+        self._previous_baud = self.baud
+        self._baud_deadline = None
+        self._frame_seq = 0
+        self._next_push = None
+        self._silent_until = 0.0
+
+    # ----- Control -----
+
+    def start(self):
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)  # No echo or newline translation
+        self.port = os.ttyname(self._slave)
+        self._started = time.monotonic()
+        self._boot = self._started
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="esp32-emulator", daemon=True)
+        self._thread.start()
+        print(f"[Emulator] ESP32 emulator on {self.port}")
+        return self.port
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(1)
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def set_mode(self, sensor, mode):
+        """The web routes: set_mode("temp", "high") is GET /temp/high."""
+        if mode not in ("realtime", "low", "high"):
+            raise ValueError(f"Unknown mode: {mode}")
+        if sensor == "temp":
+            self.temp_mode = mode
+        elif sensor == "weight":
+            self.weight_mode = mode
+        else:
+            raise ValueError(f"Unknown sensor: {sensor}")
+
+    def reboot(self, boot_seconds=1.0):
+        # Back to 9600 baud text request/response, deaf while booting.
+        # Applied by the emulator thread on its next pass
+        self._reboot_request = boot_seconds
+
+    def _apply_reboot(self):
+        boot_seconds, self._reboot_request = self._reboot_request, None
+        self._reset_link_state()
+        self._boot = time.monotonic()
+        self.clock_offset_ms = 0
+        self._silent_until = time.monotonic() + boot_seconds
+        self._outbox.clear()
+        self._buffer = b""
+
+    # ----- Sensors -----
+
+    def elapsed(self):
+        return time.monotonic() - self._started
+
+    def _value(self, source):
+        return source(self.elapsed()) if callable(source) else source
+
+    def _noisy(self, value):
+        return value + self._random.gauss(0.0, self.noise) if self.noise else value
+
+    def read_weight(self):
+        if self.weight_mode != "realtime":
+            return FORCED_WEIGHTS[self.weight_mode]
+        return max(0.0, self._noisy(self._gross_weight()) - self.tare_kg)  # Firmware clamps at 0
+
+    def _gross_weight(self):
+        # What the load cell sees before the stored zero is taken off
+        return self._value(self.weight) + self.zero_drift_kg_per_h * self.elapsed() / 3600.0
+
+    def read_temp(self):
+        if self.temp_mode != "realtime":
+            return FORCED_TEMPS[self.temp_mode]
+        if self.temp_fault:
+            return self._last_temp if self._last_temp is not None else 0.0
+        self._last_temp = self._noisy(self._value(self.temperature))
+        return self._last_temp
+
+    def _ages(self):
+        # Time since the newest HX711 and MAX6675 samples, like the firmware reports
+        ms = int(self.elapsed() * 1000)
+        return ms % HX711_PERIOD_MS, ms % MAX6675_PERIOD_MS, ms // HX711_PERIOD_MS
+
+    def millis(self):
+        elapsed = (time.monotonic() - self._boot) * (1.0 + self.clock_drift_ppm / 1e6)
+        return int(elapsed * 1000 + self.clock_offset_ms) & 0xFFFFFFFF
+
+    def _stamp(self, mode, age_ms):
+        # Capture time of the value being sent; forced values are "now"
+        if not self.timestamps:
+            return None
+        now = self.millis()
+        return now if mode != "realtime" else (now - age_ms) & 0xFFFFFFFF
+
+    # ----- Protocol -----
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            if self._reboot_request is not None:
+                self._apply_reboot()
+            now = time.monotonic()
+            if self._baud_deadline is not None and now >= self._baud_deadline:
+                # No ping at the new rate: drop back like the firmware does
+                self.baud = self._previous_baud
+                self._baud_deadline = None
+            wait = 0.05
+            if self._outbox:
+                wait = min(wait, max(0.0, self._outbox[0][0] - now))
+            if self._next_push is not None:
+                wait = min(wait, max(0.0, self._next_push - now))
+            try:
+                readable, _, _ = select.select([self._master], [], [], wait)
+                if readable:
+                    data = os.read(self._master, 4096)
+                    self.bytes_in += len(data)
+                    self._feed(data)
+                self._push_stream()
+                self._flush()
+            except OSError as e:
+                # The pty was closed under us (stop() or the client went away)
+                if not self._stop_event.is_set():
+                    print(f"[Emulator] pty error: {e}")
+                    self._stop_event.wait(0.1)
+
+    def _line_rate(self):
+        speed = termios.tcgetattr(self._master)[4]
+        return _TERMIOS_BAUDS.get(speed)
+
+    def _feed(self, data):
+        if time.monotonic() < self._silent_until:
+            return
+        rate = self._line_rate()
+        if rate != self.baud or (self.max_baud and rate > self.max_baud):
+            self.garbled += len(data)
+            return
+        self._buffer += data
+        while b"\n" in self._buffer:
+            line, self._buffer = self._buffer.split(b"\n", 1)
+            self.handle_command(line.decode(errors="replace").strip())
+
+    def handle_command(self, command):
+        """Answer one request line; returns nothing, replies go to the outbox."""
+        if not command:
+            return  # Stray line ending, like the firmware
+        self.commands += 1
+        tag = None
+        if not self.legacy and "#" in command:
+            command, _, tag = command.partition("#")
+            command = command.strip()
+
+        if self._random.random() < self.drop_rate:
+            self.dropped += 1
+            return
+        if self._random.random() < self.reject_rate:
+            self._reply("Invalid command", tag)
+            return
+
+        if command == "get_weight":
+            self._send_weight(tag)
+        elif command == "get_temp":
+            self._send_temp(tag)
+        elif self.legacy:
+            self._reply("Invalid command", tag)
+        elif command == "ping":
+            self._baud_deadline = None  # Arrived at the new rate, keep it
+            self._reply("PONG", tag)
+        elif command == "get_all":
+            weight_age, temp_age, _ = self._ages()
+            fault = 1 if self.temp_fault else 0
+            self._reply(f"ALL:{self.read_weight():.2f},{self.read_temp():.2f},"
+                        f"{weight_age},{temp_age},{fault}", tag)
+        elif command == "weight_stats":
+            weight_age, _, total = self._ages()
+            self._reply(f"WSTAT:{self.read_weight():.2f},{weight_age},"
+                        f"{min(total, WEIGHT_FILTER_SAMPLES)},{total}", tag)
+        elif command == "temp_stats":
+            _, temp_age, _ = self._ages()
+            self._reply(f"TSTAT:{self.read_temp():.2f},{temp_age},{1 if self.temp_fault else 0}", tag)
+        elif command.startswith("stream"):
+            arg = command[6:].strip()
+            if arg in ("off", "0"):
+                self.stream_ms = 0
+                self._next_push = None
+            else:
+                try:
+                    interval = int(arg)
+                except ValueError:
+                    interval = 0  # Arduino toInt() gives 0 for junk
+                self.stream_ms = max(interval, STREAM_MIN_INTERVAL_MS)
+                self._next_push = time.monotonic()
+            self._reply(f"STREAM:{self.stream_ms}", tag)
+        elif command == "sync":
+            self._reply(f"SYNC:{self.millis()}", tag)
+        elif command in ("timestamps on", "timestamps off"):
+            self.timestamps = command == "timestamps on"
+            self._reply(f"TIMESTAMPS:{1 if self.timestamps else 0}", tag)
+        elif command in ("binary on", "binary off"):
+            self.binary = command == "binary on"
+            self._reply(f"BINARY:{1 if self.binary else 0}", tag)
+        elif command == "tare":
+            gross = self._gross_weight()
+            removed, self.tare_kg = gross - self.tare_kg, gross
+            self._reply(f"TARE:{removed:.2f}", tag, delay=TARE_SECONDS)
+        elif command.startswith("cal"):
+            try:
+                factor = float(command[3:].strip() or 0)
+            except ValueError:
+                factor = 0.0  # Arduino toFloat() gives 0 for junk
+            if factor:
+                self.scale_factor = factor
+            offset = round(self.tare_kg * self.scale_factor)
+            self._reply(f"CAL:{offset},{self.scale_factor:.4f}", tag)
+        elif command.startswith("baud"):
+            try:
+                rate = int(command[4:].strip())
+            except ValueError:
+                rate = 0
+            if rate not in SUPPORTED_BAUDS:
+                rate = self.baud
+            self._reply(f"BAUD:{rate}", tag)
+            if rate != self.baud:
+                self._previous_baud = self.baud
+                self.baud = rate
+                if rate != SUPPORTED_BAUDS[0]:
+                    self._baud_deadline = time.monotonic() + BAUD_CONFIRM_S
+        else:
+            self._reply("Invalid command", tag)
+
+    def _send_weight(self, tag):
+        stamp = self._stamp(self.weight_mode, self._ages()[0])
+        self._send_value(MSG_WEIGHT, "KG", self.read_weight(), tag, stamp)
+
+    def _send_temp(self, tag):
+        stamp = self._stamp(self.temp_mode, self._ages()[1])
+        self._send_value(MSG_TEMP, "TEMP", self.read_temp(), tag, stamp)
+
+    def _send_value(self, msg_type, prefix, value, tag, stamp_ms=None):
+        if self.binary:
+            self._queue(encode_frame(msg_type, self._frame_seq, value, stamp_ms))
+            self._frame_seq = (self._frame_seq + 1) & 0xFF
+        else:
+            stamp = "" if stamp_ms is None else f"@{stamp_ms}"
+            self._reply(f"{prefix}:{value:.2f}{stamp}", tag)
+
+    def _reply(self, text, tag=None, delay=0.0):
+        if tag:
+            text = f"{text}#{tag}"
+        self._queue((text + "\r\n").encode(), delay)
+
+    def _queue(self, data, delay=0.0):
+        if self.corrupt_rate and self._random.random() < self.corrupt_rate:
+            data = bytearray(data)
+            data[self._random.randrange(len(data))] ^= 0x5A
+            data = bytes(data)
+        self._order += 1
+        heapq.heappush(self._outbox, (time.monotonic() + self.latency + delay, self._order, data))
+        self.replies += 1
+
+    def _push_stream(self):
+        if not self.stream_ms or self._next_push is None:
+            return
+        now = time.monotonic()
+        if now < self._next_push:
+            return
+        self._next_push = now + self.stream_ms / 1000.0
+        self._send_weight(None)
+        self._send_temp(None)
+
+    def _flush(self):
+        now = time.monotonic()
+        while self._outbox and self._outbox[0][0] <= now:
+            _, _, data = heapq.heappop(self._outbox)
+            os.write(self._master, data)
+            self.bytes_out += len(data)
+            if self.verbose:
+                print(f"[Emulator] -> {data!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate the ESP32 sensor board on a pty")
+    parser.add_argument("--weight", type=float, default=0.0, help="kg reported in real-time mode")
+    parser.add_argument("--temperature", type=float, default=25.0, help="degC reported in real-time mode")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each reply")
+    parser.add_argument("--noise", type=float, default=0.0, help="standard deviation added to readings")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of requests left unanswered")
+    parser.add_argument("--reject-rate", type=float, default=0.0, help="fraction answered 'Invalid command'")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="fraction of replies with a flipped byte")
+    parser.add_argument("--temp-fault", action="store_true", help="report an open thermocouple")
+    parser.add_argument("--temp-mode", choices=("realtime", "low", "high"), default="realtime")
+    parser.add_argument("--weight-mode", choices=("realtime", "low", "high"), default="realtime")
+    parser.add_argument("--legacy", action="store_true", help="original firmware: get_weight/get_temp only")
+    parser.add_argument("--max-baud", type=int, help="highest rate the emulated UART accepts")
+    parser.add_argument("--clock-drift-ppm", type=float, default=0.0, help="how fast millis() runs")
+    parser.add_argument("--zero-drift", type=float, default=0.0, help="load cell zero drift in kg per hour")
+    parser.add_argument("--seed", type=int, help="seed for noise and fault injection")
+    parser.add_argument("--verbose", action="store_true", help="print every reply")
+    args = parser.parse_args()
+
+    emulator = ESP32Emulator(
+        weight=args.weight, temperature=args.temperature, latency=args.latency, noise=args.noise,
+        drop_rate=args.drop_rate, reject_rate=args.reject_rate, corrupt_rate=args.corrupt_rate,
+        temp_fault=args.temp_fault, legacy=args.legacy, max_baud=args.max_baud,
+        clock_drift_ppm=args.clock_drift_ppm, zero_drift_kg_per_h=args.zero_drift, seed=args.seed,
+        verbose=args.verbose,
+    )
+    emulator.set_mode("temp", args.temp_mode)
+    emulator.set_mode("weight", args.weight_mode)
+    emulator.start()
+    try:
+        while True:
+            time.sleep(5)
+            print(f"[Emulator] {emulator.commands} commands, {emulator.replies} replies, "
+                  f"{emulator.dropped} dropped, {emulator.garbled} B garbled, "
+                  f"{emulator.bytes_in} B in, {emulator.bytes_out} B out at {emulator.baud} baud")
+    except KeyboardInterrupt:
+        print("\n[Emulator] Stopping")
+    finally:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+#include <Preferences.h>
 #include "HX711.h"
 
 #define DOUT 13
@@ -5,9 +6,13 @@
 
 HX711 scale;
 
-// Adjust these values based on your testing
+// Fallbacks only: the booth firmware stores this board's calibration in NVS
+// (namespace "scale", written on first boot, by "tare" and by "cal <factor>"),
+// and that is used when present. Its factor is raw counts per gram, this
+// sketch's is per kg
 long offset = -6550;        // The raw value when no weight is on the scale (measured manually)
 float scale_factor = 11550; // Raw difference for 1kg weight (calibrate this!)
+Preferences prefs;
 
 void setup() {
   Serial.begin(115200);
@@ -15,6 +20,16 @@ void setup() {
   
   scale.begin(DOUT, CLK);
 
+  prefs.begin("scale", true);  // Read-only
+  if (prefs.isKey("offset")) {
+    offset = prefs.getLong("offset");
+    if (prefs.isKey("factor")) {
+      scale_factor = prefs.getFloat("factor") * 1000.0;  // Counts per gram -> per kg
+    }
+    Serial.println("Using the stored booth calibration");
+  }
+  prefs.end();
+
   Serial.println("HX711 Weight Sensor Test with Manual Offset");
 }
 
@@ -22,6 +37,7 @@ void loop() {
   if (scale.is_ready()) {
     long raw_reading = scale.read_average(10);  // Average of 10 readings
     float weight = (raw_reading - offset) / scale_factor;
+    if (weight < 0) weight = 0;  // Same clamp as the booth firmware
 
     Serial.print("Raw reading: ");
     Serial.print(raw_reading);
@@ -0,0 +1,463 @@
+# Serial link to the ESP32 sensor board.
+#
+# SerialBus is the only thing that touches the serial port. Callers get a
+# Future per request instead of doing write/readline themselves, so replies
+# can no longer be stolen by another thread, and several requests can be in
+# flight at once.
+#
+# The firmware boots at 9600 baud. start() finds the port the ESP32 answers
+# on (find_esp32) and then negotiates the fastest rate both UARTs can hold,
+# up to max_baud, falling back one step at a time when a rate fails.
+
+import glob
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import serial
+
+from esp32_protocol import (
+    BAUD_PREFIX,
+    BINARY_PREFIX,
+    FRAME_HEADER_SIZE,
+    INVALID_REPLY,
+    MSG_PREFIXES,
+    PONG_REPLY,
+    TAG_SEPARATOR,
+    FrameReader,
+    parse_reply,
+    split_tag,
+)
+from latency_stats import LinkStats
+
+# Set ESP32_PORT to skip probing, e.g. to use esp32_emulator's pty
+ESP32_PORT = os.environ.get("ESP32_PORT")
+BAUD_RATE = 9600  # Firmware boot rate
+MAX_BAUD_RATE = 921600
+
+# Probed in order by find_esp32(); serial0 is the Pi's alias for whichever
+# UART is on the GPIO header
+CANDIDATE_PORTS = ("/dev/serial0", "/dev/ttyS0", "/dev/ttyAMA0", "/dev/ttyUSB*", "/dev/ttyACM*")
+
+# Rates tried by negotiate(), fastest first
+BAUD_RATES = (921600, 460800, 230400, 115200, 57600, 38400, 19200)
+
+# Firmware reverts an unconfirmed switch after this long (BAUD_CONFIRM_MS)
+BAUD_CONFIRM_TIMEOUT = 1.0
+
+
+class CommandRejected(Exception):
+    """The firmware answered "Invalid command"."""
+
+
+def candidate_ports(patterns=CANDIDATE_PORTS):
+    # Existing ports matching patterns, with aliases of the same device removed
+    ports = []
+    seen = set()
+    for pattern in patterns:
+        for port in sorted(glob.glob(pattern)):
+            device = os.path.realpath(port)
+            if device not in seen:
+                seen.add(device)
+                ports.append(port)
+    return ports
+
+
+def find_esp32(ports=None, baud=BAUD_RATE, timeout=0.5):
+    """Return the first port on which the ESP32 answers a ping, or None.
+
+    Any firmware counts: old builds without ping answer "Invalid command".
+    """
+    if ports is None:
+        ports = candidate_ports()
+    for port in ports:
+        try:
+            with serial.Serial(port, baud, timeout=0.05) as probe:
+                probe.reset_input_buffer()
+                probe.write(b"ping\n")
+                received = b""
+                deadline = time.monotonic() + timeout
+                while time.monotonic() < deadline:
+                    received += probe.read(max(1, probe.in_waiting))
+                    text = received.decode(errors="replace")
+                    if PONG_REPLY in text or INVALID_REPLY in text:
+                        print(f"[Bus] ESP32 found on {port}")
+                        return port
+        except (serial.SerialException, OSError) as e:
+            print(f"[Bus] Skipping {port}: {e}")
+    return None
+
+
+class _Pending:
+    __slots__ = ("tag", "command", "expect", "future", "deadline", "sent", "binary")
+
+    def __init__(self, tag, command, expect, future, deadline, sent, binary=False):
+        self.tag = tag
+        self.command = command
+        self.expect = expect
+        self.future = future
+        self.deadline = deadline
+        self.sent = sent
+        # Sent while the firmware answers with binary frames
+        self.binary = binary
+
+
+class SerialBus:
+    """Serializes all traffic on the ESP32 link and routes replies.
+
+    request() writes the command tagged with an id ("get_weight#7") and
+    returns a Future. A reader thread matches each reply to its request by
+    the echoed id and resolves the Future. Up to `window` requests may be
+    outstanding at once; the firmware answers them in order.
+
+    Firmware without tag support is detected at start() (it answers the
+    tagged ping with an untagged "Invalid command"); the bus then sends
+    plain commands and matches replies in FIFO order by prefix.
+
+    Binary frames carry no tag, so a frame only answers the oldest pending
+    request for its prefix that was sent while binary replies were on
+    (`binary`, following the firmware's BINARY: acks). Anything that is
+    not a reply (stream pushes) goes to the subscribers.
+    Round-trip times, bytes, timeouts and rejections are recorded per
+    command in `stats` (a LinkStats).
+
+    port=None probes CANDIDATE_PORTS for the ESP32. With max_baud above
+    the boot rate, start() negotiates the fastest rate that works.
+
+    A read error stops the bus: `error` is set, `alive` turns False and
+    pending requests fail with ConnectionError. close() then start() reopens
+    the port (probing again if it was auto-detected); see SensorService for
+    the supervisor that does this.
+    """
+
+    def __init__(self, port=ESP32_PORT, baud=BAUD_RATE, serial_port=None, window=4, timeout=1.0,
+                 max_baud=MAX_BAUD_RATE):
+        self.port = port
+        self.requested_port = port
+        self.baud = baud
+        self.boot_baud = baud
+        self.negotiated_baud = None
+        self.max_baud = max_baud
+        self.serial = serial_port
+        self._owns_port = serial_port is None
+        self.error = None
+        self.window = window
+        self.timeout = timeout
+        self.tagged = True
+        self.reader = None
+        self.timeouts = 0
+        self.stats = LinkStats()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(window)
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._subscribers = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive() and self.error is None
+
+    def start(self):
+        self.error = None
+        self.tagged = True
+        self.binary = False  # A freshly opened ESP32 talks text
+        if self.serial is None:
+            self.baud = self.boot_baud
+            self.port = self.requested_port
+            if self.port is None:
+                self.port = find_esp32(baud=self.baud)
+                if self.port is None:
+                    raise serial.SerialException("no ESP32 answered on " + ", ".join(CANDIDATE_PORTS))
+            self.serial = serial.Serial(self.port, self.baud, timeout=0.05)
+            print(f"[Bus] Connected to ESP32 on {self.port}")
+        self.serial.reset_input_buffer()
+        self.reader = FrameReader(self.serial)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._read_loop, name="esp32-bus", daemon=True)
+        self._thread.start()
+
+        try:
+            self.request("ping", expect=PONG_REPLY).result()
+        except CommandRejected:
+            self.tagged = False
+            print("[Bus] Firmware does not echo request ids, matching replies in order")
+        except TimeoutError:
+            # Reopened after a UART hiccup or an app crash: the ESP32 may
+            # still be running at a negotiated rate
+            if not self._find_baud():
+                self.tagged = False
+                print("[Bus] No reply to ping, matching replies in order")
+
+        # Old firmware (no tags) has no baud command either
+        if self.tagged and self.max_baud and self.max_baud > self.baud:
+            self.negotiate(self.max_baud)
+
+    def negotiate(self, max_baud=MAX_BAUD_RATE):
+        """Switch the link to the fastest rate in BAUD_RATES up to max_baud.
+
+        Each rate is confirmed with a ping; one that fails is abandoned and
+        the next lower one tried. Call it before other traffic starts.
+        Returns the rate in use.
+        """
+        for rate in BAUD_RATES:
+            if rate > max_baud or rate <= self.baud:
+                continue
+            try:
+                reply = self.query(f"baud {rate}", expect=BAUD_PREFIX)
+            except CommandRejected:
+                print(f"[Bus] Firmware cannot change baud rate, staying at {self.baud}")
+                return self.baud
+            except TimeoutError as e:
+                print(f"[Bus] Baud request failed: {e}")
+                return self.baud
+            prefix, value = parse_reply(reply)
+            if prefix != BAUD_PREFIX or value != rate:
+                continue  # Firmware does not offer this rate
+            if self._switch_baud(rate):
+                return rate
+        return self.baud
+
+    def _switch_baud(self, rate):
+        # The firmware has acked and is switching; follow it and confirm
+        previous = self.baud
+        self._set_port_baud(rate)
+        try:
+            self.query("ping", expect=PONG_REPLY, timeout=0.5)
+        except (CommandRejected, TimeoutError):
+            print(f"[Bus] {rate} baud did not work, back to {previous}")
+            # Wait out the firmware's confirm window so it has reverted too
+            time.sleep(BAUD_CONFIRM_TIMEOUT + 0.2)
+            self._set_port_baud(previous)
+            self.serial.reset_input_buffer()
+            return False
+        print(f"[Bus] Link running at {rate} baud")
+        self.negotiated_baud = rate
+        return True
+
+    def _find_baud(self):
+        rates = [self.negotiated_baud] + [rate for rate in BAUD_RATES if rate <= (self.max_baud or 0)]
+        for rate in dict.fromkeys(rates):
+            if self._try_baud(rate):
+                self.negotiated_baud = rate
+                return True
+        return False
+
+    def _try_baud(self, rate):
+        # Ping at rate; stay there if answered, otherwise restore the old rate
+        if not rate or rate == self.baud:
+            return False
+        previous = self.baud
+        self._set_port_baud(rate)
+        try:
+            self.query("ping", expect=PONG_REPLY, timeout=0.5)
+            print(f"[Bus] ESP32 still at {rate} baud")
+            return True
+        except (CommandRejected, TimeoutError):
+            self._set_port_baud(previous)
+            return False
+
+    def _set_port_baud(self, rate):
+        with self._lock:
+            self.serial.baudrate = rate
+            self.baud = rate
+            # Bytes received mid-switch are garbage; drop any partial frame
+            self.reader = FrameReader(self.serial)
+
+    def resync(self):
+        """Recover the link rate after the ESP32 may have rebooted.
+
+        A rebooted ESP32 is back at the boot rate while the port is still at
+        the negotiated one. Returns True once a ping is answered again.
+        """
+        try:
+            self.query("ping", expect=PONG_REPLY, timeout=0.5)
+            return True
+        except (CommandRejected, TimeoutError):
+            pass
+        if self.baud == self.boot_baud:
+            return False
+        negotiated = self.baud
+        print(f"[Bus] No answer at {negotiated} baud, retrying at {self.boot_baud}")
+        self._set_port_baud(self.boot_baud)
+        try:
+            self.query("ping", expect=PONG_REPLY, timeout=0.5)
+        except (CommandRejected, TimeoutError):
+            return False
+        # Go straight back to the rate that worked before
+        self.negotiate(negotiated)
+        return True
+
+    def subscribe(self, callback):
+        # callback(item) runs on the reader thread for every unsolicited
+        # text line or Frame; keep it short.
+        self._subscribers.append(callback)
+
+    def request(self, command, expect=None, timeout=None):
+        """Send command and return a Future for its reply.
+
+        expect is the reply prefix ("KG", "TEMP", ...) used to match replies
+        from firmware without tag support. The Future resolves to the reply
+        text without its tag (or a Frame in binary mode), or fails with
+        CommandRejected / TimeoutError, or ConnectionError once the bus has
+        stopped.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if self.error is not None:
+            future = Future()
+            future.set_exception(ConnectionError(f"{command}: serial link down ({self.error})"))
+            return future
+        if not self._slots.acquire(timeout=timeout):
+            future = Future()
+            future.set_exception(TimeoutError(f"{command}: too many requests in flight"))
+            return future
+
+        future = Future()
+        with self._lock:
+            tag = str(next(self._ids) % 1000)
+            line = f"{command}{TAG_SEPARATOR}{tag}\n" if self.tagged else f"{command}\n"
+            data = line.encode()
+            now = time.monotonic()
+            entry = _Pending(tag, command, expect, future, now + timeout, now, self.binary)
+            self._pending[tag] = entry
+            try:
+                self.serial.write(data)
+                self.stats.sent(command, len(data))
+            except Exception as e:
+                del self._pending[tag]
+                self._slots.release()
+                future.set_exception(e)
+        return future
+
+    def query(self, command, expect=None, timeout=None):
+        # Blocking convenience wrapper around request()
+        timeout = self.timeout if timeout is None else timeout
+        return self.request(command, expect, timeout).result(timeout + 0.5)
+
+    def send(self, command):
+        # Fire-and-forget command whose reply (if any) is ignored
+        data = f"{command}\n".encode()
+        with self._lock:
+            self.serial.write(data)
+        self.stats.sent(command, len(data))
+
+    def _read_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                # Blocks for at most the port timeout waiting for the first byte
+                data = self.serial.read(max(1, self.serial.in_waiting))
+            except Exception as e:
+                # Unplugged or reset port: stop here and let the owner reopen it
+                print(f"[Bus] Serial read error: {e}")
+                self.error = e
+                self._fail_pending(ConnectionError(f"serial read failed: {e}"))
+                return
+            if data:
+                try:
+                    items = self.reader.feed(data)
+                except Exception as e:
+                    # Never let one bad chunk end the reader thread
+                    print(f"[Bus] Could not decode serial data, dropping it: {e}")
+                    self.reader.clear()
+                    items = []
+                for item in items:
+                    try:
+                        self._route(item)
+                    except Exception as e:
+                        print(f"[Bus] Error handling {item!r}: {e}")
+            if self._pending:
+                self._expire()
+
+    def _route(self, item):
+        if isinstance(item, str):
+            body, tag = split_tag(item)
+            prefix = body.partition(":")[0]
+            size = len(item) + 2  # println adds \r\n
+            if prefix == BINARY_PREFIX:
+                # Acked "binary on/off", whoever sent it
+                self.binary = parse_reply(body)[1] == 1
+        else:
+            body, tag = item, None
+            prefix = MSG_PREFIXES.get(item.msg_type)
+            payload = 4 if item.stamp_ms is None else 8  # int32 value (+ uint32 stamp)
+            size = FRAME_HEADER_SIZE + payload + 1
+
+        with self._lock:
+            if tag is not None:
+                entry = self._pending.pop(tag, None)
+            elif body == INVALID_REPLY:
+                entry = self._pop_oldest(None)
+            elif not isinstance(item, str):
+                # Binary frames in FIFO order, but never a stream push for a
+                # request that expects a text reply
+                entry = self._pop_oldest(prefix, binary=True)
+            elif not self.tagged:
+                # Untagged replies (old firmware) in FIFO order
+                entry = self._pop_oldest(prefix)
+            else:
+                entry = None
+
+        if entry is None:
+            for callback in self._subscribers:
+                callback(item)
+            return
+        self._slots.release()
+        elapsed = time.monotonic() - entry.sent
+        if body == INVALID_REPLY:
+            self.stats.rejected(entry.command, elapsed)
+            entry.future.set_exception(CommandRejected(entry.command))
+        else:
+            self.stats.reply(entry.command, elapsed, size)
+            entry.future.set_result(body)
+
+    def _pop_oldest(self, prefix, binary=False):
+        # Oldest pending request expecting prefix (any request if None);
+        # with binary, only one sent while binary replies were on
+        for tag, entry in self._pending.items():
+            if binary and not entry.binary:
+                continue
+            if prefix is None or entry.expect == prefix:
+                return self._pending.pop(tag)
+        return None
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [tag for tag, entry in self._pending.items() if entry.deadline <= now]
+            entries = [self._pending.pop(tag) for tag in expired]
+        for entry in entries:
+            self.timeouts += 1
+            self.stats.timeout(entry.command)
+            self._slots.release()
+            entry.future.set_exception(TimeoutError(f"{entry.command}: no reply"))
+
+    def close(self):
+        if self.alive and self.baud != self.boot_baud:
+            # Leave the ESP32 at its boot rate for whoever opens the port next
+            try:
+                self.send(f"baud {self.boot_baud}")
+                self.serial.flush()
+            except Exception as e:
+                print(f"[Bus] Could not restore {self.boot_baud} baud: {e}")
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(1)
+        self._fail_pending(ConnectionError("serial bus closed"))
+        if self.serial is not None:
+            try:
+                self.serial.close()
+            except Exception as e:
+                print(f"[Bus] Error closing serial port: {e}")
+            if self._owns_port:
+                self.serial = None
+
+    def _fail_pending(self, error):
+        with self._lock:
+            entries = list(self._pending.values())
+            self._pending.clear()
+        for entry in entries:
+            self._slots.release()
+            entry.future.set_exception(error)
@@ -0,0 +1,275 @@
+# Wire protocol helpers for the ESP32 sensor board.
+#
+# Text replies are single lines such as "KG:12.34", "TEMP:98.50" or
+# "Invalid command", terminated by "\r\n" (Arduino println). "weight_stats"
+# answers "WSTAT:<kg>,<age ms>,<samples averaged>,<samples since boot>"
+# from the firmware's load cell ring buffer, and "temp_stats" answers
+# "TSTAT:<degC>,<age ms>,<fault 0/1>" for the cached thermocouple value.
+# "get_all" returns both sensors from one snapshot:
+# "ALL:<kg>,<degC>,<weight age ms>,<temp age ms>,<temp fault 0/1>". A request may
+# end in "#<id>" ("get_weight#12"); the firmware then echoes the id at the
+# end of its reply ("KG:3.20#12") so pipelined replies can be matched.
+# "baud <rate>" answers "BAUD:<rate>" at the old rate and then switches the
+# link; the first ping at the new rate confirms it, otherwise the firmware
+# drops back to the previous rate after BAUD_CONFIRM_MS (except for a switch
+# back to the 9600 boot rate). An unsupported rate answers with the rate in
+# use.
+#
+# "tare" re-zeroes the load cell (about 1 s) and then answers
+# "TARE:<kg removed>". "cal" answers "CAL:<raw offset>,<scale factor>";
+# "cal <factor>" stores a new factor first. Both are kept in the ESP32's
+# NVS, so a reboot no longer re-tares.
+#
+# "sync" answers "SYNC:<millis>" for clock alignment (see clock_sync.py).
+# After "timestamps on" ("TIMESTAMPS:1") every KG:/TEMP: value carries the
+# millis() at which the sensor was sampled: "KG:12.34@81234", and binary
+# frames get an 8-byte payload, value then uint32 capture ms.
+#
+# After "binary on" the firmware sends sensor values as binary frames
+# instead (command acks and errors stay text):
+#
+#   0xA5 | type | seq | len | payload (len bytes) | crc8
+#
+# seq is a single 8-bit counter shared by all frame types, so gaps reveal
+# dropped frames. Payload values are little-endian int32 fixed point in
+# hundredths (1234 -> 12.34). crc8 is CRC-8/ATM (poly 0x07, init 0) over
+# type, seq, len and payload.
+
+import struct
+from collections import namedtuple
+
+# Reply prefixes sent by the firmware
+WEIGHT_PREFIX = "KG"
+TEMP_PREFIX = "TEMP"
+STREAM_PREFIX = "STREAM"
+BINARY_PREFIX = "BINARY"
+WEIGHT_STATS_PREFIX = "WSTAT"
+TEMP_STATS_PREFIX = "TSTAT"
+ALL_PREFIX = "ALL"
+BAUD_PREFIX = "BAUD"
+SYNC_PREFIX = "SYNC"
+TIMESTAMPS_PREFIX = "TIMESTAMPS"
+TARE_PREFIX = "TARE"
+CAL_PREFIX = "CAL"
+PONG_REPLY = "PONG"
+INVALID_REPLY = "Invalid command"
+TAG_SEPARATOR = "#"
+STAMP_SEPARATOR = "@"
+
+# Binary frame layout
+FRAME_SYNC = 0xA5
+MSG_WEIGHT = 0x01
+MSG_TEMP = 0x02
+FRAME_HEADER_SIZE = 4
+FIXED_POINT_SCALE = 100.0
+
+# Text prefix that carries the same value as each binary message type
+MSG_PREFIXES = {MSG_WEIGHT: WEIGHT_PREFIX, MSG_TEMP: TEMP_PREFIX}
+
+_HEADER = struct.Struct("<BBBB")
+_INT32 = struct.Struct("<i")
+_STAMPED = struct.Struct("<iI")
+_PAYLOAD_SIZES = (_INT32.size, _STAMPED.size)
+
+# stamp_ms is the firmware's millis() at capture, None on unstamped frames
+Frame = namedtuple("Frame", ["msg_type", "seq", "value", "stamp_ms"], defaults=(None,))
+WeightStats = namedtuple("WeightStats", ["kg", "age_ms", "averaged", "total"])
+TempStats = namedtuple("TempStats", ["celsius", "age_ms", "fault"])
+AllReading = namedtuple("AllReading", ["kg", "celsius", "weight_age_ms", "temp_age_ms", "temp_fault"])
+Calibration = namedtuple("Calibration", ["offset", "factor"])
+
+
+def _make_crc8_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+_CRC8_TABLE = _make_crc8_table()
+
+
+def crc8(data, start=0, end=None):
+    if end is None:
+        end = len(data)
+    crc = 0
+    table = _CRC8_TABLE
+    for i in range(start, end):
+        crc = table[crc ^ data[i]]
+    return crc
+
+
+def encode_frame(msg_type, seq, value, stamp_ms=None):
+    # Used by the emulator and tests; the firmware builds the same bytes
+    fixed = int(round(value * FIXED_POINT_SCALE))
+    if stamp_ms is None:
+        payload = _INT32.pack(fixed)
+    else:
+        payload = _STAMPED.pack(fixed, stamp_ms & 0xFFFFFFFF)
+    body = bytes((msg_type, seq & 0xFF, len(payload))) + payload
+    return bytes((FRAME_SYNC,)) + body + bytes((crc8(body),))
+
+
+def split_tag(line):
+    # "KG:3.20#12" -> ("KG:3.20", "12"); untagged lines -> (line, None)
+    body, sep, tag = line.rpartition(TAG_SEPARATOR)
+    if not sep:
+        return line, None
+    return body, tag
+
+
+def parse_reply(line):
+    # "KG:12.34" -> ("KG", 12.34); anything else -> (None, None).
+    # A capture stamp ("KG:12.34@81234") is ignored
+    prefix, value, _ = parse_stamped_reply(line)
+    return prefix, value
+
+
+def parse_stamped_reply(line):
+    # "KG:12.34@81234" -> ("KG", 12.34, 81234); no stamp -> ("KG", 12.34, None)
+    prefix, sep, value = line.partition(":")
+    if not sep:
+        return None, None, None
+    value, sep, stamp = value.partition(STAMP_SEPARATOR)
+    try:
+        return prefix, float(value), int(stamp) if sep else None
+    except ValueError:
+        return None, None, None
+
+
+def parse_weight_stats(line):
+    # "WSTAT:12.34,40,5,1023" -> WeightStats; anything else -> None
+    prefix, sep, fields = line.partition(":")
+    if prefix != WEIGHT_STATS_PREFIX or not sep:
+        return None
+    try:
+        kg, age_ms, averaged, total = fields.split(",")
+        return WeightStats(float(kg), int(age_ms), int(averaged), int(total))
+    except ValueError:
+        return None
+
+
+def parse_temp_stats(line):
+    # "TSTAT:98.50,120,0" -> TempStats; anything else -> None
+    prefix, sep, fields = line.partition(":")
+    if prefix != TEMP_STATS_PREFIX or not sep:
+        return None
+    try:
+        celsius, age_ms, fault = fields.split(",")
+        return TempStats(float(celsius), int(age_ms), fault == "1")
+    except ValueError:
+        return None
+
+
+def parse_calibration(line):
+    # "CAL:-6550,21.8130" -> Calibration; anything else -> None
+    prefix, sep, fields = line.partition(":")
+    if prefix != CAL_PREFIX or not sep:
+        return None
+    try:
+        offset, factor = fields.split(",")
+        return Calibration(int(offset), float(factor))
+    except ValueError:
+        return None
+
+
+def parse_all(line):
+    # "ALL:12.34,98.50,40,120,0" -> AllReading; anything else -> None
+    prefix, sep, fields = line.partition(":")
+    if prefix != ALL_PREFIX or not sep:
+        return None
+    try:
+        kg, celsius, weight_age, temp_age, fault = fields.split(",")
+        return AllReading(float(kg), float(celsius), int(weight_age), int(temp_age), fault == "1")
+    except ValueError:
+        return None
+
+
+class FrameReader:
+    """Non-blocking reader for the mixed text/binary serial stream.
+
+    poll() only consumes the bytes already waiting in the driver buffer and
+    returns what is complete among them: text lines as str, binary frames as
+    Frame tuples. Partial lines and frames are kept until the rest arrives.
+    Binary frames are decoded in place from the receive buffer.
+    """
+
+    def __init__(self, port, max_line=256):
+        self.port = port
+        self.max_line = max_line
+        self.frames = 0
+        self.crc_errors = 0
+        self.dropped = 0
+        self._last_seq = None
+        self._buffer = bytearray()
+
+    def poll(self):
+        waiting = self.port.in_waiting
+        if not waiting:
+            return []
+        return self.feed(self.port.read(waiting))
+
+    def feed(self, data):
+        buf = self._buffer
+        buf += data
+        items = []
+        start = 0
+        size = len(buf)
+        with memoryview(buf) as view:
+            while start < size:
+                if buf[start] == FRAME_SYNC:
+                    if size - start < FRAME_HEADER_SIZE:
+                        break
+                    _, msg_type, seq, length = _HEADER.unpack_from(view, start)
+                    if length not in _PAYLOAD_SIZES or msg_type not in MSG_PREFIXES:
+                        # Not a real header (a CRC can match by chance too),
+                        # resync on the next byte
+                        start += 1
+                        continue
+                    end = start + FRAME_HEADER_SIZE + length
+                    if end >= size:
+                        break
+                    if crc8(view, start + 1, end) != buf[end]:
+                        self.crc_errors += 1
+                        start += 1
+                        continue
+                    self._track_seq(seq)
+                    if length == _STAMPED.size:
+                        fixed, stamp_ms = _STAMPED.unpack_from(view, start + FRAME_HEADER_SIZE)
+                    else:
+                        fixed, stamp_ms = _INT32.unpack_from(view, start + FRAME_HEADER_SIZE)[0], None
+                    items.append(Frame(msg_type, seq, fixed / FIXED_POINT_SCALE, stamp_ms))
+                    start = end + 1
+                    continue
+
+                newline = buf.find(b"\n", start)
+                sync = buf.find(b"\xa5", start, newline if newline >= 0 else size)
+                if sync >= 0:
+                    # Half a line followed by a frame: the line is noise
+                    start = sync
+                    continue
+                if newline < 0:
+                    break
+                line = bytes(view[start:newline]).decode(errors="replace").strip()
+                if line:
+                    items.append(line)
+                start = newline + 1
+
+        del buf[:start]
+        # A line that never ends is noise (wrong baud rate, boot garbage)
+        if len(buf) > self.max_line:
+            buf.clear()
+        return items
+
+    def _track_seq(self, seq):
+        if self._last_seq is not None:
+            self.dropped += (seq - self._last_seq - 1) & 0xFF
+        self._last_seq = seq
+        self.frames += 1
+
+    def clear(self):
+        self._buffer.clear()
+        self._last_seq = None
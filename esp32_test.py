@@ -1,8 +1,9 @@
+import os
 import serial
 import time
 
 
-ESP32_PORT = "/dev/ttyS0"   
+ESP32_PORT = os.environ.get("ESP32_PORT", "/dev/ttyS0")  # esp32_emulator pty for testing
 BAUD_RATE = 9600
 
 try:
@@ -0,0 +1,224 @@
+# HX711 load-cell driver on pigpio, without blocking reads.
+#
+# The hx711 package clocks the chip from Python, so get_weight_mean() holds
+# the caller for a whole batch of conversions, and a context switch in the
+# middle of a clock pulse can hold PD_SCK high past 60 us and power the chip
+# down. Here the 25-27 clock pulses are a pigpio waveform (the DMA engine
+# times them) started from a callback when DOUT falls (conversion ready),
+# and the bits are read back from the callback stream: pigpio reports the
+# DOUT edges and the PD_SCK falling edges in tick order, so the DOUT level
+# at each falling edge is the bit. Every conversion is pushed into a ring
+# buffer and a filtered weight is published to a LatestValue, so readers
+# get the latest weight at the full sensor rate (10 or 80 SPS) in O(1).
+
+import statistics
+import threading
+import time
+from collections import deque
+
+import pigpio
+
+from sensor_service import LatestValue
+
+GAIN_PULSES = {128: 25, 32: 26, 64: 27}  # Channel A 128, channel B 32, channel A 64
+CLOCK_HIGH_US = 10  # PD_SCK high 0.2-50 us; above 60 us the chip powers down
+CLOCK_LOW_US = 10
+POWER_DOWN_US = 100
+RAW_MIN = -0x800000
+RAW_MAX = 0x7FFFFF
+SCALE_RATIO = 21.81341463414634  # Raw counts per gram (the old hx711 calibration)
+
+
+def to_signed(value):
+    """24-bit two's complement -> int."""
+    return value - 0x1000000 if value & 0x800000 else value
+
+
+class PigpioHX711(threading.Thread):
+    """Callback-driven HX711 reader.
+
+    Conversions land in `samples`, a ring buffer of (time.monotonic(), raw)
+    holding the last `buffer` of them. `weight` is a LatestValue with the
+    median of the last `window` conversions in kg, stamped with the newest
+    one's arrival, so it can stand in for SensorService.weight. Until
+    zero() has run (automatically after the first `window` conversions when
+    offset is None) no weight is published.
+
+    The thread itself only supervises: if no conversion arrives for
+    stall_after seconds the chip is power-cycled through PD_SCK.
+    on_zero(offset) is called after every zero(), e.g. to store it.
+    """
+
+    def __init__(self, pi, dout_pin, sck_pin, gain=128, scale_ratio=SCALE_RATIO, offset=None,
+                 window=5, buffer=256, stall_after=1.0, on_zero=None):
+        super().__init__(name="hx711", daemon=True)
+        self.pi = pi
+        self.dout_pin = dout_pin
+        self.sck_pin = sck_pin
+        self.pulses = GAIN_PULSES[gain]
+        self.scale_ratio = scale_ratio
+        self.offset = offset
+        self.window = window
+        self.stall_after = stall_after
+        self.on_zero = on_zero
+        self.samples = deque(maxlen=buffer)
+        self.weight = LatestValue("weight")
+        self.conversions = 0
+        self.errors = 0
+        self.resets = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wave = None
+        self._callbacks = []
+        self._dout = 1
+        self._reading = False
+        self._bits = 0
+        self._value = 0
+        self._last_sample = None
+
+    def run(self):
+        try:
+            self._setup()
+        except Exception as e:
+            print(f"[HX711] Could not set up pigpio: {e}")
+            return
+        print(f"[HX711] Reading DOUT {self.dout_pin}, PD_SCK {self.sck_pin}")
+        try:
+            while not self._stop_event.wait(self.stall_after / 2):
+                self._check_stall()
+        finally:
+            self._teardown()
+
+    def _setup(self):
+        pi = self.pi
+        pi.set_mode(self.sck_pin, pigpio.OUTPUT)
+        pi.set_mode(self.dout_pin, pigpio.INPUT)
+        pi.write(self.sck_pin, 0)
+        mask = 1 << self.sck_pin
+        pulses = []
+        for _ in range(self.pulses):
+            pulses.append(pigpio.pulse(mask, 0, CLOCK_HIGH_US))
+            pulses.append(pigpio.pulse(0, mask, CLOCK_LOW_US))
+        # wave_add_new only resets the wave being built; other waves survive
+        pi.wave_add_new()
+        pi.wave_add_generic(pulses)
+        self._wave = pi.wave_create()
+        self._dout = pi.read(self.dout_pin)
+        self._last_sample = time.monotonic()
+        self._callbacks = [
+            pi.callback(self.dout_pin, pigpio.EITHER_EDGE, self._on_edge),
+            pi.callback(self.sck_pin, pigpio.FALLING_EDGE, self._on_edge),
+        ]
+        if self._dout == 0:
+            self._start_read()
+
+    def _teardown(self):
+        for callback in self._callbacks:
+            callback.cancel()
+        self._callbacks = []
+        try:
+            if self._wave is not None:
+                self.pi.wave_delete(self._wave)
+            self.pi.write(self.sck_pin, 0)
+        except Exception as e:
+            print(f"[HX711] Error releasing pigpio: {e}")
+        self._wave = None
+
+    def _start_read(self):
+        self._reading = True
+        self._bits = 0
+        self._value = 0
+        try:
+            self.pi.wave_send_once(self._wave)
+        except Exception as e:
+            self._reading = False
+            self.errors += 1
+            print(f"[HX711] Could not start read: {e}")
+
+    def _on_edge(self, gpio, level, tick):
+        # pigpio's callback thread; edges arrive in tick order
+        if gpio == self.dout_pin:
+            self._dout = level
+            if level == 0 and not self._reading:
+                self._start_read()
+            return
+        if not self._reading:
+            return
+        if self._bits < 24:
+            self._value = (self._value << 1) | self._dout
+        self._bits += 1
+        if self._bits == self.pulses:
+            self._reading = False
+            self._finish(to_signed(self._value))
+            # DOUT may already be low again if we were late
+            if self._dout == 0:
+                self._start_read()
+
+    def _finish(self, raw):
+        now = time.monotonic()
+        self._last_sample = now
+        if raw in (RAW_MIN, RAW_MAX):
+            # Saturated: overloaded or a broken load-cell wire
+            self.errors += 1
+            return
+        with self._lock:
+            self.samples.append((now, raw))
+            self.conversions += 1
+            recent = [value for _, value in list(self.samples)[-self.window:]]
+        if self.offset is None:
+            if len(recent) >= self.window:
+                self.zero()
+            return
+        self.weight.publish(self.to_kg(statistics.median(recent)), now)
+
+    def _check_stall(self):
+        if time.monotonic() - self._last_sample < self.stall_after:
+            return
+        # Holding PD_SCK high powers the chip down, dropping it resets it
+        print("[HX711] No conversions, power-cycling the HX711")
+        self.resets += 1
+        self._reading = False
+        try:
+            self.pi.gpio_trigger(self.sck_pin, POWER_DOWN_US, 1)
+        except Exception as e:
+            print(f"[HX711] Reset failed: {e}")
+        self._last_sample = time.monotonic()
+
+    def recent(self, count=None):
+        """The newest `count` (or all buffered) raw values, oldest first."""
+        with self._lock:
+            values = [value for _, value in self.samples]
+        return values if count is None else values[-count:]
+
+    def raw_mean(self, count=None):
+        values = self.recent(count)
+        return statistics.mean(values) if values else None
+
+    def raw_median(self, count=None):
+        values = self.recent(count)
+        return statistics.median(values) if values else None
+
+    def to_kg(self, raw):
+        return (raw - (self.offset or 0)) / self.scale_ratio / 1000.0
+
+    def weight_mean(self, count=None):
+        """Mean weight over the buffered conversions in kg, or None."""
+        raw = self.raw_mean(count)
+        return None if raw is None or self.offset is None else self.to_kg(raw)
+
+    def zero(self, count=None):
+        """Take the median of the last `count` (default window) conversions
+        as the zero point. Returns False with nothing buffered yet."""
+        raw = self.raw_median(count or self.window)
+        if raw is None:
+            return False
+        self.offset = raw
+        print(f"[HX711] Zeroed at raw {raw:.0f}")
+        if self.on_zero is not None:
+            self.on_zero(raw)
+        return True
+
+    def stop(self, timeout=1):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
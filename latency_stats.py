@@ -0,0 +1,157 @@
+# Per-command latency and traffic statistics for the ESP32 link.
+#
+# Every SerialBus transaction is recorded here: round-trip time into an
+# HDR-style histogram, bytes each way, timeouts, rejected commands and
+# replies that did not parse. Query it at runtime with snapshot() or print
+# report() (the app does so at the end of every session).
+
+import threading
+
+
+class LatencyHistogram:
+    """Log-linear histogram of durations, HDR style.
+
+    Values are kept in microseconds. Below 2**(sub_bits+1) us every value
+    has its own bucket; above that each power of two is split into
+    2**sub_bits buckets, so any recorded value is reproduced within about
+    1 / 2**sub_bits (3% for the default) while memory stays tiny.
+    """
+
+    def __init__(self, sub_bits=5):
+        self.sub_bits = sub_bits
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self._linear = 1 << (sub_bits + 1)
+        self._counts = {}
+
+    def _index(self, us):
+        if us < self._linear:
+            return us
+        shift = us.bit_length() - self.sub_bits - 1
+        return (shift << self.sub_bits) + (us >> shift)
+
+    def _value(self, index):
+        # Middle of the bucket, in seconds
+        if index < self._linear:
+            return index / 1e6
+        shift = (index >> self.sub_bits) - 1
+        mantissa = index - (shift << self.sub_bits)
+        return ((mantissa << shift) + (1 << shift) / 2) / 1e6
+
+    def record(self, seconds):
+        us = max(0, int(seconds * 1e6))
+        index = self._index(us)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+        rank = max(1, round(self.count * percent / 100.0))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class CommandStats:
+    """Counters and a latency histogram for one command name."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latency = LatencyHistogram()
+        self.timeouts = 0
+        self.rejected = 0
+        self.parse_errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+    def summary(self):
+        latency = self.latency
+        return {
+            "count": latency.count,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "parse_errors": self.parse_errors,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "mean_ms": round(latency.mean * 1000, 3),
+            "p50_ms": round(latency.percentile(50) * 1000, 3),
+            "p99_ms": round(latency.percentile(99) * 1000, 3),
+            "max_ms": round(latency.max * 1000, 3),
+        }
+
+
+class LinkStats:
+    """Thread-safe registry of CommandStats keyed by command name.
+
+    The name is the first word of the command ("stream 200" -> "stream"),
+    so arguments do not split the statistics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._commands = {}
+
+    def _get(self, command):
+        name = command.split(" ", 1)[0]
+        stats = self._commands.get(name)
+        if stats is None:
+            stats = self._commands[name] = CommandStats(name)
+        return stats
+
+    def sent(self, command, size):
+        with self._lock:
+            self._get(command).bytes_out += size
+
+    def reply(self, command, seconds, size):
+        with self._lock:
+            stats = self._get(command)
+            stats.latency.record(seconds)
+            stats.bytes_in += size
+
+    def timeout(self, command):
+        with self._lock:
+            self._get(command).timeouts += 1
+
+    def rejected(self, command, seconds):
+        with self._lock:
+            stats = self._get(command)
+            stats.rejected += 1
+            stats.latency.record(seconds)
+
+    def parse_error(self, command):
+        with self._lock:
+            self._get(command).parse_errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.summary() for name, stats in sorted(self._commands.items())}
+
+    def reset(self):
+        with self._lock:
+            self._commands.clear()
+
+    def report(self):
+        rows = self.snapshot()
+        if not rows:
+            return "[Link] No serial transactions recorded"
+        lines = [f"[Link] {'command':<12}{'count':>7}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+                 f"{'timeout':>9}{'reject':>8}{'parse':>7}{'out B':>8}{'in B':>8}"]
+        for name, s in rows.items():
+            lines.append(f"[Link] {name:<12}{s['count']:>7}{s['p50_ms']:>9.2f}{s['p99_ms']:>9.2f}{s['max_ms']:>9.2f}"
+                         f"{s['timeouts']:>9}{s['rejected']:>8}{s['parse_errors']:>7}{s['bytes_out']:>8}{s['bytes_in']:>8}")
+        return "\n".join(lines)
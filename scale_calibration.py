@@ -0,0 +1,172 @@
+# Load cell zero tracking and the booth's stored scale calibration.
+#
+# A load cell's zero wanders as the booth heats and cools through the day,
+# so a single tare at boot slowly eats into the empty-chamber and adult
+# thresholds. ZeroTracker follows that drift: whenever the chamber is
+# confirmed empty (settled, unoccupied) with the door locked, every reading
+# nudges a learned zero towards it, and all readings are published with
+# that zero taken off. Loads never count as drift: a reading more than
+# `band` off zero is ignored and the zero moves at most max_rate kg/h.
+# The ESP32 clamps its weight at 0 kg, so from it only upward drift (and
+# the way back) can be learned; downward drift needs a real tare.
+#
+# The learned zero is kept per booth in ScaleCalibration's JSON file
+# (BOOTH_CALIBRATION, default scale_calibration.json next to this file),
+# together with the Pi HX711 driver's raw zero. The ESP32 keeps its own
+# zero and factor in NVS. A real tare (ESP32 "tare" command or
+# PigpioHX711.zero) makes the sensor's zero current again, after which
+# the tracker starts over from 0:
+#
+#   python scale_calibration.py show
+#   python scale_calibration.py tare          # chamber empty, app stopped
+#   python scale_calibration.py cal 21.813    # store a new scale factor
+
+import argparse
+import json
+import math
+import os
+import time
+from datetime import datetime
+
+from sensor_service import LatestValue
+
+CALIBRATION_FILE = os.environ.get(
+    "BOOTH_CALIBRATION", os.path.join(os.path.dirname(os.path.abspath(__file__)), "scale_calibration.json"))
+
+
+class ScaleCalibration:
+    """Per-booth load cell calibration in a small JSON file.
+
+    zero_kg is the drift ZeroTracker has learned on top of the sensor's own
+    zero. hx711_offset and hx711_scale_ratio are the Pi HX711 driver's raw
+    zero and counts per gram, None until set. A missing or unreadable file
+    gives the defaults.
+    """
+
+    def __init__(self, path=CALIBRATION_FILE):
+        self.path = path
+        self.zero_kg = 0.0
+        self.hx711_offset = None
+        self.hx711_scale_ratio = None
+        self.updated = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.zero_kg = float(data.get("zero_kg", 0.0))
+            self.hx711_offset = data.get("hx711_offset")
+            self.hx711_scale_ratio = data.get("hx711_scale_ratio")
+            self.updated = data.get("updated")
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"[Scale] Could not read {self.path}, using defaults: {e}")
+            return False
+        return True
+
+    def save(self):
+        self.updated = datetime.now().isoformat(timespec="seconds")
+        data = {
+            "zero_kg": round(self.zero_kg, 4),
+            "hx711_offset": self.hx711_offset,
+            "hx711_scale_ratio": self.hx711_scale_ratio,
+            "updated": self.updated,
+        }
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            # Swap in whole, so a power cut never leaves half a file
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"[Scale] Could not save {self.path}: {e}")
+            return False
+        return True
+
+
+class ZeroTracker:
+    """Takes slow zero drift out of a weight stream.
+
+    Subscribes to `source` (a LatestValue in kg) and republishes every
+    reading minus the learned zero to its own `weight` LatestValue, with
+    the original timestamp. While empty() is true, readings within `band`
+    kg of zero pull the zero towards them with time constant `tau` seconds,
+    at most max_rate kg per hour. empty() runs on the sensor thread for
+    each such reading and must be quick.
+    """
+
+    def __init__(self, source, calibration, empty, tau=120.0, band=0.5, max_rate=2.0, save_every=300.0):
+        self.calibration = calibration
+        self.empty = empty
+        self.tau = tau
+        self.band = band
+        self.max_rate = max_rate
+        self.save_every = save_every
+        self.zero = calibration.zero_kg
+        self.tracking = False
+        self.weight = LatestValue(source.name)
+        self._last_timestamp = None
+        self._saved_zero = self.zero
+        self._saved_at = time.monotonic()
+        source.subscribe(self._on_reading)
+
+    def _on_reading(self, reading):
+        dt = 0.0 if self._last_timestamp is None else max(0.0, reading.timestamp - self._last_timestamp)
+        self._last_timestamp = reading.timestamp
+        net = reading.value - self.zero
+        self.tracking = dt > 0 and abs(net) < self.band and self.empty()
+        if self.tracking:
+            step = (1.0 - math.exp(-dt / self.tau)) * net
+            limit = self.max_rate * dt / 3600.0
+            self.zero += max(-limit, min(limit, step))
+            if abs(self.zero - self._saved_zero) >= 0.01 and time.monotonic() - self._saved_at >= self.save_every:
+                self.save()
+        self.weight.publish(reading.value - self.zero, reading.timestamp)
+
+    def save(self):
+        self.calibration.zero_kg = self.zero
+        self.calibration.save()
+        self._saved_zero = self.zero
+        self._saved_at = time.monotonic()
+
+    def reset(self):
+        """The sensor was just tared: forget the learned drift."""
+        print(f"[Scale] Zero tracking reset (had learned {self.zero:+.2f} kg)")
+        self.zero = 0.0
+        self.save()
+
+
+def main():
+    # Talks to the ESP32 directly, so run it while the app is stopped
+    from esp32_link import SerialBus
+    from sensor_service import SensorService
+
+    parser = argparse.ArgumentParser(description="Load cell calibration for this booth")
+    parser.add_argument("action", choices=("show", "tare", "cal"))
+    parser.add_argument("factor", nargs="?", type=float, help="scale factor for 'cal'")
+    args = parser.parse_args()
+
+    calibration = ScaleCalibration()
+    bus = SerialBus()
+    try:
+        bus.start()
+        sensors = SensorService(bus)
+        if args.action == "tare":
+            if sensors.tare() is None:
+                print("[Scale] The ESP32 did not confirm the tare")
+                return
+            calibration.zero_kg = 0.0
+            calibration.save()
+        elif args.action == "cal" and args.factor is not None:
+            sensors.calibration(args.factor)
+        print(f"[Scale] ESP32: {sensors.calibration()}")
+        print(f"[Scale] {calibration.path}: learned zero {calibration.zero_kg:+.3f} kg, "
+              f"updated {calibration.updated}")
+    finally:
+        bus.close()
+
+
+if __name__ == "__main__":
+    main()
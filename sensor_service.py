@@ -0,0 +1,500 @@
+# Background sensor acquisition for the ESP32 link.
+#
+# A single thread keeps sampling weight and temperature through the serial
+# bus. Control loops and the GUI read the cached values from LatestValue
+# slots instead of doing their own serial round-trips.
+#
+# The same thread supervises the link. `state` is LINK_CONNECTED while
+# readings keep arriving, LINK_DEGRADED once none has arrived for
+# stale_after, and LINK_LOST after lost_after or a serial error, at which
+# point the port is closed and reopened with exponential backoff. Readers
+# use LatestValue.fresh(), which gives None for stale data, so a dead link
+# shows up as "no reading" within stale_after seconds instead of as 0.0.
+#
+# Readings are stamped with when the ESP32 sampled them, not when they
+# arrived: get_all reports sample ages, and with timestamps on the pushed
+# values carry the firmware's millis(), mapped onto time.monotonic() by a
+# ClockSync fed with periodic "sync" round trips. Freshness checks then
+# measure the real sample age, link latency included.
+#
+# Pushed values carry no thermocouple fault bit, so while streaming the
+# thread asks for "temp_stats" every TEMP_FAULT_CHECK seconds to keep
+# temp_fault current (polling gets it with every get_all).
+
+import threading
+import time
+from collections import namedtuple
+
+import serial
+
+from clock_sync import ClockSync
+from esp32_link import CommandRejected, SerialBus
+from esp32_protocol import (
+    ALL_PREFIX,
+    BINARY_PREFIX,
+    CAL_PREFIX,
+    MSG_PREFIXES,
+    STREAM_PREFIX,
+    SYNC_PREFIX,
+    TARE_PREFIX,
+    TEMP_PREFIX,
+    TEMP_STATS_PREFIX,
+    TIMESTAMPS_PREFIX,
+    WEIGHT_PREFIX,
+    WEIGHT_STATS_PREFIX,
+    parse_all,
+    parse_calibration,
+    parse_reply,
+    parse_stamped_reply,
+    parse_temp_stats,
+    parse_weight_stats,
+)
+
+# value is the sensor reading, timestamp is time.monotonic() at capture
+Reading = namedtuple("Reading", ["value", "timestamp"])
+
+LINK_CONNECTED = "connected"
+LINK_DEGRADED = "degraded"
+LINK_LOST = "lost"
+
+TEMP_FAULT_CHECK = 1.0  # Seconds between temp_stats requests while streaming
+
+
+class LatestValue:
+    """Single-slot store for the most recent Reading.
+
+    The writer replaces the stored tuple in one assignment and readers only
+    grab the reference, so neither side ever takes a lock. Subscribers are
+    called with every new Reading on the writer's thread and must not block.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._reading = None
+        self._listeners = []
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def publish(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        reading = Reading(value, timestamp)
+        self._reading = reading
+        for listener in self._listeners:
+            try:
+                listener(reading)
+            except Exception as e:
+                print(f"[Sensors] {self.name} listener failed: {e}")
+
+    def get(self):
+        return self._reading
+
+    def value(self, default=None):
+        reading = self._reading
+        return default if reading is None else reading.value
+
+    def age(self):
+        reading = self._reading
+        if reading is None:
+            return None
+        return time.monotonic() - reading.timestamp
+
+    def fresh(self, max_age):
+        # The value if it is at most max_age seconds old, otherwise None
+        reading = self._reading
+        if reading is None or time.monotonic() - reading.timestamp > max_age:
+            return None
+        return reading.value
+
+
+class SensorService(threading.Thread):
+    """Keeps the weight and temperature slots up to date over a SerialBus.
+
+    With stream_ms set, the firmware is asked to push KG:/TEMP: frames every
+    stream_ms and the thread only watches for silence; otherwise (or if the
+    firmware does not know the stream command) it polls at sample_hz with
+    one get_all per sample (or pipelined get_weight/get_temp on firmware
+    without get_all). binary=True also
+    switches the pushed frames to the compact CRC-checked binary format.
+
+    stale_after defaults to three polling periods (at least 1 s). If the
+    port cannot be opened, or the link is lost, it is retried after
+    reconnect_min seconds, doubling up to reconnect_max.
+
+    timestamps=True asks the firmware to stamp pushed values with their
+    capture time and syncs `clock` every sync_interval seconds; firmware
+    without either command is used unstamped.
+    """
+
+    def __init__(self, bus=None, sample_hz=2.0, stream_ms=None, binary=False,
+                 stale_after=None, lost_after=5.0, reconnect_min=0.5, reconnect_max=30.0,
+                 timestamps=True, sync_interval=2.0):
+        super().__init__(name="sensor-service", daemon=True)
+        self.bus = bus if bus is not None else SerialBus()
+        self.sample_hz = sample_hz
+        self.stream_ms = stream_ms
+        self.binary = binary
+        self.stale_after = stale_after if stale_after is not None else max(1.0, 3.0 / sample_hz)
+        self.lost_after = max(lost_after, self.stale_after)
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.state = LINK_LOST
+        self.reconnects = 0
+        self.timestamps = timestamps
+        self.sync_interval = sync_interval
+        self.clock = ClockSync()
+        self.stamped = False
+        self._next_sync = 0.0
+        self.weight = LatestValue("weight")
+        self.temperature = LatestValue("temperature")
+        self.samples = 0
+        self.errors = 0
+        self.batched = True
+        self.temp_fault = False
+        self._fault_checks = True
+        self._next_fault_check = 0.0
+        self._slots = {WEIGHT_PREFIX: self.weight, TEMP_PREFIX: self.temperature}
+        self._last_push = time.monotonic()
+        self._opened_at = time.monotonic()
+        # Link health goes by arrival time; readings carry capture time
+        self._last_arrival = 0.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        self.bus.subscribe(self._on_push)
+        backoff = self.reconnect_min
+        while not self._stop_event.is_set():
+            try:
+                self.bus.start()
+            except (serial.SerialException, OSError) as e:
+                self._set_state(LINK_LOST, f"cannot open serial port: {e}")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.reconnect_max)
+                continue
+            self._opened_at = time.monotonic()
+            backoff = self.reconnect_min
+            if self.timestamps:
+                self._start_clock()
+
+            # Both loops return when stopped or when the link is lost.
+            # _run_stream() returns False when the firmware refuses push mode
+            if not (self.stream_ms and self._run_stream()):
+                self._run_polling()
+
+            self.bus.close()
+            if not self._stop_event.is_set():
+                self.reconnects += 1
+                print(f"[Sensors] Reopening serial link in {backoff:.1f}s")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.reconnect_max)
+
+    def link_age(self):
+        """Seconds since a reading last arrived (or since the port was
+        opened, if nothing has arrived since)."""
+        return time.monotonic() - max(self._last_arrival, self._opened_at)
+
+    def _check_link(self):
+        # Updates `state`; returns False once the link should be reopened
+        if not self.bus.alive:
+            self._set_state(LINK_LOST, f"serial error: {self.bus.error}")
+            return False
+        age = self.link_age()
+        if age > self.lost_after:
+            self._set_state(LINK_LOST, f"no reading for {age:.1f}s")
+            return False
+        if age > self.stale_after:
+            self._set_state(LINK_DEGRADED, f"no reading for {age:.1f}s")
+        else:
+            self._set_state(LINK_CONNECTED)
+        return True
+
+    def _set_state(self, state, reason=None):
+        if state == self.state:
+            return
+        detail = f" ({reason})" if reason else ""
+        print(f"[Sensors] Link {self.state} -> {state}{detail}")
+        self.state = state
+
+    def _run_polling(self):
+        period = 1.0 / self.sample_hz
+        next_sample = time.monotonic()
+        while not self._stop_event.is_set() and self._check_link():
+            self._maybe_sync()
+            if self.batched:
+                self._poll_all()
+            else:
+                # Both requests go out back to back and are answered in order
+                weight = self.bus.request("get_weight", expect=WEIGHT_PREFIX)
+                temp = self.bus.request("get_temp", expect=TEMP_PREFIX)
+                self._collect(weight, self.weight, "get_weight")
+                self._collect(temp, self.temperature, "get_temp")
+
+            # Sample on a fixed grid; if a round-trip overran, skip ahead
+            # instead of bursting to catch up.
+            next_sample += period
+            delay = next_sample - time.monotonic()
+            if delay < 0:
+                next_sample = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def _poll_all(self):
+        # Both sensors in one round trip, from the same firmware snapshot
+        try:
+            reply = self.bus.query("get_all", expect=ALL_PREFIX)
+        except CommandRejected:
+            print("[Sensors] Firmware has no get_all, requesting sensors separately")
+            self.batched = False
+            return
+        except (TimeoutError, ConnectionError, serial.SerialException) as e:
+            self.errors += 1
+            print(f"[Sensors] get_all request failed: {e}")
+            return
+        reading = parse_all(reply)
+        if reading is None:
+            self.errors += 1
+            self.bus.stats.parse_error("get_all")
+            print(f"[Sensors] Unexpected get_all reply: {reply}")
+            return
+        # Stamp each value with when the firmware sampled it, not when it arrived
+        now = time.monotonic()
+        self.weight.publish(reading.kg, now - reading.weight_age_ms / 1000.0)
+        self.temperature.publish(reading.celsius, now - reading.temp_age_ms / 1000.0)
+        self._set_temp_fault(reading.temp_fault)
+        self._last_arrival = now
+        self.samples += 1
+
+    def _run_stream(self):
+        # Returns True when stopped or the link was lost, False if the firmware refused
+        # push mode and the caller should fall back to polling.
+        setup = ["timestamps on"] if self.stamped else []
+        if self.binary:
+            if self._handshake("binary on", BINARY_PREFIX) == 1:
+                print("[Sensors] Using binary frames")
+                setup.append("binary on")
+            else:
+                print("[Sensors] Firmware has no binary mode, using text frames")
+        stream_command = f"stream {int(self.stream_ms)}"
+        interval = self._handshake(stream_command, STREAM_PREFIX)
+        if interval is None:
+            print("[Sensors] Firmware has no stream command, polling instead")
+            if setup:
+                self.bus.send("binary off")
+            return False
+        print(f"[Sensors] Streaming every {int(interval)} ms")
+        setup.append(stream_command)
+
+        # No frame for this long means the ESP32 reset or the link dropped
+        silence_limit = max(1.0, 5 * interval / 1000.0)
+        self._last_push = time.monotonic()
+        while not self._stop_event.wait(0.1) and self._check_link():
+            self._maybe_sync()
+            self._check_temp_fault()
+            if time.monotonic() - self._last_push > silence_limit:
+                # A rebooted ESP32 comes back at the boot baud rate in text
+                # request/response mode
+                print("[Sensors] Stream went silent, re-sending stream setup")
+                self.errors += 1
+                self._next_sync = 0.0  # A reboot restarts millis(), realign first
+                try:
+                    self.bus.resync()
+                    for command in setup:
+                        self.bus.send(command)
+                except (ConnectionError, serial.SerialException) as e:
+                    print(f"[Sensors] Stream setup failed: {e}")
+                self._last_push = time.monotonic()
+
+        try:
+            self.bus.send("stream off")
+            self.bus.send("binary off")
+        except Exception:
+            pass
+        return True
+
+    def _check_temp_fault(self):
+        now = time.monotonic()
+        if not self._fault_checks or now < self._next_fault_check:
+            return
+        self._next_fault_check = now + TEMP_FAULT_CHECK
+        try:
+            reply = self.bus.query("temp_stats", expect=TEMP_STATS_PREFIX, timeout=0.5)
+        except CommandRejected:
+            print("[Sensors] Firmware has no temp_stats, thermocouple faults are not reported")
+            self._fault_checks = False
+            return
+        except (TimeoutError, ConnectionError, serial.SerialException):
+            return
+        stats = parse_temp_stats(reply)
+        if stats is None:
+            self.bus.stats.parse_error("temp_stats")
+            return
+        self._set_temp_fault(stats.fault)
+
+    def _set_temp_fault(self, fault):
+        if fault != self.temp_fault:
+            print(f"[Sensors] Thermocouple {'fault' if fault else 'fault cleared'}")
+        self.temp_fault = fault
+
+    def _handshake(self, command, expected, timeout=2.0):
+        # Send a mode command and wait for its text ack. Returns the ack
+        # value, or None if the firmware rejected the command or stayed silent.
+        try:
+            reply = self.bus.query(command, expect=expected, timeout=timeout)
+        except (CommandRejected, TimeoutError, ConnectionError, serial.SerialException):
+            return None
+        prefix, value = parse_reply(reply)
+        if prefix != expected:
+            self.bus.stats.parse_error(command)
+            return None
+        return value
+
+    def weight_stats(self, timeout=1.0):
+        """Ask the firmware how fresh its load cell buffer is.
+
+        Returns a WeightStats (kg, age_ms, averaged, total), or None if the
+        firmware predates the ring buffer or did not answer.
+        """
+        try:
+            reply = self.bus.query("weight_stats", expect=WEIGHT_STATS_PREFIX, timeout=timeout)
+        except (CommandRejected, TimeoutError, ConnectionError, serial.SerialException):
+            return None
+        stats = parse_weight_stats(reply)
+        if stats is None:
+            self.bus.stats.parse_error("weight_stats")
+        return stats
+
+    def temp_stats(self, timeout=1.0):
+        """Cached thermocouple value, its age and the open-circuit fault bit.
+
+        Returns a TempStats (celsius, age_ms, fault), or None on firmware
+        without the cache.
+        """
+        try:
+            reply = self.bus.query("temp_stats", expect=TEMP_STATS_PREFIX, timeout=timeout)
+        except (CommandRejected, TimeoutError, ConnectionError, serial.SerialException):
+            return None
+        stats = parse_temp_stats(reply)
+        if stats is None:
+            self.bus.stats.parse_error("temp_stats")
+        return stats
+
+    def tare(self, timeout=3.0):
+        """Re-zero the ESP32's load cell now; the firmware stores the new
+        zero in its NVS. The chamber must be empty.
+
+        Returns the kg the tare removed, or None if the firmware has no
+        tare command or did not answer.
+        """
+        try:
+            reply = self.bus.query("tare", expect=TARE_PREFIX, timeout=timeout)
+        except (CommandRejected, TimeoutError, ConnectionError, serial.SerialException):
+            return None
+        prefix, removed = parse_reply(reply)
+        if prefix != TARE_PREFIX:
+            self.bus.stats.parse_error("tare")
+            return None
+        print(f"[Sensors] Load cell tared, {removed:.2f} kg removed")
+        return removed
+
+    def calibration(self, factor=None, timeout=1.0):
+        """The ESP32's stored load cell Calibration (offset, factor); with
+        factor, store that scale factor first. None on older firmware."""
+        command = "cal" if factor is None else f"cal {factor}"
+        try:
+            reply = self.bus.query(command, expect=CAL_PREFIX, timeout=timeout)
+        except (CommandRejected, TimeoutError, ConnectionError, serial.SerialException):
+            return None
+        calibration = parse_calibration(reply)
+        if calibration is None:
+            self.bus.stats.parse_error("cal")
+        return calibration
+
+    def _collect(self, future, slot, command):
+        try:
+            reply = future.result(self.bus.timeout + 0.5)
+        except Exception as e:
+            self.errors += 1
+            print(f"[Sensors] {slot.name} request failed: {e}")
+            return
+        if not self._publish(reply):
+            self.errors += 1
+            self.bus.stats.parse_error(command)
+            print(f"[Sensors] Unexpected {slot.name} reply: {reply}")
+
+    def _start_clock(self):
+        # Sync first so stamps can be mapped as soon as they arrive
+        self._next_sync = 0.0
+        self._maybe_sync()
+        self.stamped = self._handshake("timestamps on", TIMESTAMPS_PREFIX) == 1
+        if not self.stamped:
+            print("[Sensors] Firmware has no sample timestamps, stamping on arrival")
+
+    def _maybe_sync(self):
+        # One "sync" round trip per sync_interval; the reply is handled on
+        # the bus reader thread so the arrival time is exact
+        if not self.timestamps or time.monotonic() < self._next_sync:
+            return
+        self._next_sync = time.monotonic() + self.sync_interval
+        sent = time.monotonic()
+        future = self.bus.request("sync", expect=SYNC_PREFIX)
+        future.add_done_callback(lambda done: self._on_sync(done, sent))
+
+    def _on_sync(self, future, sent):
+        received = time.monotonic()
+        try:
+            reply = future.result()
+        except CommandRejected:
+            print("[Sensors] Firmware has no sync command, clock alignment off")
+            self.timestamps = False
+            return
+        except Exception:
+            return  # Timeouts and link errors: try again next interval
+        prefix, value = parse_reply(reply)
+        if prefix != SYNC_PREFIX:
+            self.bus.stats.parse_error("sync")
+            return
+        first = not self.clock.synced
+        self.clock.add(sent, int(value), received)
+        if first:
+            print(f"[Clock] Synced to ESP32: {self.clock.summary()}")
+
+    def _capture_time(self, stamp_ms):
+        # Pi time at which the firmware sampled the value; arrival time if
+        # the value is unstamped or the clocks are not aligned yet
+        now = time.monotonic()
+        if stamp_ms is None:
+            return now
+        local = self.clock.to_local(stamp_ms)
+        if local is None:
+            return now
+        return min(local, now)  # A stamp from the future is sync error
+
+    def _on_push(self, item):
+        if self._publish(item):
+            self._last_push = time.monotonic()
+
+    def _publish(self, item):
+        # item is a text line or a binary Frame from the bus
+        if isinstance(item, str):
+            prefix, value, stamp_ms = parse_stamped_reply(item)
+        else:
+            prefix, value, stamp_ms = MSG_PREFIXES.get(item.msg_type), item.value, item.stamp_ms
+        slot = self._slots.get(prefix)
+        if slot is None:
+            return False
+        if prefix == TEMP_PREFIX and value != value:
+            # NaN: the firmware read an open thermocouple
+            self._set_temp_fault(True)
+            self._last_arrival = time.monotonic()
+            return True
+        slot.publish(value, self._capture_time(stamp_ms))
+        self._last_arrival = time.monotonic()
+        if prefix == TEMP_PREFIX:
+            self.samples += 1
+        return True
+
+    def stop(self, timeout=3):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,524 @@
+# Declarative session profiles for the person, clothes and surrounding modes.
+#
+# A profile is a list of phases. build_session() resolves the heat/speed
+# parameters and compiles every phase into a per-tick table of
+# (heater, fan, door, label) rows, so SessionRunner only has to look up the
+# current row each tick. New programs are new entries in PROFILES.
+#
+# Phase keys (all optional except name):
+#   duration      seconds, or a parameter name ("x", "z", ...)
+#   starts_timer  parameter name; starts the session timer with that length
+#   until_timer   True: the phase runs until the session timer expires
+#   heater        True / False, "cycle" for ON "y" seconds / OFF "w" seconds, or
+#                 "control" to hold the "setpoint" with a closed-loop controller
+#   control       {"type": "pid" / "hysteresis", ...tuning} for "control" phases
+#   fan           [(second, pwm_percent), ...] steps from the phase start
+#   door          "locked" / "unlocked" when the phase starts
+#   door_at       [(second, "locked" / "unlocked"), ...]
+#   label         status text; {left}, {mm}, {ss} and params ({x}, {w}, ...)
+#   start_label   status shown once when the phase starts
+#   end_label     status shown when the phase ends, then held for "hold" s
+#   guard         {"limit": 150, "every": 5} temperature cutoff
+#   gate          {"type": "empty", ...} or {"type": "entry", ...} weight gate
+
+import asyncio
+
+from temp_controller import CONTROL_PERIOD, make_controller
+from tick_scheduler import TickScheduler
+from weight_pipeline import WeightPipeline
+
+# Shared by all modes: Speed selection -> session length z and heater OFF time w
+SPEED_LEVELS = {
+    1: {"z": 180, "w": 25},
+    2: {"z": 240, "w": 33},
+    3: {"z": 300, "w": 41},
+}
+
+# Heat selection -> preheat x, heater ON time y and the closed-loop setpoint
+# in degC (heat_duration is for display)
+HEAT_LEVELS = {
+    "person": {
+        "Low": {"x": 105, "y": 10, "setpoint": 120, "heat_duration": 120},
+        "Medium": {"x": 110, "y": 15, "setpoint": 130, "heat_duration": 130},
+        "High": {"x": 115, "y": 20, "setpoint": 140, "heat_duration": 140},
+    },
+    "clothes": {
+        "Low": {"x": 110, "y": 25, "setpoint": 125, "heat_duration": 120},
+        "Medium": {"x": 120, "y": 30, "setpoint": 135, "heat_duration": 130},
+        "High": {"x": 130, "y": 35, "setpoint": 140, "heat_duration": 140},
+    },
+    "surrounding": {
+        "Low": {"x": 105, "y": 10, "setpoint": 120, "heat_duration": 120},
+        "Medium": {"x": 110, "y": 15, "setpoint": 130, "heat_duration": 130},
+        "High": {"x": 115, "y": 20, "setpoint": 140, "heat_duration": 140},
+    },
+}
+
+DEFAULT_HEAT_LEVEL = "Medium"
+DEFAULT_SPEED_VALUE = 1
+
+OVERHEAT_GUARD = {"limit": 150, "every": 5}
+
+# How each program's main heat phase drives the heater: "cycle" is the fixed
+# Y-on/W-off duty cycle, "pid" and "hysteresis" hold the heat level's
+# setpoint with temp_controller, sampling every CONTROL_PERIOD seconds.
+# Every program ships with the cycle validated on the hardware; the
+# closed-loop modes are opt-in (here, or build_session(control=...)) until
+# CONTROL_TUNING and the HEAT_LEVELS setpoints are tuned on a real booth.
+HEATER_CONTROL = {"person": "cycle", "clothes": "cycle", "surrounding": "cycle"}
+
+# Tuned on SimulatedBooth only
+CONTROL_TUNING = {
+    "pid": {"type": "pid", "kp": 0.08, "ki": 0.004, "kd": 0.0, "cycle_time": 4.0},
+    "hysteresis": {"type": "hysteresis", "below": 3.0, "above": 1.0},
+}
+
+_HEAT_CYCLE = {
+    "name": "cycle",
+    "heater": "cycle",
+    "fan": [(0, 25)],
+    "guard": OVERHEAT_GUARD,
+    "label": "Time left: {left}s",
+    "end_label": "Heating cycle complete. Heater OFF.",
+    "hold": 1,
+}
+
+_FAN_PURGE = {
+    "name": "purge",
+    "duration": 180,
+    "heater": False,
+    "fan": [(0, 100)],
+    "start_label": "Fan at 100% for 3 min.",
+    "label": "Fan 100%: {left}s left",
+}
+
+_COOLDOWN = {
+    "name": "cooldown",
+    "duration": 300,
+    "heater": False,
+    "fan": [(0, 0)],
+    "guard": OVERHEAT_GUARD,
+    "start_label": "Cooldown: 5 min safety timer.",
+    "label": "Please wait: {mm:02d}:{ss:02d} remaining (Cooldown)",
+    "end_label": "Session complete. Unlocking door.",
+}
+
+_UNLOCK = {
+    "name": "unlock",
+    "duration": 2,
+    "door": "unlocked",
+    "end_label": "Done. Door unlocked.",
+    "hold": 3,
+}
+
+PROFILES = {
+    "person": [
+        {"name": "lock", "door": "locked", "end_label": "Door locked."},
+        {
+            "name": "preheat",
+            "duration": "x",
+            "heater": True,
+            "fan": [(0, 10), (60, 25)],
+            "door_at": [(30, "unlocked")],
+            "gate": {"type": "entry", "opens_at": 30, "adult_above": 50, "pause_after": 15, "reject_hold": 2},
+            "label": "Preheating: ({left}s left)",
+            "end_label": "Preheat complete. Heater OFF.",
+            "hold": 1,
+        },
+        dict(_HEAT_CYCLE, duration="z"),
+        _FAN_PURGE,
+        _COOLDOWN,
+        _UNLOCK,
+    ],
+    "clothes": [
+        {
+            "name": "empty_check",
+            "door": "unlocked",
+            "fan": [(0, 10)],
+            "gate": {"type": "empty", "below": 10, "poll": 2},
+        },
+        {
+            "name": "preheat",
+            "duration": "x",
+            "starts_timer": "z",
+            "heater": True,
+            "fan": [(30, 25)],
+            "start_label": "Heater ON for {x}s",
+            "label": "Heater ON. {left}s left",
+            "end_label": "Preheat done. Starting main heat cycle.",
+            "hold": 1,
+        },
+        dict(_HEAT_CYCLE, until_timer=True),
+        _FAN_PURGE,
+        _COOLDOWN,
+        _UNLOCK,
+    ],
+    "surrounding": [
+        {"name": "lock", "door": "locked"},
+        {
+            "name": "preheat",
+            "duration": "x",
+            "starts_timer": "z",
+            "heater": True,
+            "fan": [(0, 10), (60, 25)],
+            "start_label": "Heater ON for {x}s",
+            "label": "Heater ON. {left}s left",
+            "end_label": "Preheat done. Starting main heat cycle.",
+            "hold": 1,
+        },
+        dict(_HEAT_CYCLE, until_timer=True),
+        _FAN_PURGE,
+        _COOLDOWN,
+        _UNLOCK,
+    ],
+}
+
+
+def session_params(mode, heat_level, speed_value):
+    heat = HEAT_LEVELS[mode].get(heat_level, HEAT_LEVELS[mode][DEFAULT_HEAT_LEVEL])
+    speed = SPEED_LEVELS.get(speed_value, SPEED_LEVELS[DEFAULT_SPEED_VALUE])
+    return dict(heat, **speed)
+
+
+class CompiledPhase:
+    """One phase with its per-tick output table.
+
+    rows[i] is (heater, fan, door, label): the full output state for that
+    tick, so a runner that skipped ticks can apply any row directly. fan and
+    door are None until the phase first sets them. Cycle phases repeat rows
+    every `period` ticks; off_index is the first OFF row of the cycle.
+    """
+
+    def __init__(self, spec, params):
+        self.name = spec["name"]
+        self.spec = spec
+        self.params = params
+        duration = spec.get("duration")
+        self.length = params[duration] if isinstance(duration, str) else duration
+        self.until_timer = spec.get("until_timer", False)
+        timer = spec.get("starts_timer")
+        self.timer_length = params[timer] if timer else None
+        self.door = spec.get("door")
+        self.guard = spec.get("guard")
+        self.gate = spec.get("gate")
+        self.hold = spec.get("hold", 0)
+        self.start_label = self._format(spec.get("start_label"))
+        self.end_label = self._format(spec.get("end_label"))
+        self.heater = spec.get("heater")
+        self.control = spec.get("control")
+        self.rows, self.period, self.off_index = self._build_rows(spec, params)
+
+    def _format(self, text):
+        return text.format(**self.params) if text else None
+
+    def _build_rows(self, spec, params):
+        heater = spec.get("heater", False)
+        label = spec.get("label")
+        if heater == "cycle":
+            on, off = params["y"], params["w"]
+            period = on + off
+            rows = [[p < on, None, None, label] for p in range(period)]
+            off_index = on
+        elif heater == "control":
+            # The controller switches the heater; rows leave it alone
+            period = self.length or 1
+            rows = [[None, None, None, label] for _ in range(period)]
+            off_index = None
+        else:
+            period = self.length or 1
+            rows = [[bool(heater), None, None, label] for _ in range(period)]
+            off_index = None
+        # Steps hold until the next step
+        for column, steps in ((1, spec.get("fan", [])), (2, spec.get("door_at", []))):
+            for second, value in steps:
+                for row in rows[second:]:
+                    row[column] = value
+        return [tuple(row) for row in rows], period, off_index
+
+    def row(self, position):
+        return self.rows[position % self.period]
+
+    def status(self, label, left):
+        if label is None:
+            return None
+        return label.format(left=left, mm=left // 60, ss=left % 60, **self.params)
+
+
+def build_session(mode, heat_level, speed_value, control=None):
+    """Compile a mode's profile. control ("cycle", "pid", "hysteresis")
+    overrides HEATER_CONTROL for the mode's heat cycle phases."""
+    params = session_params(mode, heat_level, speed_value)
+    control = control or HEATER_CONTROL.get(mode, "cycle")
+    specs = PROFILES[mode]
+    if control != "cycle":
+        specs = [dict(spec, heater="control", control=CONTROL_TUNING[control])
+                 if spec.get("heater") == "cycle" else spec for spec in specs]
+    return [CompiledPhase(spec, params) for spec in specs]
+
+
+class SessionRunner:
+    """Executes compiled phases against a booth io object, one tick per second.
+
+    io provides: async heater(on), async fan(percent), async door(locked),
+    weight(), temperature() and status(message). weight() and temperature()
+    return None when no fresh reading exists: the overheat guard then turns
+    the heater off as if the limit were hit, and the weight gates wait as
+    if the chamber were occupied (empty gate) or not yet entered (entry
+    gate).
+
+    The gates decide on a WeightPipeline (filtered, debounced weight and a
+    sequential adult / not adult classifier), never on single readings. If
+    io.occupancy is a pipeline fed by the sensor itself, the gates also
+    wake on its events between ticks; otherwise the runner feeds its own
+    pipeline from each weight() read.
+
+    Phases with heater "control" run a temp_controller controller as a
+    separate task next to the tick loop, so the heater follows the
+    thermocouple every CONTROL_PERIOD instead of a fixed duty cycle.
+
+    All waiting goes through one TickScheduler, so phase edges land on
+    absolute deadlines and the whole session lasts exactly as long as its
+    profile says.
+    """
+
+    def __init__(self, phases, io, tick=1.0, scheduler=None):
+        self.phases = phases
+        self.io = io
+        self.clock = scheduler if scheduler is not None else TickScheduler(tick)
+        # Scheduler tick at which the session timer (speed duration) runs out
+        self.timer_end = None
+        self.outputs = {"heater": None, "fan": None, "door": None}
+        self.occupancy = getattr(io, "occupancy", None)
+        self._feeds_occupancy = self.occupancy is None
+        if self._feeds_occupancy:
+            self.occupancy = WeightPipeline()
+        self._occupancy_changed = None
+
+    async def run(self):
+        """Returns True if the session completed, False if a gate aborted it."""
+        self.clock.start()
+        loop = asyncio.get_running_loop()
+        self._occupancy_changed = asyncio.Event()
+        listener = None
+        if not self._feeds_occupancy:
+            # Pipeline events arrive on the sensor thread
+            def listener(event):
+                loop.call_soon_threadsafe(self._occupancy_changed.set)
+            self.occupancy.listeners.append(listener)
+        try:
+            for phase in self.phases:
+                if not await self._run_phase(phase):
+                    return False
+            return True
+        finally:
+            # Whatever happened (completion, abort, cancel), leave the heater off
+            if self.outputs["heater"]:
+                await self.io.heater(False)
+            if listener is not None:
+                self.occupancy.listeners.remove(listener)
+            self.occupancy.classifier = None
+            clock = self.clock
+            print(f"[Session] Timing: {clock.jitter.summary()}, {clock.misses} missed, {clock.skipped} ticks skipped")
+
+    async def _run_phase(self, phase):
+        if phase.door is not None:
+            await self._set("door", phase.door)
+        if phase.start_label:
+            self.io.status(phase.start_label)
+        if phase.timer_length is not None:
+            self.timer_end = self.clock.ticks + round(phase.timer_length / self.clock.period)
+
+        if phase.gate and phase.gate["type"] == "empty":
+            await self._apply(phase.row(0))
+            await self._empty_gate(phase.gate)
+
+        if phase.until_timer:
+            length = max(0, (self.timer_end or 0) - self.clock.ticks)
+        else:
+            length = phase.length or 0
+
+        entry = None
+        if phase.gate and phase.gate["type"] == "entry":
+            entry = {"entered": False, "announced": False}
+            self.occupancy.classify(phase.gate["adult_above"])
+        position = 0
+        elapsed = 0
+        next_guard = 0
+        control = None
+        if phase.heater == "control":
+            control = asyncio.ensure_future(self._control_heater(phase))
+        try:
+            while elapsed < length:
+                heater, fan, door, label = phase.row(position)
+                await self._apply((heater, fan, door, label))
+                message = phase.status(label, length - elapsed)
+
+                if entry is not None:
+                    outcome, gate_message = await self._entry_gate(phase, entry, elapsed)
+                    if outcome == "abort":
+                        return False
+                    message = gate_message or message
+
+                if phase.guard and elapsed >= next_guard:
+                    next_guard = elapsed + phase.guard["every"]
+                    temp = self.io.temperature()
+                    if temp is None or temp >= phase.guard["limit"]:
+                        message = await self._overheat(phase, temp, heater)
+                        if phase.off_index is not None and heater:
+                            # Skip the rest of this ON segment
+                            position = phase.off_index - 1
+
+                if message:
+                    self.io.status(message)
+                if entry is not None and not entry["entered"]:
+                    # Re-check the gate on every occupancy event, not once a tick
+                    step = await self._next_tick_or_occupancy()
+                else:
+                    step = await self.clock.next_tick()
+                elapsed += step
+                position += step
+        finally:
+            if control is not None:
+                control.cancel()
+                await asyncio.gather(control, return_exceptions=True)
+
+        if phase.heater:
+            await self._set("heater", False)
+        if phase.end_label:
+            self.io.status(phase.end_label)
+        if phase.hold:
+            await self.clock.sleep(phase.hold)
+        return True
+
+    async def _apply(self, row):
+        heater, fan, door, _ = row
+        if heater is not None:
+            await self._set("heater", heater)
+        if fan is not None:
+            await self._set("fan", fan)
+        if door is not None:
+            await self._set("door", door)
+
+    async def _set(self, output, value):
+        # Only touch the hardware when the table asks for a change
+        if self.outputs[output] == value:
+            return
+        self.outputs[output] = value
+        if output == "heater":
+            await self.io.heater(value)
+        elif output == "fan":
+            await self.io.fan(value)
+        else:
+            await self.io.door(value == "locked")
+
+    async def _control_heater(self, phase):
+        # Closed loop for "control" phases: sample the thermocouple every
+        # CONTROL_PERIOD, far more often than the phase's 1 s ticks, and let
+        # the controller switch the heater. Never ON at or over the guard
+        # limit or without a reading
+        controller = make_controller(phase.control, phase.params["setpoint"])
+        limit = phase.guard["limit"] if phase.guard else None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            temp = self.io.temperature()
+            on = controller.heater_on(temp, loop.time())
+            if on and limit is not None and temp >= limit:
+                on = False
+            await self._set("heater", on)
+            deadline += CONTROL_PERIOD
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    async def _overheat(self, phase, temp, heater_on):
+        await self._set("heater", False)
+        if phase.off_index is None:
+            return None
+        if temp is None:
+            return "No temperature reading. Heater OFF."
+        if heater_on:
+            return f"Temperature >{phase.guard['limit']}°C ({temp}°C). Heater OFF for {phase.params['w']}s."
+        return f"Temperature >{phase.guard['limit']}°C ({temp}°C). Heater remains OFF."
+
+    def _weight(self):
+        # Fresh reading (None if stale); also feeds the runner's own pipeline
+        weight = self.io.weight()
+        if self._feeds_occupancy:
+            self.occupancy.feed(weight, asyncio.get_running_loop().time())
+        return weight
+
+    def _chamber_empty(self, below):
+        # A missing reading or undecided occupancy counts as occupied, so
+        # the door is never locked blind
+        weight = self._weight()
+        occupancy = self.occupancy
+        return weight is not None and occupancy.occupied is False and occupancy.filtered < below
+
+    def _decision(self):
+        # The classifier's verdict on the current occupant, None while it
+        # is still undecided or the weight reading is stale
+        weight = self._weight()
+        return self.occupancy.decision if weight is not None else None
+
+    async def _next_tick_or_occupancy(self):
+        # Returns 0 (no tick passed) when woken early by an occupancy event
+        step = await self.clock.next_tick_or(self._occupancy_changed)
+        if step == 0:
+            self._occupancy_changed.clear()
+        return step
+
+    async def _wait_occupancy(self, seconds):
+        target = self.clock.ticks + max(1, round(seconds / self.clock.period))
+        while self.clock.ticks < target:
+            if await self._next_tick_or_occupancy() == 0:
+                return
+
+    async def _empty_gate(self, gate):
+        # Clothes mode: the chamber must be empty before the door locks
+        if not self._chamber_empty(gate["below"]):
+            self.io.status("Weight detected. Please remove any objects and close the door.")
+            await self._set("door", "unlocked")
+            await self._wait_occupancy(gate["poll"])
+            self.io.status("Waiting for chamber to be empty...")
+            while not self._chamber_empty(gate["below"]):
+                self.io.status("Weight detected. Please remove any objects and close the door.")
+                await self._wait_occupancy(gate["poll"])
+        self.io.status("Chamber empty. Locking door and starting cycle.")
+        await self._set("door", "locked")
+        await self.clock.sleep(gate["poll"])
+
+    async def _entry_gate(self, phase, entry, elapsed):
+        # Person mode: after the door opens, wait for an adult to step in.
+        # Returns ("abort" | "ok", status message or None)
+        gate = phase.gate
+        if elapsed < gate["opens_at"]:
+            return "ok", f"Door unlocks in {gate['opens_at'] - elapsed}s"
+        if elapsed >= gate["opens_at"] and not entry["announced"]:
+            entry["announced"] = True
+            self.io.status("Unlocking door. Please enter chamber.")
+        if entry["entered"]:
+            return "ok", None
+
+        decision = self._decision()
+        if decision is not None and decision.adult:
+            entry["entered"] = True
+            return "ok", f"Entry detected. Continuing preheat: {phase.length - elapsed}s left."
+        if decision is not None:
+            await self._set("heater", False)
+            self.io.status(f"Warning: not an adult ({decision.mass:.1f} kg). Heater OFF.")
+            await self.clock.sleep(gate["reject_hold"])
+            return "abort", None
+
+        if elapsed - gate["opens_at"] + 1 < gate["pause_after"]:
+            return "ok", "Waiting for entry. Please enter the chamber."
+
+        # Nobody came in: pause the preheat with the heater off until they do
+        await self._set("heater", False)
+        self.io.status("Heater paused. Please enter chamber.")
+        while True:
+            decision = self._decision()
+            if decision is not None and decision.adult:
+                break
+            await self._next_tick_or_occupancy()
+        entry["entered"] = True
+        await self._set("heater", True)
+        return "ok", None
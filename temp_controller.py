@@ -0,0 +1,115 @@
+# Closed-loop heater control.
+#
+# The sessions' main heat phase used to be a fixed duty cycle (heater ON y
+# seconds, OFF w seconds) with a 150 °C cutoff checked every 5 s, so the
+# element temperature depended on the load and the room and overshot
+# freely. The controllers here hold a setpoint instead. Both answer
+# heater_on(temperature, now) -> bool and are meant to be called at the
+# thermocouple's rate (every 0.25 s, MAX6675 conversion time):
+#
+#   HysteresisController  ON below setpoint - below, OFF above
+#                         setpoint + above, unchanged in between
+#   PIDController         PID on the measurement giving a 0..1 duty, turned
+#                         into SSR on/off by time proportioning over
+#                         cycle_time seconds
+#
+# A missing reading (None) always means heater OFF.
+
+import math
+
+CONTROL_PERIOD = 0.25  # Seconds between controller updates
+
+
+class HysteresisController:
+    """Thermostat with a tunable band around the setpoint."""
+
+    def __init__(self, setpoint, below=3.0, above=1.0):
+        self.setpoint = setpoint
+        self.below = below
+        self.above = above
+        self.on = False
+
+    def reset(self):
+        self.on = False
+
+    def heater_on(self, temperature, now):
+        if temperature is None:
+            self.on = False
+        elif temperature < self.setpoint - self.below:
+            self.on = True
+        elif temperature > self.setpoint + self.above:
+            self.on = False
+        return self.on
+
+
+class PIDController:
+    """PID with anti-windup, driving an SSR by time proportioning.
+
+    The derivative acts on the measurement (no kick when the setpoint
+    changes) through a first-order filter with time constant d_filter. The
+    integral only moves while the output is not saturated in the direction
+    it would push (conditional integration), so a long heat-up at full
+    power does not wind it up and overshoot the setpoint afterwards.
+
+    update() returns the duty 0..1; heater_on() turns it into ON for the
+    first duty * cycle_time seconds of every cycle_time window.
+    """
+
+    def __init__(self, setpoint, kp=0.08, ki=0.004, kd=0.0, d_filter=2.0, cycle_time=4.0):
+        self.setpoint = setpoint
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.d_filter = d_filter
+        self.cycle_time = cycle_time
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.duty = 0.0
+        self._last_temperature = None
+        self._last_time = None
+        self._window_start = None
+
+    def update(self, temperature, now):
+        if temperature is None:
+            # Keep the integral, but the derivative restarts with the readings
+            self._last_temperature = None
+            self.duty = 0.0
+            return self.duty
+        dt = 0.0 if self._last_time is None else max(0.0, now - self._last_time)
+        self._last_time = now
+
+        error = self.setpoint - temperature
+        if self._last_temperature is not None and dt > 0:
+            slope = (temperature - self._last_temperature) / dt
+            alpha = 1.0 - math.exp(-dt / self.d_filter) if self.d_filter > 0 else 1.0
+            self.derivative += alpha * (slope - self.derivative)
+        self._last_temperature = temperature
+
+        unclamped = self.kp * error + self.ki * self.integral - self.kd * self.derivative
+        saturated_high = unclamped >= 1.0 and error > 0
+        saturated_low = unclamped <= 0.0 and error < 0
+        if dt > 0 and not (saturated_high or saturated_low):
+            self.integral += error * dt
+            unclamped = self.kp * error + self.ki * self.integral - self.kd * self.derivative
+        self.duty = min(1.0, max(0.0, unclamped))
+        return self.duty
+
+    def heater_on(self, temperature, now):
+        duty = self.update(temperature, now)
+        if self._window_start is None or now - self._window_start >= self.cycle_time:
+            self._window_start = now
+        return now - self._window_start < duty * self.cycle_time
+
+
+def make_controller(spec, setpoint):
+    """Controller for a profile's "control" spec: {"type": "pid" or
+    "hysteresis", plus that class's tuning keywords}."""
+    options = {key: value for key, value in spec.items() if key != "type"}
+    if spec["type"] == "pid":
+        return PIDController(setpoint, **options)
+    if spec["type"] == "hysteresis":
+        return HysteresisController(setpoint, **options)
+    raise ValueError(f"Unknown heater control: {spec['type']}")
@@ -0,0 +1,195 @@
+# Temperature sources with automatic failover.
+#
+# The thermocouple can be read two ways: straight from a MAX6675 on the Pi's
+# SPI bus through pigpio (a read takes well under a millisecond), or from
+# the ESP32 over the serial link (SensorService). TemperatureSource puts
+# both behind the LatestValue read API (fresh/get/value/age) and always
+# answers from the best healthy one, so the session runner and the GUI do
+# not care which wire the reading came over.
+
+import threading
+import time
+from collections import deque
+
+from latency_stats import LatencyHistogram
+from sensor_service import LINK_CONNECTED, LatestValue
+
+MAX6675_CONVERSION = 0.25  # Reading sooner aborts the conversion in progress
+MAX6675_OPEN_BIT = 0x0004  # D2: thermocouple input open
+MAX6675_ERROR_MASK = 0x8006  # Dummy sign bit, open bit, device id bit
+
+
+def decode_max6675(word):
+    """16-bit MAX6675 word -> degC, or None on an open thermocouple or a
+    word that cannot be valid (the fixed bits are wrong)."""
+    if word & MAX6675_ERROR_MASK:
+        return None
+    return (word >> 3) * 0.25
+
+
+class SpiTemperature(threading.Thread):
+    """Samples a MAX6675 on pigpio SPI into a LatestValue.
+
+    Reads once per conversion period. healthy() needs a recent reading,
+    no open-thermocouple fault, fewer than max_errors failures in a row and
+    90% of the last 32 reads done within max_latency. `latency` keeps the
+    full read time histogram for reporting.
+    """
+
+    label = "SPI"
+
+    def __init__(self, pi, channel=0, spi_baud=1000000, max_age=1.0, max_latency=0.005, max_errors=3):
+        super().__init__(name="max6675-spi", daemon=True)
+        self.pi = pi
+        self.channel = channel
+        self.spi_baud = spi_baud
+        self.max_age = max_age
+        self.max_latency = max_latency
+        self.max_errors = max_errors
+        self.temperature = LatestValue("temperature")
+        self.latency = LatencyHistogram()
+        self._recent = deque(maxlen=32)
+        self.fault = False
+        self.errors = 0
+        self.consecutive_errors = 0
+        self._handle = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            self._handle = self.pi.spi_open(self.channel, self.spi_baud, 0)
+        except Exception as e:
+            print(f"[Temp] Could not open SPI channel {self.channel}: {e}")
+            return
+        try:
+            while not self._stop_event.wait(MAX6675_CONVERSION):
+                self.sample()
+        finally:
+            try:
+                self.pi.spi_close(self._handle)
+            except Exception as e:
+                print(f"[Temp] Error closing SPI: {e}")
+
+    def sample(self):
+        started = time.monotonic()
+        try:
+            count, data = self.pi.spi_read(self._handle, 2)
+        except Exception as e:
+            self._failed(f"SPI read failed: {e}")
+            return
+        finished = time.monotonic()
+        self.latency.record(finished - started)
+        self._recent.append(finished - started)
+        if count != 2:
+            self._failed(f"SPI read returned {count} bytes")
+            return
+        word = (data[0] << 8) | data[1]
+        self.fault = bool(word & MAX6675_OPEN_BIT)
+        celsius = decode_max6675(word)
+        if celsius is None:
+            self._failed("thermocouple open" if self.fault else f"bad MAX6675 word {word:#06x}")
+            return
+        self.consecutive_errors = 0
+        # The conversion finished no later than the read started
+        self.temperature.publish(celsius, started)
+
+    def _failed(self, reason):
+        self.errors += 1
+        self.consecutive_errors += 1
+        if self.consecutive_errors == 1:
+            print(f"[Temp] {reason}")
+
+    def healthy(self):
+        return (self.temperature.fresh(self.max_age) is not None
+                and not self.fault
+                and self.consecutive_errors < self.max_errors
+                and self._recent_latency() <= self.max_latency)
+
+    def _recent_latency(self):
+        recent = sorted(self._recent)
+        return recent[int(len(recent) * 0.9)] if recent else 0.0
+
+    def stop(self, timeout=1):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+class SerialTemperature:
+    """The ESP32's thermocouple reading, from a SensorService."""
+
+    label = "ESP32"
+
+    def __init__(self, sensors):
+        self.sensors = sensors
+        self.temperature = sensors.temperature
+
+    def healthy(self):
+        sensors = self.sensors
+        return (sensors.state == LINK_CONNECTED
+                and not sensors.temp_fault
+                and self.temperature.fresh(sensors.stale_after) is not None)
+
+
+class TemperatureSource:
+    """Reads from the first healthy source in preference order.
+
+    The active source changes as soon as it turns unhealthy; a preferred
+    source only takes over again after staying healthy for recover_after
+    seconds, so a flaky wire does not flip the reading back and forth.
+    Reads never block: each source samples in the background.
+    """
+
+    def __init__(self, sources, recover_after=5.0):
+        self.sources = list(sources)
+        self.recover_after = recover_after
+        self.active = None
+        self.switches = 0
+        self._healthy_since = {}
+        self._lock = threading.Lock()
+
+    def _select(self):
+        now = time.monotonic()
+        with self._lock:
+            for source in self.sources:
+                if source.healthy():
+                    self._healthy_since.setdefault(source, now)
+                else:
+                    self._healthy_since.pop(source, None)
+
+            best = None
+            for source in self.sources:
+                since = self._healthy_since.get(source)
+                if since is None:
+                    continue
+                if source is self.active or self.active is None or now - since >= self.recover_after:
+                    best = source
+                    break
+                if self.active not in self._healthy_since:
+                    # The active source failed: take this one straight away
+                    best = source
+                    break
+            if best is not None and best is not self.active:
+                old = self.active.label if self.active is not None else "none"
+                print(f"[Temp] Temperature source {old} -> {best.label}")
+                self.active = best
+                self.switches += 1
+            # With nothing healthy, keep answering from the last active
+            # source; its readings go stale and fresh() returns None
+            return self.active
+
+    def fresh(self, max_age):
+        source = self._select()
+        return None if source is None else source.temperature.fresh(max_age)
+
+    def get(self):
+        source = self._select()
+        return None if source is None else source.temperature.get()
+
+    def value(self, default=None):
+        source = self._select()
+        return default if source is None else source.temperature.value(default)
+
+    def age(self):
+        source = self._select()
+        return None if source is None else source.temperature.age()
@@ -0,0 +1,112 @@
+# Drift-free tick scheduler for session timing.
+#
+# Sleeping a fixed second after doing a tick's work makes every tick last
+# 1 s plus the work, so long sessions run late and heater edges drift with
+# serial latency. TickScheduler instead wakes at absolute deadlines on a
+# grid (origin + n * period) measured with the event loop's monotonic clock,
+# so time spent working is absorbed instead of accumulated.
+
+import asyncio
+import math
+
+
+class JitterStats:
+    """Running statistics of how late each tick fired, in seconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, lateness):
+        self.count += 1
+        self.total += lateness
+        self.last = lateness
+        if lateness > self.max:
+            self.max = lateness
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        return f"{self.count} wakeups, mean {self.mean * 1000:.2f} ms, max {self.max * 1000:.2f} ms late"
+
+
+class TickScheduler:
+    """Wakes a coroutine on a fixed grid of absolute deadlines.
+
+    next_tick() returns how many ticks have passed since the previous call:
+    normally 1, more if the caller overran a whole period (the missed ticks
+    are skipped, not replayed in a burst). sleep() waits a number of seconds
+    on the same grid, so holds and gates do not shift later ticks either.
+    A wakeup later than `tolerance` counts as a deadline miss.
+    """
+
+    def __init__(self, period=1.0, tolerance=0.005):
+        self.period = period
+        self.tolerance = tolerance
+        self.ticks = 0
+        self.skipped = 0
+        self.misses = 0
+        self.jitter = JitterStats()
+        self._origin = None
+        self._loop = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._origin = self._loop.time()
+        self.ticks = 0
+
+    @property
+    def elapsed(self):
+        # Scheduled (not measured) time since start, in seconds
+        return self.ticks * self.period
+
+    def deadline(self, ticks):
+        return self._origin + ticks * self.period
+
+    async def next_tick(self):
+        return await self._wait_until(self.ticks + 1)
+
+    async def next_tick_or(self, event):
+        """Like next_tick(), but returns 0 as soon as the asyncio.Event is
+        set (the caller clears it). The grid is unaffected either way."""
+        if self._origin is None:
+            self.start()
+        delay = self.deadline(self.ticks + 1) - self._loop.time()
+        if event.is_set():
+            return 0
+        if delay > 0:
+            try:
+                await asyncio.wait_for(event.wait(), delay)
+                return 0
+            except asyncio.TimeoutError:
+                pass
+        return await self._wait_until(self.ticks + 1)
+
+    async def sleep(self, seconds):
+        return await self._wait_until(self.ticks + max(1, math.ceil(seconds / self.period)))
+
+    async def _wait_until(self, target):
+        if self._origin is None:
+            self.start()
+        delay = self.deadline(target) - self._loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            # Already late; still give other tasks (and cancellation) a turn
+            await asyncio.sleep(0)
+        lateness = self._loop.time() - self.deadline(target)
+        self.jitter.add(max(0.0, lateness))
+        if lateness > self.tolerance:
+            self.misses += 1
+        if lateness >= self.period:
+            # Overran whole periods: jump to the current slot on the grid
+            missed = int(lateness // self.period)
+            self.skipped += missed
+            target += missed
+        advanced = target - self.ticks
+        self.ticks = target
+        return advanced
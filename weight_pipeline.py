@@ -0,0 +1,254 @@
+# Streaming weight filter and occupancy detector.
+#
+# Raw load-cell readings jump when someone shifts on the seat, so comparing
+# single samples against fixed limits gives false entries and false
+# "not an adult" aborts. WeightPipeline takes every sample as it arrives:
+#
+#   median of the last few samples   drops single-sample spikes
+#   EMA with time constant ema_tau   smooths what is left (dt-aware, so it
+#                                    works at any sample rate)
+#   occupancy with hysteresis        occupied above occupied_above, empty
+#                                    below empty_below, each side held for
+#                                    `debounce` seconds before it counts
+#   settled                          the standard deviation over the last
+#                                    settle_time seconds is <= settle_std
+#
+# and emits OccupancyEvents (entered, left, settled with the mass) to its
+# listeners on the feeding thread. attach() feeds it from a LatestValue at
+# the sensor's full rate.
+#
+# With a SequentialClassifier set (classify()), every sample while occupied
+# also goes into a sequential probability ratio test of "mass above the
+# threshold", which decides adult / not adult as soon as the evidence is
+# strong enough instead of waiting for the weight to settle, and emits a
+# "classified" event with the Decision.
+
+import math
+from collections import deque, namedtuple
+
+ENTERED = "entered"
+LEFT = "left"
+SETTLED = "settled"
+CLASSIFIED = "classified"
+
+# kind is ENTERED / LEFT / SETTLED / CLASSIFIED, mass the filtered (or
+# settled, or classified) kg
+OccupancyEvent = namedtuple("OccupancyEvent", ["kind", "mass", "timestamp"])
+
+# adult is True / False; confidence the posterior probability of that
+# answer; latency seconds from entry to decision
+Decision = namedtuple("Decision", ["adult", "mass", "confidence", "latency", "samples"])
+
+
+class SequentialClassifier:
+    """Wald's SPRT on whether the occupant's mass is above `threshold`.
+
+    The two hypotheses are mass = threshold + margin and threshold - margin
+    with Gaussian noise. Over the recent samples (the last `window`
+    seconds, but never fewer than min_samples) the log-likelihood ratio is
+
+        S = 2 * margin * n * (mean - threshold) / sigma**2
+
+    with sigma the larger of the sample spread and the `sigma` floor, so a
+    person still moving (large spread) takes longer to classify. "Adult"
+    is decided when S reaches log((1 - false_reject) / false_accept),
+    "not adult" when it drops to log(false_reject / (1 - false_accept)) and
+    the samples also cover reject_after seconds: someone standing on one
+    foot while stepping in must not be turned away.
+    """
+
+    def __init__(self, threshold, margin=5.0, sigma=2.0, false_accept=0.01, false_reject=0.001,
+                 window=1.0, min_samples=3, reject_after=0.8):
+        self.threshold = threshold
+        self.margin = margin
+        self.sigma = sigma
+        self.window = window
+        self.min_samples = min_samples
+        self.reject_after = reject_after
+        self.accept_at = math.log((1 - false_reject) / false_accept)
+        self.reject_at = math.log(false_reject / (1 - false_accept))
+        self.reset()
+
+    def reset(self, since=None):
+        self.since = since
+        self.count = 0
+        self._samples = deque()
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+    def add(self, value, timestamp):
+        """Add one sample; returns a Decision once there is one, else None."""
+        if self.since is None:
+            self.since = timestamp
+        samples = self._samples
+        samples.append((timestamp, value))
+        self._sum += value
+        self._sum_sq += value * value
+        self.count += 1
+        while len(samples) > self.min_samples and timestamp - samples[0][0] > self.window:
+            _, old = samples.popleft()
+            self._sum -= old
+            self._sum_sq -= old * old
+        n = len(samples)
+        if n < self.min_samples:
+            return None
+
+        mean = self._sum / n
+        spread = math.sqrt(max(0.0, self._sum_sq / n - mean * mean))
+        sigma = max(self.sigma, spread)
+        llr = 2.0 * self.margin * n * (mean - self.threshold) / (sigma * sigma)
+        if llr >= self.accept_at:
+            adult = True
+        elif llr <= self.reject_at and timestamp - samples[0][0] >= self.reject_after:
+            adult = False
+        else:
+            return None
+        # Posterior of the chosen answer with even prior odds
+        confidence = 1.0 / (1.0 + math.exp(-min(abs(llr), 700.0)))
+        return Decision(adult, mean, confidence, timestamp - self.since, self.count)
+
+
+class WeightPipeline:
+    """Median -> EMA -> hysteresis/settle detection over a weight stream.
+
+    State (`occupied`, `settled`, `mass`, `filtered`) can be read from any
+    thread; it only changes inside feed(). occupied is None until the first
+    sample. A gap longer than settle_time between samples drops the settle
+    window, since the weight may have changed unseen.
+    """
+
+    def __init__(self, median_window=3, ema_tau=0.5, occupied_above=10.0, empty_below=5.0,
+                 debounce=0.5, settle_time=1.5, settle_std=1.0):
+        self.median_window = median_window
+        self.ema_tau = ema_tau
+        self.occupied_above = occupied_above
+        self.empty_below = empty_below
+        self.debounce = debounce
+        self.settle_time = settle_time
+        self.settle_std = settle_std
+        self.listeners = []
+        self.classifier = None
+        self.reset()
+
+    def classify(self, threshold, **options):
+        """Start classifying occupants against threshold kg (see
+        SequentialClassifier for options); clears any earlier decision."""
+        classifier = SequentialClassifier(threshold, **options)
+        self.decision = None
+        self.classifier = classifier
+
+    def reset(self):
+        self.decision = None
+        self.filtered = None
+        self.occupied = None
+        self.settled = False
+        self.mass = None
+        self.last_timestamp = None
+        self._raw = deque(maxlen=self.median_window)
+        self._window = deque()  # (timestamp, median value)
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._pending_since = None
+
+    def attach(self, latest_value):
+        """Feed every reading published to a sensor_service.LatestValue."""
+        latest_value.subscribe(self.feed_reading)
+
+    def feed_reading(self, reading):
+        self.feed(reading.value, reading.timestamp)
+
+    def feed(self, value, timestamp):
+        """Add one sample; returns the events it caused (also sent to listeners)."""
+        if value is None:
+            return []
+        if self.last_timestamp is not None and timestamp - self.last_timestamp > self.settle_time:
+            self._clear_window()
+        dt = 0.0 if self.last_timestamp is None else max(0.0, timestamp - self.last_timestamp)
+        self.last_timestamp = timestamp
+
+        self._raw.append(value)
+        median = sorted(self._raw)[len(self._raw) // 2]
+        if self.filtered is None:
+            self.filtered = median
+        else:
+            alpha = 1.0 - math.exp(-dt / self.ema_tau) if self.ema_tau > 0 else 1.0
+            self.filtered += alpha * (median - self.filtered)
+
+        events = []
+        self._update_occupancy(timestamp, events)
+        self._update_settled(timestamp, median, events)
+        self._update_decision(timestamp, median, events)
+        for event in events:
+            if event.kind == CLASSIFIED:
+                decision = self.decision
+                print(f"[Weight] {'adult' if decision.adult else 'not adult'} {decision.mass:.1f} kg "
+                      f"({decision.confidence:.1%} confidence, {decision.latency:.2f} s after entry, "
+                      f"{decision.samples} samples)")
+            else:
+                print(f"[Weight] {event.kind} {event.mass:.1f} kg")
+            for listener in list(self.listeners):
+                listener(event)
+        return events
+
+    def _update_occupancy(self, timestamp, events):
+        if self.occupied is None:
+            # First sample: no history to debounce against
+            self.occupied = self.filtered >= self.occupied_above
+            if self.occupied:
+                events.append(OccupancyEvent(ENTERED, self.filtered, timestamp))
+            return
+        if self.occupied:
+            crossing = self.filtered < self.empty_below
+        else:
+            crossing = self.filtered > self.occupied_above
+        if not crossing:
+            self._pending_since = None
+            return
+        if self._pending_since is None:
+            self._pending_since = timestamp
+        if timestamp - self._pending_since >= self.debounce:
+            self._pending_since = None
+            self.occupied = not self.occupied
+            events.append(OccupancyEvent(ENTERED if self.occupied else LEFT, self.filtered, timestamp))
+
+    def _update_decision(self, timestamp, value, events):
+        classifier = self.classifier
+        if classifier is None:
+            return
+        for event in events:
+            if event.kind in (ENTERED, LEFT):
+                # A new occupant (or none): start over
+                self.decision = None
+                classifier.reset(event.timestamp)
+        if not self.occupied or self.decision is not None:
+            return
+        decision = classifier.add(value, timestamp)
+        if decision is not None:
+            self.decision = decision
+            events.append(OccupancyEvent(CLASSIFIED, decision.mass, timestamp))
+
+    def _update_settled(self, timestamp, value, events):
+        window = self._window
+        window.append((timestamp, value))
+        self._sum += value
+        self._sum_sq += value * value
+        while len(window) > 1 and timestamp - window[1][0] >= self.settle_time:
+            _, old = window.popleft()
+            self._sum -= old
+            self._sum_sq -= old * old
+        n = len(window)
+        mean = self._sum / n
+        spread = math.sqrt(max(0.0, self._sum_sq / n - mean * mean))
+        # Needs settle_time of history, not just a quiet pair of samples
+        settled = n >= 2 and timestamp - window[0][0] >= self.settle_time and spread <= self.settle_std
+        if settled and not self.settled:
+            events.append(OccupancyEvent(SETTLED, mean, timestamp))
+        self.mass = mean if settled else None
+        self.settled = settled
+
+    def _clear_window(self):
+        self._window.clear()
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self.settled = False
+        self.mass = None